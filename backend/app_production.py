@@ -1,13 +1,43 @@
-from flask import Flask, jsonify, request
+import concurrency
+# Must come before any other import so sockets and threads are cooperative
+concurrency.monkey_patch()
+
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import requests
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import json
 import logging
 import os
-from helpers import summarize_collection
-import feedparser
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tempfile
+import time
+from helpers import rollup_summaries, simplify_summary_geometry, summarize_offloaded, summarize_parallel
+from simplify import reduction_from_args, simplify_polygon
+from feature_query import CursorError, FeatureQuery
+from summary_cache import SummaryCache, summary_day
+from response_cache import EncodedPayload, ResponseCache
+from lru_cache import ByteLRUCache
+from news_cache import NewsCache
+from vector_tiles import MAX_TILE_ZOOM, encode_tile
+import http_client
+from http_client import Deadline
+from satellite_search import MAX_SEARCH_RESULTS, InvalidSearch, build_search_params, iter_search_pages
+from search_cache import SearchCache, SearchQuery
+from copernicus_auth import COPERNICUS_AUTH_URL, CopernicusTokenManager
+from stac_ingest import DEMO_ITEM_URLS, StacIngestPipeline
+from snapshot import DemoDataRefresher, SnapshotFollower, attach_snapshot, load_snapshot
+from clustering import ClusterIndex
+from concurrency import SEARCH_CONCURRENCY, run_blocking
+import metrics
+import profiling
+import upstreams
+from feature_store import build_stores, stores_fingerprint, stores_json
+from rss_parser import CHUNK_SIZE as RSS_CHUNK_SIZE, clean_summary, parse_items
+import workers
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)  # Use INFO for production
@@ -16,6 +46,17 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 app = Flask(__name__)
+# Per-route request counts, latency and response sizes for /metrics
+metrics.instrument_app(app)
+# Sampling profiles of single requests, on demand and of slow requests
+profiler = profiling.Profiler(
+    token=os.getenv('PROFILE_TOKEN'),
+    slow_seconds=float(os.getenv('PROFILE_SLOW_SECONDS', 0)),
+    interval=float(os.getenv('PROFILE_INTERVAL', 0.005)),
+    directory=os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'globe-profiles')),
+    ring_size=int(os.getenv('PROFILE_RING_SIZE', 50))
+)
+profiling.instrument_app(app, profiler)
 
 # Production CORS configuration
 allowed_origins = [
@@ -48,43 +89,163 @@ for domain in additional_domains:
 
 CORS(app, origins=allowed_origins, supports_credentials=True)
 
+# Workers of a multi-process deployment relay emits to each other through
+# the message queue (e.g. redis://host:6379/0). Long-polling needs sticky
+# sessions, which a shared socket cannot give, so they accept WebSocket only.
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE') or None
+MULTI_WORKER = workers.WEB_CONCURRENCY > 1 and concurrency.ASYNC_MODE == 'eventlet'
+socketio_transports = ['websocket'] if MULTI_WORKER else ['polling', 'websocket']
+
 # Production SocketIO configuration
 socketio = SocketIO(app, 
+    async_mode=concurrency.ASYNC_MODE,
+    message_queue=SOCKETIO_MESSAGE_QUEUE,
+    transports=socketio_transports,
     cors_allowed_origins=allowed_origins,
     logger=True,
     engineio_logger=True
 )
 
-COPERNICUS_AUTH_URL = "https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token"
+# Shared CDSE token cache; a burst of searches triggers at most one auth call
+copernicus_tokens = CopernicusTokenManager(COPERNICUS_AUTH_URL)
+
+# Recent search results, so repeated and narrower searches skip upstream
+search_cache = SearchCache(
+    ttl=int(os.getenv('SEARCH_CACHE_TTL', 600)),
+    max_bytes=int(os.getenv('SEARCH_CACHE_BYTES', 32 * 1024 * 1024))
+)
+
+# Total time budget for one paginated Copernicus search
+SEARCH_DEADLINE_SECONDS = float(os.getenv('SEARCH_DEADLINE_SECONDS', 30))
+# Caps the searches paginating upstream at once; with green threads nothing
+# else would stop a burst of clients from opening unbounded connections
+search_slots = threading.BoundedSemaphore(SEARCH_CONCURRENCY)
 
-# Global variable to store fetched demo data
+# Global variable to store fetched demo data, as {collection: CollectionStore}
 cached_demo_data = None
 
+# Summaries computed from cached_demo_data, invalidated whenever it is reloaded
+summary_cache = SummaryCache(max_entries=int(os.getenv('SUMMARY_CACHE_SIZE', 32)))
+
+# Parsed Google News results per (query, limit); identical concurrent
+# requests share one upstream fetch and stale results are served while
+# a refresh runs in the background
+news_cache = NewsCache(
+    ttl=int(os.getenv('NEWS_CACHE_TTL', 300)),
+    max_entries=int(os.getenv('NEWS_CACHE_SIZE', 128)),
+    stale_ttl=int(os.getenv('NEWS_STALE_TTL', 3600))
+)
+
+# Bounded pool that computes the summaries of a /summary?collections= batch
+summary_executor = ThreadPoolExecutor(max_workers=int(os.getenv('SUMMARY_BATCH_WORKERS', 4)))
+
+# Encoded (and pre-compressed) JSON responses derived from cached_demo_data
+response_cache = ResponseCache(max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', 256)))
+
+# Encoded vector tiles, bounded by their total size
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+tile_cache = ByteLRUCache(int(os.getenv('TILE_CACHE_BYTES', 64 * 1024 * 1024)), sizeof=EncodedPayload.nbytes)
+
+# Hit ratios and sizes of the caches above, read whenever /metrics is scraped
+metrics.cache_gauges({
+    'summary': summary_cache,
+    'response': response_cache,
+    'tile': tile_cache,
+    'news': news_cache,
+    'search': search_cache,
+})
+
+def set_cached_demo_data(data):
+    global cached_demo_data
+    # Index the footprints before the data becomes visible to requests
+    for store in data.values():
+        store.build_index()
+    cached_demo_data = data
+    summary_cache.clear()
+    cluster_indexes.clear()
+    response_cache.clear()
+    tile_cache.clear()
+
+# Point clusters for zoomed /locations requests, built lazily per collection
+cluster_indexes = {}
+
+# Serializes cold-start ingests so concurrent first requests share one fetch
+demo_data_lock = threading.Lock()
+last_ingest = None
+
+def new_demo_pipeline():
+    global last_ingest
+    # Collections are fetched concurrently and paginated; an ingest
+    # takes about as long as the slowest collection
+    last_ingest = StacIngestPipeline(
+        DEMO_ITEM_URLS,
+        max_in_flight=int(os.getenv('INGEST_MAX_IN_FLIGHT', 4)),
+        page_timeout=10,
+        url_timeout=int(os.getenv('INGEST_URL_TIMEOUT', 60))
+    )
+    return last_ingest
+
+def reload_demo_data():
+    # Holding the lock makes cold-start requests wait for this ingest
+    # instead of starting their own; a partial ingest raises and the
+    # current data stays in place
+    with demo_data_lock:
+        grouped_data = new_demo_pipeline().run(strict=True)
+        set_cached_demo_data(grouped_data)
+    return grouped_data
+
+# The demo data is snapshotted to disk so restarts serve it immediately,
+# and re-fetched in the background once it is older than DEMO_DATA_TTL
+SNAPSHOT_PATH = os.getenv('DEMO_SNAPSHOT_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo_data.snapshot'))
+demo_data_refresher = DemoDataRefresher(
+    reload_demo_data,
+    snapshot_path=SNAPSHOT_PATH,
+    ttl=int(os.getenv('DEMO_DATA_TTL', 3600))
+)
+
+# Workers map the snapshot their supervisor keeps fresh instead of
+# fetching and holding their own copy of the data
+snapshot_follower = SnapshotFollower(
+    SNAPSHOT_PATH,
+    set_cached_demo_data,
+    interval=int(os.getenv('SNAPSHOT_POLL_INTERVAL', 5))
+)
+
+def bootstrap_demo_data():
+    """Install the on-disk snapshot, if there is one, and keep it fresh in the background"""
+    if workers.is_worker():
+        snapshot_follower.start()
+        return snapshot_follower.attach() is not None
+    stores, created_at = load_snapshot(SNAPSHOT_PATH)
+    if not stores:
+        return False
+    set_cached_demo_data(stores)
+    demo_data_refresher.start(data_age=time.time() - created_at)
+    return True
+
+def demo_data_response(stores, query=None):
+    if query is not None and not query.is_default():
+        # Selections, projections, simplified variants and pages are each
+        # encoded once; a page only touches the features it returns
+        try:
+            return response_cache.respond(
+                ('fetch_demo_data', stores_fingerprint(stores)) + query.cache_key(),
+                # Projections and simplification decode and re-encode every
+                # feature, which is CPU-bound; keep it off the event loop
+                lambda: run_blocking(query.payload, stores)
+            )
+        except CursorError as e:
+            return jsonify({"error": str(e)}), 400
+    # Workers serve the payload pre-encoded in the snapshot they share
+    payload = snapshot_follower.payload_for(stores)
+    if payload is not None:
+        return payload.response()
+    # The stores keep every feature pre-encoded, so the payload is assembled
+    # from the stored bytes once and then served from the response cache
+    return response_cache.respond(('fetch_demo_data', stores_fingerprint(stores)), lambda: stores_json(stores))
+
 def get_copernicus_token():
-    username = os.getenv("COPERNICUS_USERNAME")
-    password = os.getenv("COPERNICUS_PASSWORD")
-    
-    if not username or not password:
-        logger.error("Copernicus credentials not found in environment variables")
-        return None
-    
-    auth_data = {
-        "username": username,
-        "password": password,
-        "grant_type": "password",
-        "client_id": "cdse-public"
-    }
-    
-    try:
-        response = requests.post(COPERNICUS_AUTH_URL, data=auth_data, timeout=30)
-        if response.status_code == 200:
-            return response.json()["access_token"]
-        else:
-            logger.error(f"Authentication failed: {response.status_code} - {response.text}")
-            return None
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Request error during authentication: {e}")
-        return None
+    return copernicus_tokens.get_token()
 
 # Health check endpoint for deployment platforms
 @app.route('/health', methods=['GET'])
@@ -92,9 +253,9 @@ def health_check():
     return jsonify({"status": "healthy", "timestamp": datetime.now().isoformat()}), 200
 
 def fetch_collections():
-    url = "https://maps.terramonitor.com/demouser/stac/collections"
+    url = upstreams.COLLECTIONS_URL
     try:
-        response = requests.get(url)
+        response = http_client.get(url)
         response.raise_for_status()  # Raise an error for bad responses
         collections = response.json()  # Parse the JSON response
         return jsonify(collections), 200
@@ -102,98 +263,154 @@ def fetch_collections():
         logger.error(f"Error fetching collections: {e}")
         return jsonify({"error": "Failed to fetch collections"}), 500
 
+# Socket.IO session ids of connected clients, so long searches can stop
+# paginating once the requester is gone
+connected_clients = set()
+metrics.GaugeCollector(lambda: [
+    ('socketio_connected_clients', 'Connected Socket.IO clients', [({}, len(connected_clients))])
+])
+
 @socketio.on('connect')
 def handle_connect():
+    connected_clients.add(request.sid)
     logger.debug('Client connected')
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    connected_clients.discard(request.sid)
     logger.debug('Client disconnected')
 
+def emit_search_error(message):
+    # Failed searches are reported to the client rather than raised, so
+    # they are counted here instead of by metrics.instrument_event
+    metrics.SOCKETIO_ERRORS.inc('search_satellite')
+    emit('search_error', {"error": message})
+
 @socketio.on('search_satellite')
+@metrics.instrument_event('search_satellite')
+@profiling.profile_event('search_satellite', profiler)
 def handle_satellite_search(data):
     logger.debug(f"Received search request with data: {data}")
-    
-    token = get_copernicus_token()
-    if not token:
-        emit('search_error', {"error": "Failed to authenticate with Copernicus"})
-        return
 
-    stac_url = "https://catalogue.dataspace.copernicus.eu/stac/search"
-    
-    search_params = {
-        "collections": ["SENTINEL-2"],
-        "datetime": f"{data['startDate']}T00:00:00Z/{data['endDate']}T23:59:59Z",
-        "bbox": [float(data['lng'])-0.1, float(data['lat'])-0.1, float(data['lng'])+0.1, float(data['lat'])+0.1],
-        "filter": {
-            "op": "<=",
-            "args": [
-                {"property": "cloudCover"},
-                data.get('cloudCover', 20)
-            ]
-        }
-    }
+    try:
+        search_params = build_search_params(data)
+    except InvalidSearch as e:
+        emit_search_error(str(e))
+        return
+    # In incremental mode every page is emitted as soon as it arrives,
+    # otherwise all pages are collected into a single search_results event
+    incremental = bool(data.get('incremental'))
+    sid = request.sid
+
+    cached = search_cache.lookup(search_params)
+    if cached is not None:
+        cached = cached[:MAX_SEARCH_RESULTS]
+        if incremental:
+            emit('search_results_page', {"sequence": 0, "features": cached})
+            emit('search_complete', {"pages": 1, "total_features": len(cached), "cached": True})
+        else:
+            emit('search_results', {"features": cached})
+        return
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    if not search_slots.acquire(timeout=SEARCH_DEADLINE_SECONDS):
+        emit_search_error("Too many searches in progress, try again shortly")
+        return
+    try:
+        token = get_copernicus_token()
+        if not token:
+            emit_search_error("Failed to authenticate with Copernicus")
+            return
+
+        # Upstream is asked for the normalized (slightly broader) search that
+        # gets cached; the client only receives the features of its own query
+        query = SearchQuery.from_params(search_params)
+        upstream_results = []
+        outcome = {}
     
-    all_results = []
-    next_url = stac_url
+        all_results = []
+        pages = 0
+        # Every page request draws down the same budget for this search
+        deadline = Deadline(SEARCH_DEADLINE_SECONDS)
     
-    try:
-        while next_url and len(all_results) < 30:
-            response = requests.post(next_url, json=search_params, headers=headers)
-            if response.status_code == 200:
-                result = response.json()
-                all_results.extend(result.get('features', []))
-                next_url = result.get('links', [{}])[0].get('href') if result.get('links') else None
-            else:
-                logger.error(f"Search request failed: {response.status_code}")
-                break
-    except Exception as e:
-        logger.error(f"Error during search: {e}")
-        emit('search_error', {"error": "Search failed"})
+        try:
+            for features in iter_search_pages(
+                token,
+                search_cache.normalize(search_params).to_params(),
+                deadline=deadline,
+                # The cap applies to the client's own results, not to the
+                # broader search, so caching never costs it any matches
+                select=query.filter,
+                should_continue=lambda: sid in connected_clients,
+                on_unauthorized=copernicus_tokens.invalidate,
+                on_finished=lambda complete: outcome.update(complete=complete)
+            ):
+                upstream_results.extend(features)
+                features = query.filter(features)
+                all_results.extend(features)
+                if incremental:
+                    emit('search_results_page', {"sequence": pages, "features": features})
+                pages += 1
+        except Exception as e:
+            logger.error(f"Error during search: {str(e)}")
+            emit_search_error("Search failed")
+            return
+    finally:
+        search_slots.release()
+
+    # Failed or abandoned searches are not cached
+    if 'complete' in outcome:
+        search_cache.store(search_params, upstream_results, outcome['complete'])
+
+    if sid not in connected_clients:
         return
-
-    emit('search_results', {"features": all_results})
+    if incremental:
+        emit('search_complete', {"pages": pages, "total_features": len(all_results)})
+    else:
+        emit('search_results', {"features": all_results})
 
 @app.route('/fetch_demo_data', methods=['GET'])
 def fetch_demo_data():
     global cached_demo_data
 
+    # ?collections=, ?fields=, ?limit=/?cursor= and ?zoom=/?tolerance=
+    # narrow the payload down to what the client renders
+    try:
+        query = FeatureQuery.from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     # If data is already cached, return it
     if cached_demo_data is not None:
         logger.debug("Returning cached demo data")
-        return jsonify(cached_demo_data), 200
-
-    demo_urls = [
-        'https://maps.terramonitor.com/demouser/stac/collections/demo_olenja/items',
-        'https://maps.terramonitor.com/demouser/stac/collections/demo_belaya/items',
-        'https://maps.terramonitor.com/demouser/stac/collections/demo_dyagilevo/items',
-        'https://maps.terramonitor.com/demouser/stac/collections/demo_ivanovo/items'
-    ]
-
-    grouped_data = {}
-
+        return demo_data_response(cached_demo_data, query)
+
+    with demo_data_lock:
+        # Another request may have completed the ingest while we were waiting
+        if cached_demo_data is not None:
+            return demo_data_response(cached_demo_data, query)
+        # A snapshot from a previous run is served right away and refreshed later
+        if bootstrap_demo_data():
+            return demo_data_response(cached_demo_data, query)
+        return load_demo_data(query)
+
+def load_demo_data(query=None):
     try:
-        for url in demo_urls:
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                demo_data = response.json()
-                for feature in demo_data.get('features', []):
-                    collection = feature.get('collection')
-                    if collection not in grouped_data:
-                        grouped_data[collection] = []
-                    grouped_data[collection].append(feature)
-            else:
-                logger.error(f"Failed to fetch data from {url}: {response.status_code}")
+        ingest = new_demo_pipeline()
+        grouped_data = ingest.run()
+        if grouped_data and not ingest.progress.snapshot()['failed_urls']:
+            demo_data_refresher.saved(grouped_data)
+            # A worker only got here because the supervisor has no snapshot
+            # yet; refreshing stays the supervisor's job
+            if not workers.is_worker():
+                demo_data_refresher.start(data_age=0)
+        elif not workers.is_worker():
+            # A partial ingest is served but not snapshotted, and retried soon
+            demo_data_refresher.start(retry=True)
 
         # If no external data was fetched, use fallback demo data
         if not grouped_data:
             logger.info("No external demo data available, using fallback data")
-            grouped_data = {
+            grouped_data = build_stores({
                 "demo_olenja": [
                     {
                         "type": "Feature",
@@ -224,11 +441,11 @@ def fetch_demo_data():
                         }
                     }
                 ]
-            }
+            })
 
         # Cache the grouped data
-        cached_demo_data = grouped_data
-        return jsonify(grouped_data), 200
+        set_cached_demo_data(grouped_data)
+        return demo_data_response(grouped_data, query)
     except Exception as e:
         logger.error(f"Error fetching demo data: {str(e)}")
         # Return fallback data on error
@@ -249,8 +466,38 @@ def fetch_demo_data():
                 }
             ]
         }
-        cached_demo_data = fallback_data
-        return jsonify(fallback_data), 200
+        set_cached_demo_data(build_stores(fallback_data))
+        if not workers.is_worker():
+            demo_data_refresher.start(retry=True)
+        return demo_data_response(cached_demo_data, query)
+
+@app.route('/summary', methods=['GET'])
+def get_collection_summaries():
+    """Get the summaries of several collections and a rollup across them"""
+    if cached_demo_data is None:
+        return jsonify({"error": "No data available"}), 404
+
+    requested = request.args.get('collections', '*')
+    if requested == '*':
+        names = sorted(cached_demo_data, key=str)
+    else:
+        names = list(dict.fromkeys(name.strip() for name in requested.split(',') if name.strip()))
+    if not names:
+        return jsonify({"error": "collections must be a comma separated list or *"}), 400
+
+    found = {name: cached_demo_data[name] for name in names if cached_demo_data.get(name)}
+    missing = [name for name in names if name not in found]
+
+    def build():
+        # Cached summaries are reused, the missing ones are computed side by side
+        summaries = summary_cache.get_or_compute_many(found, summarize_offloaded, summary_executor)
+        return {
+            'summaries': summaries,
+            'rollup': rollup_summaries(list(summaries.values())),
+            'missing_collections': missing
+        }
+
+    return response_cache.respond(('summaries', tuple(names), stores_fingerprint(found), summary_day()), build)
 
 @app.route('/summary/<collection_name>', methods=['GET'])
 def get_collection_summary(collection_name):
@@ -263,13 +510,75 @@ def get_collection_summary(collection_name):
     if not features:
         return jsonify({"error": f"No data found for collection: {collection_name}"}), 404
 
-    summary = summarize_collection(features)
-    return jsonify(summary), 200
+    try:
+        reduction = reduction_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if reduction is not None:
+        return response_cache.respond(
+            ('summary', collection_name, features.fingerprint, summary_day()) + reduction,
+            lambda: simplify_summary_geometry(
+                summary_cache.get_or_compute(collection_name, features, summarize_parallel), *reduction)
+        )
+    return response_cache.respond(
+        ('summary', collection_name, features.fingerprint, summary_day()),
+        lambda: summary_cache.get_or_compute(collection_name, features, summarize_parallel)
+    )
+
+@app.route('/ingest_status', methods=['GET'])
+def get_ingest_status():
+    """Get progress and timing of the latest demo data ingest"""
+    if last_ingest is None and demo_data_refresher.last_refresh is None and snapshot_follower.current is None:
+        return jsonify({"error": "No ingest has run yet"}), 404
+    status = last_ingest.progress.snapshot() if last_ingest is not None else {}
+    status['refresher'] = demo_data_refresher.stats()
+    if workers.is_worker():
+        status['worker'] = {'id': workers.worker_id(), 'pid': os.getpid(), 'snapshot': snapshot_follower.stats()}
+    return jsonify(status), 200
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics: requests, Socket.IO events, upstreams, summaries and caches"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """Profiles captured from slow requests, newest first"""
+    if not profiler.authorized(request.headers.get(profiling.TOKEN_HEADER)):
+        return jsonify({"error": "Profiling requires a valid X-Profile-Token"}), 403
+    return jsonify({'profiles': profiler.list_captured(), 'profiler': profiler.stats()}), 200
+
+@app.route('/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """One captured profile in folded-stack format"""
+    if not profiler.authorized(request.headers.get(profiling.TOKEN_HEADER)):
+        return jsonify({"error": "Profiling requires a valid X-Profile-Token"}), 403
+    if name not in profiler.list_captured():
+        return jsonify({"error": f"Profile {name} not found"}), 404
+    return send_from_directory(profiler.directory, name, mimetype='text/plain')
+
+@app.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    """Get hit/miss counters for the summary cache and Copernicus token"""
+    return jsonify({
+        'summary_cache': summary_cache.stats(),
+        'response_cache': response_cache.stats(),
+        'tile_cache': tile_cache.stats(),
+        'news_cache': news_cache.stats(),
+        'search_cache': search_cache.stats(),
+        'copernicus_token': copernicus_tokens.metrics()
+    }), 200
 
 @app.route('/collection/<collection_name>', methods=['GET'])
 def get_collection_metadata(collection_name):
     """Get collection metadata including spatial extent"""
     global cached_demo_data
+
+    try:
+        reduction = reduction_from_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
         # First try to get from cached demo data (fallback)
@@ -277,15 +586,9 @@ def get_collection_metadata(collection_name):
             features = cached_demo_data[collection_name]
             if features:
                 # Calculate bounding box from the first feature's geometry
-                first_feature = features[0]
-                if 'geometry' in first_feature and 'coordinates' in first_feature['geometry']:
-                    coords = first_feature['geometry']['coordinates'][0]  # First ring of polygon
-                    
-                    # Calculate bounding box
-                    lngs = [coord[0] for coord in coords]
-                    lats = [coord[1] for coord in coords]
-                    min_lng, max_lng = min(lngs), max(lngs)
-                    min_lat, max_lat = min(lats), max(lats)
+                bbox = features.bbox(0)  # First ring of polygon
+                if bbox:
+                    min_lng, min_lat, max_lng, max_lat = bbox
                     
                     # Create polygon coordinates from bbox
                     polygon_coordinates = [
@@ -298,17 +601,20 @@ def get_collection_metadata(collection_name):
                         ]
                     ]
                     
-                    return jsonify({
+                    if reduction is not None:
+                        polygon_coordinates = simplify_polygon(polygon_coordinates, *reduction)
+
+                    return response_cache.respond(('collection', collection_name, features.fingerprint) + (reduction or ()), lambda: {
                         'collection_name': collection_name,
                         'title': f'Demo Collection: {collection_name}',
                         'description': f'Demo collection for {collection_name}',
                         'bbox': [min_lng, min_lat, max_lng, max_lat],
                         'polygon_coordinates': polygon_coordinates
-                    }), 200
+                    })
         
         # Fetch from collections catalog
-        collections_url = "https://maps.terramonitor.com/demouser/stac/collections"
-        response = requests.get(collections_url)
+        collections_url = upstreams.COLLECTIONS_URL
+        response = http_client.get(collections_url)
         
         if response.status_code == 200:
             collections_data = response.json()
@@ -333,6 +639,8 @@ def get_collection_metadata(collection_name):
                                 [min_lng, min_lat]  # Close the polygon
                             ]
                         ]
+                        if reduction is not None:
+                            polygon_coordinates = simplify_polygon(polygon_coordinates, *reduction)
                         
                         return jsonify({
                             'collection_name': collection_name,
@@ -348,6 +656,64 @@ def get_collection_metadata(collection_name):
         logger.error(f"Error fetching collection metadata: {e}")
         return jsonify({"error": "Failed to fetch collection metadata"}), 500
 
+def location_entry(features, index, centroid):
+    return {
+        'coordinates': centroid,
+        'image_count': 1,  # Each feature represents one image
+        'properties': features.feature(index).get('properties', {})
+    }
+
+def locations_payload(features):
+    locations = []
+    
+    for index in range(len(features)):
+        # Calculate centroid of the first ring of polygon
+        centroid = features.centroid(index)
+        if centroid:
+            locations.append(location_entry(features, index, centroid))
+    
+    return {'locations': locations}
+
+def get_cluster_index(collection_name, features):
+    # Entries remember the store they were built from: a build that overlaps
+    # a data refresh must not be served for, or cached over, the new data
+    entry = cluster_indexes.get(collection_name)
+    if entry is None or entry[0] is not features:
+        # Building every zoom level is CPU-bound, keep it off the event loop
+        index = run_blocking(ClusterIndex, [features.centroid(i) for i in range(len(features))])
+        entry = (features, index)
+        if (cached_demo_data or {}).get(collection_name) is features:
+            cluster_indexes[collection_name] = entry
+    return entry[1]
+
+def clustered_locations_response(collection_name, features):
+    # Clusters are computed for the viewport only, so the response size
+    # depends on the bbox and zoom instead of the collection size
+    try:
+        zoom = int(request.args['zoom'])
+        bbox = request.args.get('bbox', '-180,-90,180,90')
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in bbox.split(','))
+    except ValueError:
+        return jsonify({"error": "zoom must be an integer and bbox min_lng,min_lat,max_lng,max_lat"}), 400
+
+    index = get_cluster_index(collection_name, features)
+    locations = []
+    for lng, lat, point_count, image_count, id in index.get_clusters(min_lng, min_lat, max_lng, max_lat, zoom):
+        if index.is_cluster(id):
+            # Same cluster shape as app.py; every location here is one image
+            locations.append({
+                'cluster': True,
+                'id': f"Cluster_{id}",
+                'coordinates': [lng, lat],
+                'point_count': point_count,
+                'image_count': int(image_count),
+                'expansion_zoom': index.expansion_zoom(id)
+            })
+        else:
+            locations.append(location_entry(features, id, features.centroid(id)))
+
+    return jsonify({'zoom': zoom, 'locations': locations}), 200
+
 @app.route('/locations/<collection_name>', methods=['GET'])
 def get_collection_locations(collection_name):
     """Get location points for a collection"""
@@ -356,23 +722,9 @@ def get_collection_locations(collection_name):
     try:
         if cached_demo_data and collection_name in cached_demo_data:
             features = cached_demo_data[collection_name]
-            locations = []
-            
-            for feature in features:
-                if 'geometry' in feature and 'coordinates' in feature['geometry']:
-                    coords = feature['geometry']['coordinates'][0]  # First ring of polygon
-                    
-                    # Calculate centroid
-                    centroid_lng = sum(coord[0] for coord in coords) / len(coords)
-                    centroid_lat = sum(coord[1] for coord in coords) / len(coords)
-                    
-                    locations.append({
-                        'coordinates': [centroid_lng, centroid_lat],
-                        'image_count': 1,  # Each feature represents one image
-                        'properties': feature.get('properties', {})
-                    })
-            
-            return jsonify({'locations': locations}), 200
+            if 'zoom' in request.args:
+                return clustered_locations_response(collection_name, features)
+            return response_cache.respond(('locations', collection_name, features.fingerprint), lambda: locations_payload(features))
         else:
             return jsonify({"error": f"No data found for collection: {collection_name}"}), 404
             
@@ -380,6 +732,76 @@ def get_collection_locations(collection_name):
         logger.error(f"Error fetching locations: {e}")
         return jsonify({"error": "Failed to fetch locations"}), 500
 
+@app.route('/features/<collection_name>', methods=['GET'])
+def get_collection_features(collection_name):
+    """Get the features of a collection whose footprint intersects a bbox"""
+    if not cached_demo_data or collection_name not in cached_demo_data:
+        return jsonify({"error": f"No data found for collection: {collection_name}"}), 404
+
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(value) for value in request.args['bbox'].split(','))
+    except (KeyError, ValueError):
+        return jsonify({"error": "bbox must be given as min_lng,min_lat,max_lng,max_lat"}), 400
+
+    store = cached_demo_data[collection_name]
+    matches = store.index.query_bbox(min_lng, min_lat, max_lng, max_lat)
+
+    if request.args.get('ids_only') in ('1', 'true'):
+        return jsonify({
+            'collection_name': collection_name,
+            'total_features': len(matches),
+            'ids': [store.ids[index] for index in matches]
+        }), 200
+
+    # Matching features are streamed from their stored encoding
+    body = (b'{"type":"FeatureCollection","collection_name":' + json.dumps(collection_name).encode() +
+            b',"total_features":' + str(len(matches)).encode() +
+            b',"features":' + store.raw_json_items(matches) + b'}')
+    return Response(body, status=200, mimetype='application/json')
+
+@app.route('/tiles/<collection_name>/<int:z>/<int:x>/<int:y>.mvt', methods=['GET'])
+def get_collection_tile(collection_name, z, x, y):
+    """Get a Mapbox Vector Tile of the footprints of a collection"""
+    if not cached_demo_data or collection_name not in cached_demo_data:
+        return jsonify({"error": f"No data found for collection: {collection_name}"}), 404
+    if z > MAX_TILE_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({"error": "Tile coordinates out of range"}), 400
+
+    store = cached_demo_data[collection_name]
+    # Keyed by the store, so a tile encoded from data a refresh has since
+    # replaced is never served for the new data
+    tile = tile_cache.get(
+        (collection_name, store.fingerprint, z, x, y),
+        # Clipping and encoding the footprints is CPU-bound, keep it off the event loop
+        lambda: EncodedPayload(run_blocking(encode_tile, store, z, x, y), mimetype=MVT_MIMETYPE)
+    )
+    return tile.response()
+
+@app.route('/coverage', methods=['GET'])
+def get_coverage():
+    """Get the images of every collection whose footprint contains a point"""
+    try:
+        lat = float(request.args['lat'])
+        lng = float(request.args['lng'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lng query parameters are required"}), 400
+
+    if cached_demo_data is None:
+        return jsonify({"error": "No data available"}), 404
+
+    collections = {}
+    for collection_name, store in cached_demo_data.items():
+        matches = store.index.query_point(lng, lat)
+        if matches:
+            collections[collection_name] = [store.ids[index] for index in matches]
+
+    return jsonify({
+        'lat': lat,
+        'lng': lng,
+        'total_images': sum(len(ids) for ids in collections.values()),
+        'collections': collections
+    }), 200
+
 @app.route('/news_categories', methods=['GET'])
 def get_news_categories():
     """Get available news categories"""
@@ -432,6 +854,36 @@ def test_news():
         'timestamp': datetime.now().isoformat()
     }), 200
 
+def fetch_google_news(query, limit):
+    # Google News RSS feed URL with dynamic query
+    rss_url = f"{upstreams.GOOGLE_NEWS_RSS_URL}?q={query}&hl=en-US&gl=US&ceid=US:en"
+    
+    # Add timeout and headers to avoid blocking
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    }
+    
+    # Try to fetch the RSS feed with timeout; the body is streamed into the
+    # parser, which stops reading once limit items have been parsed
+    response = http_client.get(rss_url, headers=headers, timeout=10, stream=True)
+    try:
+        if response.status_code != 200:
+            logger.warning(f"Google News RSS returned status {response.status_code}, using fallback")
+            raise Exception(f"RSS feed returned status {response.status_code}")
+
+        news_items = []
+        for entry in parse_items(response.iter_content(RSS_CHUNK_SIZE), max(limit, 0)):
+            news_items.append({
+                'title': entry['title'],
+                'link': entry['link'],
+                'published': entry['published'],
+                'summary': clean_summary(entry['summary'])
+            })
+    finally:
+        response.close()
+    
+    return news_items
+
 @app.route('/google_news', methods=['GET'])
 def google_news():
     """Fetch Google News RSS feed"""
@@ -442,48 +894,8 @@ def google_news():
         limit = min(limit, 50)  # Cap at 50 articles for performance
         logger.info(f"Google News query: {query}, limit: {limit}")
         
-        # Google News RSS feed URL with dynamic query
-        rss_url = f"https://news.google.com/rss/search?q={query}&hl=en-US&gl=US&ceid=US:en"
-        
-        # Add timeout and headers to avoid blocking
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Try to fetch the RSS feed with timeout
-        response = requests.get(rss_url, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Parse the RSS feed
-            feed = feedparser.parse(response.content)
-            
-            # Extract news items
-            news_items = []
-            
-            for entry in feed.entries[:limit]:  # Use configurable limit
-                # Clean HTML from summary
-                summary = entry.summary if hasattr(entry, 'summary') else ''
-                # Remove HTML tags and decode HTML entities
-                import re
-                import html
-                # Remove HTML tags
-                summary = re.sub(r'<[^>]+>', '', summary)
-                # Decode HTML entities
-                summary = html.unescape(summary)
-                # Clean up extra whitespace
-                summary = ' '.join(summary.split())
-                
-                news_items.append({
-                    'title': entry.title,
-                    'link': entry.link,
-                    'published': entry.published,
-                    'summary': summary
-                })
-            
-            return jsonify({'news': news_items}), 200
-        else:
-            logger.warning(f"Google News RSS returned status {response.status_code}, using fallback")
-            raise Exception(f"RSS feed returned status {response.status_code}")
+        news_items = news_cache.get((query, limit), lambda: fetch_google_news(query, limit))
+        return jsonify({'news': news_items}), 200
         
     except Exception as e:
         logger.error(f"Error fetching news: {e}")
@@ -522,6 +934,40 @@ def google_news():
         ]
         return jsonify({'news': fallback_news}), 200
 
+def run_supervisor(host, port):
+    """Keep the snapshot fresh while WEB_CONCURRENCY workers serve it"""
+    # The supervisor fetches and writes the data but never installs it
+    refresher = DemoDataRefresher(
+        lambda: new_demo_pipeline().run(strict=True),
+        snapshot_path=SNAPSHOT_PATH,
+        ttl=demo_data_refresher.ttl
+    )
+    snapshot = attach_snapshot(SNAPSHOT_PATH)
+    created_at = snapshot.created_at if snapshot is not None else None
+    del snapshot
+    # Workers started without a snapshot would each ingest on their own
+    if created_at is None and refresher.refresh():
+        created_at = time.time()
+    refresher.start(data_age=None if created_at is None else time.time() - created_at)
+    workers.Supervisor(host, port, workers.WEB_CONCURRENCY).run()
+
+def serve_worker():
+    """Serve from the supervisor's socket and snapshot"""
+    import eventlet.wsgi
+    if not bootstrap_demo_data():
+        logger.warning("No demo data snapshot to attach yet, the first request will ingest")
+    eventlet.wsgi.server(workers.inherited_socket(), app, log_output=False, **concurrency.server_options())
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    socketio.run(app, host='0.0.0.0', port=port, debug=False) 
\ No newline at end of file
+    if workers.is_worker():
+        serve_worker()
+    elif MULTI_WORKER:
+        run_supervisor('0.0.0.0', port)
+    else:
+        if workers.WEB_CONCURRENCY > 1:
+            logger.warning("WEB_CONCURRENCY needs SOCKETIO_ASYNC_MODE=eventlet, serving from one process")
+        # Serve the last snapshot straight away, or warm the cache in the background
+        if not bootstrap_demo_data():
+            demo_data_refresher.start()
+        socketio.run(app, host='0.0.0.0', port=port, debug=False, **concurrency.server_options()) 
\ No newline at end of file
@@ -0,0 +1,305 @@
+"""Load-test the backend with concurrent HTTP clients and Socket.IO searches.
+
+Unless --target points at a running server, the mock upstream
+(benchmarks/mock_upstream.py) runs in this process and app_production is
+started in a subprocess that fetches everything from it. For --duration
+seconds, --http-clients clients request a weighted mix of REST paths back to
+back, while --search-clients Socket.IO sessions run search_satellite
+searches one after another. The JSON report gives the throughput and the
+p50/p95/p99 latency of every path and of the searches, plus the requests
+the mock received per upstream route.
+
+Usage (from backend/):
+  python benchmarks/load_test.py [--duration 30] [--http-clients 8] [--search-clients 4]
+                                 [--workers 2] [--latency 0.1] [--latency search=0.5] [--output report.json]
+  python benchmarks/load_test.py --target http://127.0.0.1:5000 --path /summary --path /health=0.5
+"""
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import mock_upstream  # noqa: E402
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Weighted REST mix: what the globe requests when it loads and is browsed
+DEFAULT_PATHS = {
+    '/health': 1,
+    '/fetch_demo_data': 1,
+    '/summary': 2,
+    '/summary/demo_olenja': 2,
+    '/collection/demo_olenja': 1,
+    '/locations/demo_olenja?zoom=6&bbox=30,66,36,70': 2,
+    '/tiles/demo_olenja/6/37/15.mvt': 2,
+    '/coverage?lat=68.1&lng=33.5': 2,
+    '/google_news?q=satellite&limit=10': 1,
+}
+
+
+def weighted_paths(values):
+    """{path: weight} from options like ['/summary', '/health=0.5']"""
+    if not values:
+        return dict(DEFAULT_PATHS)
+    paths = {}
+    for value in values:
+        path, separator, weight = value.rpartition('=')
+        # A query string contains '=' too, only a number after the last one is a weight
+        try:
+            paths[path if separator else value] = float(weight) if separator else 1.0
+        except ValueError:
+            paths[value] = 1.0
+    return paths
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class Recorder:
+    """Latencies and outcomes per operation, shared by the client threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+
+    def add(self, name, seconds, outcome):
+        with self._lock:
+            if seconds is not None:
+                self.latencies[name].append(seconds)
+            self.outcomes[name][outcome] += 1
+
+    def summary(self, name, elapsed):
+        latencies = sorted(self.latencies.get(name, ()))
+        outcomes = self.outcomes.get(name, Counter())
+        result = {
+            'requests': sum(outcomes.values()),
+            'errors': sum(count for outcome, count in outcomes.items() if not outcome.startswith(('2', 'ok'))),
+            'outcomes': dict(outcomes),
+            'throughput_per_s': len(latencies) / elapsed,
+        }
+        if latencies:
+            result.update({
+                'p50_ms': percentile(latencies, 0.50) * 1000,
+                'p95_ms': percentile(latencies, 0.95) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+            })
+        return result
+
+    def report(self, names, elapsed):
+        return {name: self.summary(name, elapsed) for name in names}
+
+
+def rest_client(url, paths, deadline, recorder, seed):
+    rng = random.Random(seed)
+    choices, weights = list(paths), list(paths.values())
+    with requests.Session() as session:
+        session.headers['Accept-Encoding'] = 'gzip'
+        while time.monotonic() < deadline:
+            path = rng.choices(choices, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = session.get(url + path, timeout=60)
+                response.content
+                recorder.add(path, time.perf_counter() - started, str(response.status_code))
+            except requests.exceptions.RequestException as e:
+                recorder.add(path, None, type(e).__name__)
+
+
+def search_client(url, deadline, recorder, args, seed, locations):
+    """Run searches back to back; a --search-repeat share revisits an earlier location"""
+    import socketio
+
+    rng = random.Random(seed)
+    try:
+        # websocket-client sends the server's own URL as Origin unless told otherwise
+        with socketio.SimpleClient(websocket_extra_options={'origin': args.origin}) as sio:
+            sio.connect(url, transports=[args.transport], wait_timeout=30)
+            while time.monotonic() < deadline:
+                if locations and rng.random() < args.search_repeat:
+                    lat, lng = rng.choice(locations)
+                else:
+                    lat, lng = round(rng.uniform(-60, 70), 3), round(rng.uniform(-180, 180), 3)
+                    locations.append((lat, lng))
+                sio.emit('search_satellite', {
+                    'lat': lat, 'lng': lng, 'startDate': '2024-01-01', 'endDate': '2024-03-31',
+                    'cloudCover': 30, 'incremental': args.incremental,
+                })
+                started = time.perf_counter()
+                first_page = None
+                while True:
+                    event, _ = sio.receive(timeout=120)
+                    if event == 'search_results_page' and first_page is None:
+                        first_page = time.perf_counter() - started
+                    if event in ('search_results', 'search_complete', 'search_error'):
+                        break
+                outcome = 'error' if event == 'search_error' else 'ok'
+                recorder.add('search_satellite', time.perf_counter() - started, outcome)
+                if first_page is not None:
+                    recorder.add('search_first_page', first_page, outcome)
+    except Exception as e:
+        # A server that cannot keep up drops or times out sessions; they
+        # count as failed rather than aborting the run
+        recorder.add('search_satellite', None, type(e).__name__)
+        print(f"search client {seed}: {e!r}", file=sys.stderr)
+
+
+def wait_for_server(url, timeout):
+    """Wait for the server to answer and to have its demo data"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + '/fetch_demo_data', timeout=30).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+
+def start_server(args, upstream_environ, log):
+    directory = tempfile.mkdtemp(prefix='load-test-')
+    environ = dict(os.environ, **upstream_environ)
+    environ.update({
+        'PORT': str(args.port),
+        'WEB_CONCURRENCY': str(args.workers),
+        # A fresh snapshot so the server ingests from the mock
+        'DEMO_SNAPSHOT_PATH': os.path.join(directory, 'demo_data.snapshot'),
+    })
+    environ.setdefault('COPERNICUS_USERNAME', 'load-test')
+    environ.setdefault('COPERNICUS_PASSWORD', 'load-test')
+    server = subprocess.Popen([sys.executable, 'app_production.py'], cwd=BACKEND, env=environ,
+                              stdout=log, stderr=subprocess.STDOUT)
+    return server, directory
+
+
+def run_load(url, args, paths):
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    locations = []
+    threads = [
+        threading.Thread(target=rest_client, args=(url, paths, deadline, recorder, args.seed + number))
+        for number in range(args.http_clients)
+    ] + [
+        threading.Thread(target=search_client, args=(url, deadline, recorder, args, args.seed + number, locations))
+        for number in range(args.search_clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_http = Recorder()
+    for path in paths:
+        all_http.latencies['all'].extend(recorder.latencies.get(path, ()))
+        all_http.outcomes['all'].update(recorder.outcomes.get(path, Counter()))
+    searches = ['search_satellite'] + (['search_first_page'] if args.incremental else [])
+    return {
+        'elapsed_s': elapsed,
+        'http': dict(all_http.report(['all'], elapsed), paths=recorder.report(paths, elapsed)),
+        'socketio': recorder.report(searches, elapsed) if args.search_clients else {},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', help="load-test a running server instead of starting one")
+    parser.add_argument('--duration', type=float, default=30, help="seconds of load")
+    parser.add_argument('--http-clients', type=int, default=8)
+    parser.add_argument('--path', action='append', metavar='PATH[=WEIGHT]',
+                        help="REST path in the mix, repeatable (default: a mix of the globe's requests)")
+    parser.add_argument('--search-clients', type=int, default=4, help="concurrent Socket.IO search sessions")
+    parser.add_argument('--search-repeat', type=float, default=0.2,
+                        help="share of searches at an already searched location")
+    parser.add_argument('--incremental', action='store_true', help="request incremental search pages")
+    parser.add_argument('--transport', choices=['polling', 'websocket'],
+                        help="Socket.IO transport, websocket needs the websocket-client package "
+                             "(default: websocket with --workers above 1, which only accepts websocket)")
+    parser.add_argument('--origin', default='http://localhost:3000',
+                        help="Origin of the WebSocket sessions, one the server accepts")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the report here instead of stdout")
+
+    server = parser.add_argument_group("server started without --target")
+    server.add_argument('--port', type=int, default=5098)
+    server.add_argument('--workers', type=int, default=1, help="WEB_CONCURRENCY")
+    server.add_argument('--startup-timeout', type=float, default=120)
+    server.add_argument('--server-log', help="append the server output here")
+
+    upstream = parser.add_argument_group("mock upstream, see mock_upstream.py")
+    upstream.add_argument('--latency', action='append', metavar='[ROUTE=]SECONDS')
+    upstream.add_argument('--jitter', action='append', metavar='[ROUTE=]SECONDS')
+    upstream.add_argument('--error-rate', action='append', metavar='[ROUTE=]FRACTION')
+    upstream.add_argument('--items', type=int, default=2000, help="features per demo collection")
+    upstream.add_argument('--item-pages', type=int, default=20)
+    upstream.add_argument('--search-pages', type=int, default=3)
+    upstream.add_argument('--recordings', help="replay responses saved by mock_upstream.py record")
+    args = parser.parse_args()
+
+    paths = weighted_paths(args.path)
+    if args.transport is None:
+        args.transport = 'websocket' if args.workers > 1 and not args.target else 'polling'
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'server_log')}
+    config['path'] = paths
+
+    if args.target:
+        url = args.target.rstrip('/')
+        wait_for_server(url, args.startup_timeout)
+        report = dict(config=config, **run_load(url, args, paths))
+    else:
+        mock = mock_upstream.MockUpstream(
+            items=args.items, item_pages=args.item_pages, search_pages=args.search_pages,
+            latency=mock_upstream.route_values(args.latency, 0.0),
+            jitter=mock_upstream.route_values(args.jitter, 0.0),
+            error_rate=mock_upstream.route_values(args.error_rate, 0.0),
+            recordings=args.recordings, seed=args.seed,
+        )
+        stub, upstream_url = mock_upstream.start(mock)
+        url = f'http://127.0.0.1:{args.port}'
+        log = open(args.server_log, 'a') if args.server_log else subprocess.DEVNULL
+        process, directory = start_server(args, mock_upstream.environ(upstream_url), log)
+        try:
+            wait_for_server(url, args.startup_timeout)
+            before = mock.snapshot()
+            report = dict(config=config, **run_load(url, args, paths))
+            # Upstream requests made during the load, without the start-up ingest
+            report['upstream'] = {
+                route: {key: value - before[route][key] if key in ('requests', 'errors', 'bytes') else value
+                        for key, value in entry.items() if key != 'in_flight'}
+                for route, entry in mock.snapshot().items()
+            }
+        finally:
+            process.terminate()
+            process.wait()
+            stub.shutdown()
+            if log is not subprocess.DEVNULL:
+                log.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
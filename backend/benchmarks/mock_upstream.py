@@ -0,0 +1,465 @@
+"""Local stand-in for the upstream services the backend calls.
+
+One HTTP server answers for the Terramonitor STAC catalogue (collections and
+paginated item pages), the CDSE token endpoint and STAC search, and the
+Google News RSS search. Each route answers after a configurable latency plus
+random jitter, and fails with a configurable probability, so load tests run
+without a network and without touching the real services.
+
+Item pages are synthesized with stac_synth, or replayed from a directory
+written by the record command. Searches return Sentinel-2-like features
+inside the requested bbox and dates, over a configurable number of pages.
+The news search always serves google_news_sample.xml.
+
+Usage (from backend/):
+  python benchmarks/mock_upstream.py serve [--port 8765] [--latency 0.2] [--latency search=0.8]
+                                           [--jitter 0.05] [--error-rate items=0.01] [--recordings DIR]
+  python benchmarks/mock_upstream.py record DIR [--max-pages N]
+
+serve prints the environment variables that point the backend at the mock.
+GET /_mock/stats returns the requests, errors and peak concurrency per route.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stac_synth  # noqa: E402
+import upstreams  # noqa: E402
+
+NEWS_SAMPLE_PATH = os.path.join(stac_synth.REPO_ROOT, 'google_news_sample.xml')
+ROUTES = ('collections', 'items', 'token', 'search', 'news')
+
+# Rough area of each demo collection, (min_lng, min_lat, max_lng, max_lat)
+DEMO_BBOXES = {
+    'demo_olenja': (32.5, 67.6, 34.5, 68.7),
+    'demo_belaya': (102.6, 52.4, 104.6, 53.4),
+    'demo_dyagilevo': (38.6, 54.1, 40.6, 55.1),
+    'demo_ivanovo': (40.0, 56.4, 42.0, 57.4),
+}
+
+ITEMS_PATH = re.compile(r'^/terramonitor/stac/collections/([^/]+)/items$')
+
+
+def route_values(values, default):
+    """{route: value} from options like ['0.2', 'search=0.8'], the bare value applying to every route"""
+    result = dict.fromkeys(ROUTES, default)
+    for value in values or ():
+        route, _, number = value.rpartition('=')
+        if route and route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route {route!r}, expected one of {', '.join(ROUTES)}")
+        for name in ([route] if route else ROUTES):
+            result[name] = float(number)
+    return result
+
+
+def environ(base_url):
+    """Environment variables that point the backend at a mock served from base_url"""
+    return {
+        'TERRAMONITOR_STAC_URL': base_url + '/terramonitor/stac',
+        'COPERNICUS_AUTH_URL': base_url + '/cdse/token',
+        'COPERNICUS_STAC_SEARCH_URL': base_url + '/cdse/stac/search',
+        'GOOGLE_NEWS_RSS_URL': base_url + '/news/rss/search',
+    }
+
+
+def paged_links(url, page, pages):
+    return [{'rel': 'next', 'href': f'{url}?page={page + 1}', 'type': 'application/geo+json'}] if page < pages else []
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+class Recordings:
+    """Pages saved by the record command, see record()"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def load(self, *parts):
+        path = self._path(*parts)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def load_json(self, *parts):
+        content = self.load(*parts)
+        return None if content is None else json.loads(content)
+
+    def pages(self, *parts):
+        """The numbered JSON pages of a directory, in order"""
+        directory = self._path(*parts)
+        if not os.path.isdir(directory):
+            return []
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+        pages = []
+        for name in names:
+            with open(os.path.join(directory, name)) as f:
+                pages.append(json.load(f))
+        return pages
+
+
+class MockUpstream:
+    """The data and behaviour behind the mock server"""
+
+    def __init__(self, items=2000, item_pages=20, duplicates=0.1, search_results=10, search_pages=3,
+                 latency=None, jitter=None, error_rate=None, error_status=503, token_ttl=600,
+                 recordings=None, seed=0):
+        self.latency = latency or dict.fromkeys(ROUTES, 0.0)
+        self.jitter = jitter or dict.fromkeys(ROUTES, 0.0)
+        self.error_rate = error_rate or dict.fromkeys(ROUTES, 0.0)
+        self.error_status = error_status
+        self.token_ttl = token_ttl
+        self.search_results = search_results
+        self.search_pages = search_pages
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = 0
+        self.stats = {route: {'requests': 0, 'errors': 0, 'bytes': 0, 'in_flight': 0, 'max_in_flight': 0}
+                      for route in ROUTES}
+
+        recorded = Recordings(recordings) if recordings else None
+        # Pages are kept without their links, which are filled in per request
+        # because they depend on the address the mock is reached at
+        self.item_pages = {}
+        for number, collection in enumerate(upstreams.DEMO_COLLECTIONS):
+            pages = recorded.pages('items', collection) if recorded else []
+            if not pages:
+                features = list(stac_synth.SyntheticCollection(
+                    items, duplicate_ratio=duplicates, seed=seed + number, name=collection,
+                    bbox=DEMO_BBOXES[collection]))
+                size = max(1, math.ceil(len(features) / max(1, item_pages)))
+                pages = [{'type': 'FeatureCollection', 'features': features[start:start + size]}
+                         for start in range(0, len(features), size)] or [{'type': 'FeatureCollection', 'features': []}]
+            self.item_pages[collection] = [self._without_links(page) for page in pages]
+
+        self.collections = recorded and recorded.load_json('collections.json')
+        self.recorded_token = recorded and recorded.load_json('token.json')
+        self.recorded_search = [self._without_links(page) for page in recorded.pages('search')] if recorded else []
+        self.news = recorded and recorded.load('news.xml')
+        if not self.news:
+            with open(NEWS_SAMPLE_PATH, 'rb') as f:
+                self.news = f.read()
+
+    @staticmethod
+    def _without_links(page):
+        return {key: value for key, value in page.items() if key != 'links'}
+
+    def delay(self, route):
+        with self._lock:
+            jitter = self._random.uniform(0, self.jitter[route]) if self.jitter[route] else 0.0
+            failed = self._random.random() < self.error_rate[route]
+        return self.latency[route] + jitter, failed
+
+    def enter(self, route):
+        with self._lock:
+            entry = self.stats[route]
+            entry['requests'] += 1
+            entry['in_flight'] += 1
+            entry['max_in_flight'] = max(entry['max_in_flight'], entry['in_flight'])
+
+    def leave(self, route, size, failed):
+        with self._lock:
+            entry = self.stats[route]
+            entry['in_flight'] -= 1
+            entry['bytes'] += size
+            entry['errors'] += int(failed)
+
+    def snapshot(self):
+        with self._lock:
+            return {route: dict(entry) for route, entry in self.stats.items()}
+
+    def collections_page(self, base_url):
+        if self.collections is not None:
+            return self.collections
+        collections = []
+        for collection, (min_lng, min_lat, max_lng, max_lat) in DEMO_BBOXES.items():
+            collections.append({
+                'type': 'Collection',
+                'stac_version': '1.0.0',
+                'id': collection,
+                'title': collection.replace('_', ' ').title(),
+                'description': f'Synthetic stand-in for {collection}',
+                'license': 'proprietary',
+                'extent': {
+                    'spatial': {'bbox': [[min_lng, min_lat, max_lng, max_lat]]},
+                    'temporal': {'interval': [['2019-01-01T00:00:00Z', None]]},
+                },
+                'links': [{'rel': 'items', 'href': f'{base_url}/terramonitor/stac/collections/{collection}/items'}],
+            })
+        return {'collections': collections, 'links': []}
+
+    def items_page(self, url, collection, page):
+        pages = self.item_pages.get(collection)
+        if pages is None or not 1 <= page <= len(pages):
+            return None
+        return dict(pages[page - 1], links=paged_links(url, page, len(pages)))
+
+    def token(self):
+        with self._lock:
+            self._tokens += 1
+            number = self._tokens
+        token = dict(self.recorded_token or {'token_type': 'Bearer', 'refresh_expires_in': 3600})
+        token.update(access_token=f'mock-access-{number}', refresh_token=f'mock-refresh-{number}')
+        token.setdefault('expires_in', self.token_ttl)
+        return token
+
+    def search_page(self, url, body, page):
+        if self.recorded_search:
+            pages = self.recorded_search
+            if not 1 <= page <= len(pages):
+                return None
+            return dict(pages[page - 1], links=paged_links(url, page, len(pages)))
+
+        try:
+            params = json.loads(body)
+            min_lng, min_lat, max_lng, max_lat = (float(value) for value in params['bbox'])
+            start, end = (datetime.fromisoformat(value.replace('Z', '+00:00')) for value in params['datetime'].split('/'))
+            max_cloud = float(params['filter']['args'][1])
+        except (ValueError, KeyError, IndexError, TypeError):
+            return None
+        # The same search gets the same features, so caches behave as upstream
+        rng = random.Random(zlib.crc32(body) + page * 7919 + self.seed)
+        span = max((end - start).total_seconds(), 1)
+        features = []
+        for number in range(self.search_results):
+            x = rng.uniform(min_lng, max_lng)
+            y = rng.uniform(min_lat, max_lat)
+            acquired = (start + timedelta(seconds=rng.uniform(0, span))).astimezone(timezone.utc)
+            cloud = round(rng.uniform(0, max_cloud), 2)
+            identifier = f'S2B_MSIL2A_{acquired:%Y%m%dT%H%M%S}_N0510_R{page:03d}_T{number:05d}'
+            properties = {
+                'datetime': acquired.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                'platform': 'sentinel-2b',
+                'constellation': 'sentinel-2',
+                'instruments': ['msi'],
+                'eo:cloud_cover': cloud,
+                'cloudCover': cloud,
+            }
+            features.append(stac_synth.feature('SENTINEL-2', identifier, stac_synth.footprint(x, y, 0.9, 0.9), properties))
+        return {
+            'type': 'FeatureCollection',
+            'features': features,
+            'numberReturned': len(features),
+            'links': paged_links(url, page, self.search_pages),
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    mock = None
+
+    def do_GET(self):
+        self._dispatch(b'')
+
+    def do_POST(self):
+        self._dispatch(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+
+    def _dispatch(self, body):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        if parts.path == '/_mock/stats':
+            return self._send(200, encode(self.mock.snapshot()), 'application/json')
+
+        route = self._route(parts.path)
+        if route is None:
+            return self._send(404, encode({'error': f'No mock for {parts.path}'}), 'application/json')
+
+        self.mock.enter(route)
+        payload = b''
+        failed = False
+        try:
+            delay, failed = self.mock.delay(route)
+            if delay:
+                time.sleep(delay)
+            if failed:
+                payload = encode({'error': 'Injected failure'})
+                return self._send(self.mock.error_status, payload, 'application/json')
+            status, payload, content_type = self._answer(route, parts.path, query, body)
+            failed = status >= 400
+            return self._send(status, payload, content_type)
+        finally:
+            self.mock.leave(route, len(payload), failed)
+
+    @staticmethod
+    def _route(path):
+        if path == '/terramonitor/stac/collections':
+            return 'collections'
+        if ITEMS_PATH.match(path):
+            return 'items'
+        return {'/cdse/token': 'token', '/cdse/stac/search': 'search', '/news/rss/search': 'news'}.get(path)
+
+    def _answer(self, route, path, query, body):
+        url = f'http://{self.headers.get("Host")}{path}'
+        page = int(query.get('page', ['1'])[0])
+        if route == 'news':
+            return 200, self.mock.news, 'application/rss+xml; charset=utf-8'
+        if route == 'token':
+            return 200, encode(self.mock.token()), 'application/json'
+        if route == 'collections':
+            return 200, encode(self.mock.collections_page(f'http://{self.headers.get("Host")}')), 'application/json'
+        if route == 'items':
+            result = self.mock.items_page(url, ITEMS_PATH.match(path).group(1), page)
+            if result is None:
+                return 404, encode({'code': 'NotFoundError', 'description': 'No such collection or page'}), 'application/json'
+            return 200, encode(result), 'application/geo+json'
+        if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            return 401, encode({'code': 'Unauthorized', 'description': 'Missing bearer token'}), 'application/json'
+        result = self.mock.search_page(url, body, page)
+        if result is None:
+            return 400, encode({'code': 'BadRequest', 'description': 'Unsupported search'}), 'application/json'
+        return 200, encode(result), 'application/geo+json'
+
+    def _send(self, status, payload, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping their keep-alive connections is not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start(mock, host='127.0.0.1', port=0):
+    """Serve mock from a background thread; returns the server and its base URL"""
+    handler = type('MockHandler', (Handler,), {'mock': mock})
+    server = Server((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='mock-upstream', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def record(directory, max_pages, search_at):
+    """Save the live upstream responses for the mock to replay"""
+    import requests
+
+    from satellite_search import build_search_params
+    from stac_ingest import next_link
+
+    def save(value, *parts):
+        path = os.path.join(directory, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        mode = 'wb' if isinstance(value, bytes) else 'w'
+        with open(path, mode) as f:
+            f.write(value if isinstance(value, bytes) else json.dumps(value))
+
+    def pages(url, fetch):
+        number = 0
+        while url and number < max_pages:
+            response = fetch(url)
+            response.raise_for_status()
+            page = response.json()
+            number += 1
+            yield number, page
+            url = next_link(page)
+
+    session = requests.Session()
+    save(session.get(upstreams.COLLECTIONS_URL, timeout=30).json(), 'collections.json')
+    for collection in upstreams.DEMO_COLLECTIONS:
+        for number, page in pages(upstreams.items_url(collection), lambda url: session.get(url, timeout=30)):
+            save(page, 'items', collection, f'{number:04d}.json')
+            print(f"{collection} page {number}: {len(page.get('features', []))} features", file=sys.stderr)
+    save(session.get(upstreams.GOOGLE_NEWS_RSS_URL, params={'q': 'satellite data'}, timeout=30).content, 'news.xml')
+
+    if not os.getenv('COPERNICUS_USERNAME'):
+        print("COPERNICUS_USERNAME is not set, not recording the token and search", file=sys.stderr)
+        return
+    response = session.post(upstreams.COPERNICUS_AUTH_URL, timeout=30, data={
+        'username': os.getenv('COPERNICUS_USERNAME'),
+        'password': os.getenv('COPERNICUS_PASSWORD'),
+        'grant_type': 'password',
+        'client_id': 'cdse-public',
+    })
+    response.raise_for_status()
+    token = response.json()
+    # The tokens themselves are not kept, only the shape and lifetimes
+    save({key: value for key, value in token.items() if not key.endswith('token')}, 'token.json')
+    lat, lng = search_at
+    params = build_search_params({'lat': lat, 'lng': lng, 'startDate': '2024-01-01', 'endDate': '2024-03-31', 'cloudCover': 30})
+    headers = {'Authorization': f"Bearer {token['access_token']}"}
+    for number, page in pages(upstreams.COPERNICUS_STAC_SEARCH_URL,
+                              lambda url: session.post(url, json=params, headers=headers, timeout=30)):
+        save(page, 'search', f'{number:04d}.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="serve the mock until interrupted")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--latency', action='append', metavar='[ROUTE=]SECONDS',
+                       help=f"response time, for every route or one of {', '.join(ROUTES)}; repeatable")
+    serve.add_argument('--jitter', action='append', metavar='[ROUTE=]SECONDS',
+                       help="random extra response time, up to this much")
+    serve.add_argument('--error-rate', action='append', metavar='[ROUTE=]FRACTION',
+                       help="share of requests answered with --error-status")
+    serve.add_argument('--error-status', type=int, default=503)
+    serve.add_argument('--items', type=int, default=2000, help="synthetic features per demo collection")
+    serve.add_argument('--item-pages', type=int, default=20, help="pages the items of a collection are split over")
+    serve.add_argument('--duplicates', type=float, default=0.1, help="share of features repeating a footprint")
+    serve.add_argument('--search-results', type=int, default=10, help="features per search page")
+    serve.add_argument('--search-pages', type=int, default=3, help="pages per search")
+    serve.add_argument('--token-ttl', type=int, default=600, help="access token lifetime in seconds")
+    serve.add_argument('--recordings', help="replay item, search, token and news responses saved by record")
+    serve.add_argument('--seed', type=int, default=0)
+
+    recorder = commands.add_parser('record', help="save live upstream responses to replay")
+    recorder.add_argument('directory')
+    recorder.add_argument('--max-pages', type=int, default=50, help="pages per collection and search")
+    recorder.add_argument('--search-at', type=float, nargs=2, default=(68.15, 33.46), metavar=('LAT', 'LNG'))
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.directory, args.max_pages, args.search_at)
+        return
+
+    mock = MockUpstream(
+        items=args.items, item_pages=args.item_pages, duplicates=args.duplicates,
+        search_results=args.search_results, search_pages=args.search_pages,
+        latency=route_values(args.latency, 0.0), jitter=route_values(args.jitter, 0.0),
+        error_rate=route_values(args.error_rate, 0.0), error_status=args.error_status,
+        token_ttl=args.token_ttl, recordings=args.recordings, seed=args.seed,
+    )
+    server, url = start(mock, args.host, args.port)
+    for name, value in environ(url).items():
+        print(f'export {name}={value}')
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
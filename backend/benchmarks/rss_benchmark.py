@@ -0,0 +1,82 @@
+"""Compare the streaming RSS parser with feedparser on the Google News sample.
+
+Usage (from backend/): python benchmarks/rss_benchmark.py [--repeat N] [--limit N ...]
+"""
+import argparse
+import html
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import feedparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rss_parser import clean_summary, parse_items  # noqa: E402
+
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'google_news_sample.xml')
+
+
+def with_feedparser(content, limit):
+    """The google_news extraction as it was written with feedparser"""
+    news_items = []
+    for entry in feedparser.parse(content).entries[:limit]:
+        summary = entry.summary if hasattr(entry, 'summary') else ''
+        summary = ' '.join(html.unescape(re.sub(r'<[^>]+>', '', summary)).split())
+        news_items.append({'title': entry.title, 'link': entry.link, 'published': entry.published, 'summary': summary})
+    return news_items
+
+
+def with_rss_parser(content, limit):
+    return [
+        {'title': entry['title'], 'link': entry['link'], 'published': entry['published'],
+         'summary': clean_summary(entry['summary'])}
+        for entry in parse_items(content, limit)
+    ]
+
+
+def measure(parse, content, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parse(content, limit)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    parse(content, limit)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    return {'median_ms': timings[len(timings) // 2] * 1000, 'min_ms': timings[0] * 1000, 'peak_kib': peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sample', default=SAMPLE_PATH)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, nargs='+', default=[20, 50, 100])
+    args = parser.parse_args()
+
+    with open(args.sample, 'rb') as f:
+        content = f.read()
+
+    results = []
+    for limit in args.limit:
+        # Both implementations must agree before their timings mean anything
+        assert with_feedparser(content, limit) == with_rss_parser(content, limit)
+        baseline = measure(with_feedparser, content, limit, args.repeat)
+        streaming = measure(with_rss_parser, content, limit, args.repeat)
+        results.append({
+            'limit': limit,
+            'feedparser': baseline,
+            'rss_parser': streaming,
+            'speedup': baseline['median_ms'] / streaming['median_ms'],
+            'peak_memory_ratio': baseline['peak_kib'] / streaming['peak_kib'],
+        })
+    print(json.dumps({'sample_bytes': len(content), 'repeat': args.repeat, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
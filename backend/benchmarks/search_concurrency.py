@@ -0,0 +1,156 @@
+"""Measure Socket.IO search throughput against a slow upstream.
+
+The mock upstream (benchmarks/mock_upstream.py) runs in this process, its
+token and STAC search endpoints answering after --latency seconds;
+app_production is started in a subprocess per server mode and --clients
+Socket.IO clients each run --searches searches at distinct locations, so the
+search cache never helps.
+
+Server modes:
+  eventlet   green threads with cooperative sockets (the default)
+  blocking   eventlet without monkey patching, i.e. the server before
+             upstream I/O was made cooperative
+  threading  one OS thread per request
+
+Usage (from backend/): python benchmarks/search_concurrency.py [--modes eventlet blocking] [--clients N]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('eventlet', 'blocking', 'threading')
+
+
+def serve(mode, port):
+    """Run app_production against the mock upstream (in the server subprocess)"""
+    os.environ['SOCKETIO_ASYNC_MODE'] = 'threading' if mode == 'threading' else 'eventlet'
+    os.environ.setdefault('COPERNICUS_USERNAME', 'benchmark')
+    os.environ.setdefault('COPERNICUS_PASSWORD', 'benchmark')
+    sys.path.insert(0, BACKEND)
+
+    import concurrency
+    if mode == 'blocking':
+        concurrency.monkey_patch = lambda: None
+    import app_production
+    app_production.socketio.run(app_production.app, host='127.0.0.1', port=port, debug=False,
+                                log_output=False, allow_unsafe_werkzeug=True, **concurrency.server_options())
+
+
+def start_upstream(latency):
+    import mock_upstream
+    # One page per search, so a search waits on upstream for --latency seconds
+    mock = mock_upstream.MockUpstream(
+        items=200, search_pages=1,
+        latency=mock_upstream.route_values([f'token={latency}', f'search={latency}'], 0.0),
+    )
+    stub, url = mock_upstream.start(mock)
+    return stub, mock_upstream.environ(url)
+
+
+def wait_for_server(url, timeout=30):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url + '/health', timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start")
+
+
+def run_clients(url, clients, searches):
+    import socketio
+    from concurrent.futures import ThreadPoolExecutor
+
+    def client(number):
+        latencies = []
+        try:
+            with socketio.SimpleClient() as sio:
+                sio.connect(url, transports=['polling'], wait_timeout=30)
+                for search in range(searches):
+                    # A different location per search, far enough apart to miss the cache
+                    sio.emit('search_satellite', {
+                        'lat': -60 + number, 'lng': -170 + search,
+                        'startDate': '2024-01-01', 'endDate': '2024-01-31', 'cloudCover': 20,
+                    })
+                    started = time.perf_counter()
+                    event, _ = sio.receive(timeout=120)
+                    if event != 'search_results':
+                        raise RuntimeError(f"Unexpected {event} event")
+                    latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            # A server that cannot keep up drops or times out connections;
+            # those searches count as failed rather than aborting the run
+            print(f"client {number}: {e!r}", file=sys.stderr)
+        return latencies, searches - len(latencies)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        outcomes = list(executor.map(client, range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for client_latencies, _ in outcomes for latency in client_latencies)
+    failed = sum(failures for _, failures in outcomes)
+    if not latencies:
+        return {'searches': 0, 'failed': failed, 'elapsed_s': elapsed}
+    return {
+        'searches': len(latencies),
+        'failed': failed,
+        'elapsed_s': elapsed,
+        'searches_per_s': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def benchmark(mode, args, upstream_environ):
+    import shutil
+    import subprocess
+    import tempfile
+    url = f'http://127.0.0.1:{args.port}'
+    # The demo data is ingested from the mock into a snapshot of its own
+    directory = tempfile.mkdtemp(prefix='search-benchmark-')
+    environ = dict(os.environ, DEMO_SNAPSHOT_PATH=os.path.join(directory, 'demo_data.snapshot'), **upstream_environ)
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(args.port)],
+        cwd=BACKEND, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_server(url)
+        return run_clients(url, args.clients, args.searches)
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=['eventlet', 'blocking'])
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--searches', type=int, default=3, help="searches per client")
+    parser.add_argument('--latency', type=float, default=0.5, help="upstream response time in seconds")
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    stub, upstream_environ = start_upstream(args.latency)
+    results = {mode: benchmark(mode, args, upstream_environ) for mode in args.modes}
+    stub.shutdown()
+    print(json.dumps({
+        'clients': args.clients, 'searches_per_client': args.searches,
+        'upstream_latency_s': args.latency, 'results': results,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
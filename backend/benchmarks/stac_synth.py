@@ -0,0 +1,443 @@
+"""Synthetic STAC collections for the benchmarks.
+
+SyntheticCollection yields features shaped like the Terramonitor demo
+collections, with a configurable size, share of repeated footprints and
+constellation mix. features_from_summary() rebuilds a collection that
+summarizes to a recorded summary, which turns the summary_test.json and
+demo_olenja_summary.json fixtures into correctness oracles.
+"""
+import calendar
+import json
+import math
+import os
+import random
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FIXTURES = {
+    'summary_test': os.path.join(REPO_ROOT, 'summary_test.json'),
+    'demo_olenja_summary': os.path.join(REPO_ROOT, 'demo_olenja_summary.json'),
+}
+
+# Sensor type (None when the catalogue leaves it out) and resolution in
+# metres of each constellation, including the misspellings of the real data
+CONSTELLATIONS = {
+    'pleiades': ('optical', 0.5),
+    'pleaides': ('optical', 0.5),
+    'pleiades-neo': (None, 0.3),
+    'pleaides-neo': (None, 0.3),
+    'pleiades-neo-hd15': (None, 0.15),
+    'maxar-15cm': ('optical', 0.15),
+    'maxar-30cm': ('optical', 0.3),
+    'maxar-50cm': ('optical', 0.5),
+    'skysat': ('optical', 0.5),
+    'spot': ('optical', 1.5),
+    'triplesat': ('optical', 0.8),
+    'beijing-3a': ('optical', 0.5),
+    'eros-b': ('optical', 0.7),
+    'capella-slc': ('sar', 0.5),
+}
+# Region the footprints are scattered over: (min_lng, min_lat, max_lng, max_lat)
+DEFAULT_BBOX = (30.0, 66.0, 36.0, 70.0)
+FIRST_DAY = date(2019, 1, 1)
+DAYS = 2400
+
+
+def load_fixture(name):
+    with open(FIXTURES[name]) as f:
+        return json.load(f)
+
+
+def parse_mix(value):
+    """{constellation: weight} from a preset name or 'name=weight,name=weight'.
+
+    Presets: 'demo' (the proportions of the demo_olenja collection),
+    'uniform' (every known constellation equally) and 'optical' / 'sar'
+    (a single constellation).
+    """
+    if value == 'demo':
+        return dict(load_fixture('summary_test')['constellation_coverage'])
+    if value == 'uniform':
+        return {name: 1 for name in CONSTELLATIONS}
+    if value == 'optical':
+        return {'pleiades': 1}
+    if value == 'sar':
+        return {'capella-slc': 1}
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    if not mix or any(weight <= 0 for weight in mix.values()):
+        raise ValueError(f"Invalid constellation mix: {value}")
+    return mix
+
+
+def footprint(x, y, width, height):
+    """Closed, slightly skewed quadrilateral like the real acquisition footprints"""
+    ring = [
+        [x, y + height], [x + width, y + height * 1.01],
+        [x + width * 1.005, y], [x + width * 0.01, y - height * 0.01],
+    ]
+    ring = [[round(lng, 9), round(lat, 9)] for lng, lat in ring]
+    return [ring + [ring[0]]]
+
+
+def feature(collection, identifier, polygon, properties):
+    ring = polygon[0]
+    lngs = [point[0] for point in ring]
+    lats = [point[1] for point in ring]
+    return {
+        'type': 'Feature',
+        'stac_version': '1.0.0',
+        'id': identifier,
+        'collection': collection,
+        'bbox': [min(lngs), min(lats), max(lngs), max(lats)],
+        'geometry': {'type': 'Polygon', 'coordinates': polygon},
+        'properties': properties,
+        'assets': {'thumbnail': {'href': f'https://example.com/{collection}/{identifier}.png', 'type': 'image/png'}},
+        'links': [],
+    }
+
+
+def properties_for(constellation, datetime_str, cloud_cover, resolution=None, sensor_type=None):
+    """Feature properties, leaving out what a catalogue entry would be missing"""
+    known_sensor, known_resolution = CONSTELLATIONS.get(constellation, (None, None))
+    properties = {'title': f'{constellation} {datetime_str[:10] if datetime_str else ""}'.strip()}
+    if datetime_str is not None:
+        properties['datetime'] = datetime_str
+    if constellation != 'unknown':
+        properties['constellation'] = constellation
+    sensor_type = sensor_type or known_sensor
+    if sensor_type not in (None, 'unknown'):
+        properties['sensor_type'] = sensor_type
+    resolution = known_resolution if resolution is None else resolution
+    if resolution is not None and resolution == resolution:
+        properties['resolution'] = resolution
+    properties['cloud_cover'] = cloud_cover
+    return properties
+
+
+def stac_datetime(day):
+    return f'{day.isoformat()}T00:00:00.000Z'
+
+
+class SyntheticCollection:
+    """A reproducible synthetic collection of count features.
+
+    A duplicate_ratio share of the features reuse the footprint of an earlier
+    one, as repeated acquisitions of a location do. Iterating yields the
+    features one at a time, so a million-feature collection can be ingested
+    without holding the feature dicts in memory.
+    """
+
+    def __init__(self, count, duplicate_ratio=0.0, mix='demo', seed=0, name='synthetic', bbox=DEFAULT_BBOX):
+        if not 0 <= duplicate_ratio < 1:
+            raise ValueError("duplicate_ratio must be in [0, 1)")
+        self.count = count
+        self.duplicate_ratio = duplicate_ratio
+        self.mix = parse_mix(mix) if isinstance(mix, str) else dict(mix)
+        self.seed = seed
+        self.name = name
+        self.bbox = bbox
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        rng = random.Random(self.seed)
+        names = list(self.mix)
+        weights = list(self.mix.values())
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        # Footprints as x, y, width, height, which is all a duplicate needs
+        footprints = array('d')
+        for index in range(self.count):
+            if footprints and rng.random() < self.duplicate_ratio:
+                start = rng.randrange(len(footprints) // 4) * 4
+                x, y, width, height = footprints[start:start + 4]
+            else:
+                width, height = rng.uniform(0.05, 0.4), rng.uniform(0.05, 0.15)
+                x, y = rng.uniform(min_lng, max_lng - width), rng.uniform(min_lat, max_lat - height)
+                footprints.extend((x, y, width, height))
+            constellation = rng.choices(names, weights)[0]
+            day = FIRST_DAY + timedelta(days=rng.randrange(DAYS))
+            properties = properties_for(constellation, stac_datetime(day), round(rng.random() * 0.6, 3))
+            yield feature(self.name, f'{self.name}_{index:07d}', footprint(x, y, width, height), properties)
+
+    def check_summary(self, summary):
+        """Differences between a summary of this collection and what was generated"""
+        features = list(self) if self.count <= 100000 else None
+        problems = []
+        if summary['total_features'] != self.count:
+            problems.append(f"total_features {summary['total_features']} != {self.count}")
+        if sum(summary['constellation_coverage'].values()) != self.count:
+            problems.append("constellation_coverage does not add up to total_features")
+        if sum(summary['sensor_coverage'].values()) != self.count:
+            problems.append("sensor_coverage does not add up to total_features")
+        if not set(summary['constellation_coverage']) <= set(self.mix):
+            problems.append("constellation_coverage has constellations outside the mix")
+        months = sum(count for year in summary['features_per_year'].values() for count in year.values())
+        if months != self.count:
+            problems.append(f"features_per_year adds up to {months}, not {self.count}")
+        if summary['high_resolution'] + summary['very_high_resolution'] > self.count:
+            problems.append("more high resolution features than features")
+        if not summary['locations_with_multiple_images'] <= summary['unique_locations'] <= self.count:
+            problems.append("location counts out of range")
+        if features is not None:
+            coverage = Counter(feature['properties'].get('constellation', 'unknown') for feature in features)
+            if dict(coverage) != summary['constellation_coverage']:
+                problems.append("constellation_coverage differs from the generated constellations")
+            locations = Counter(json.dumps(feature['geometry']['coordinates']) for feature in features)
+            if len(locations) != summary['unique_locations']:
+                problems.append(f"unique_locations {summary['unique_locations']} != {len(locations)} generated footprints")
+            repeated = sum(1 for count in locations.values() if count > 1)
+            if repeated != summary['locations_with_multiple_images']:
+                problems.append(f"locations_with_multiple_images {summary['locations_with_multiple_images']} != {repeated}")
+        return problems
+
+
+def _spread(candidates, count):
+    """count items spread evenly over a sorted list"""
+    if count <= 0:
+        return []
+    step = len(candidates) / count
+    return [candidates[int(step * position)] for position in range(count)]
+
+
+def _date_buckets(summary, known_dates, now):
+    """[(days, count)] per month (split at the 30 day cutoff) for the dated features"""
+    date_range = summary['date_range']
+    earliest = datetime.fromisoformat(date_range['earliest'].replace('Z', '+00:00')).date()
+    latest = datetime.fromisoformat(date_range['latest'].replace('Z', '+00:00')).date()
+    cutoff = (now - timedelta(days=30)).date()
+    if now - timedelta(days=30) != datetime.combine(cutoff, datetime.min.time(), timezone.utc):
+        raise ValueError("now must be a UTC midnight")
+
+    buckets = []
+    for year, months in summary['features_per_year'].items():
+        for month, count in months.items():
+            year, month = int(year), int(month)
+            first = max(date(year, month, 1), earliest)
+            last = min(date(year, month, calendar.monthrange(year, month)[1]), latest)
+            days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+            old = [day for day in days if day < cutoff]
+            recent = [day for day in days if day >= cutoff]
+            buckets.append({'old': old, 'recent': recent, 'count': count})
+
+    # Every feature of a month after the cutoff is recent; the month the
+    # cutoff falls in supplies whatever recent features are still missing
+    needed = summary['features_last_30_days']
+    needed -= sum(bucket['count'] for bucket in buckets if bucket['recent'] and not bucket['old'])
+    split = []
+    for bucket in buckets:
+        if bucket['old'] and bucket['recent']:
+            recent = min(max(needed, 0), bucket['count'])
+            needed -= recent
+            split.append((bucket['recent'], recent))
+            split.append((bucket['old'], bucket['count'] - recent))
+        else:
+            split.append((bucket['recent'] or bucket['old'], bucket['count']))
+    if needed:
+        raise ValueError("features_last_30_days cannot be reproduced from features_per_year")
+
+    result = []
+    for days, count in split:
+        if not count:
+            continue
+        known = Counter(day for day in known_dates if days[0] <= day <= days[-1])
+        mandatory = set(known) | {day for day in (earliest, latest) if days[0] <= day <= days[-1]}
+        unknown = count - sum(known.values())
+        if unknown < len(mandatory - set(known)) or unknown < 0:
+            raise ValueError(f"Too few features in {days[0]:%Y-%m} for its fixed dates")
+        result.append({'days': days, 'known': known, 'mandatory': mandatory, 'unknown': unknown})
+    return result
+
+
+def _assign_dates(summary, known_dates, now):
+    """Dates for the features whose date is not known, in no particular order"""
+    buckets = _date_buckets(summary, known_dates, now)
+    target = summary['date_range']['total_days']
+    for bucket in buckets:
+        bucket['extra'] = 0
+        uncovered = len(bucket['mandatory'] - set(bucket['known']))
+        base = len(bucket['mandatory']) or 1
+        bucket['min'] = base
+        spare_features = bucket['unknown'] - uncovered - (0 if bucket['mandatory'] else 1)
+        bucket['room'] = max(0, min(spare_features, len(bucket['days']) - base))
+    extra = target - sum(bucket['min'] for bucket in buckets)
+    if extra < 0 or extra > sum(bucket['room'] for bucket in buckets):
+        raise ValueError("date_range.total_days cannot be reproduced from features_per_year")
+    # Hand out the extra distinct days one at a time, busiest months first
+    while extra:
+        for bucket in sorted(buckets, key=lambda bucket: bucket['room'] - bucket['extra'], reverse=True):
+            if extra and bucket['extra'] < bucket['room']:
+                bucket['extra'] += 1
+                extra -= 1
+
+    dates = []
+    for bucket in buckets:
+        free = [day for day in bucket['days'] if day not in bucket['mandatory']]
+        days = sorted(bucket['mandatory']) or [bucket['days'][len(bucket['days']) // 2]]
+        if not bucket['mandatory']:
+            free.remove(days[0])
+        days += _spread(free, bucket['extra'])
+        # Every day without a known feature gets one; the rest share them all
+        unknown_days = [day for day in days if day not in bucket['known']]
+        unknown_days += [days[position % len(days)] for position in range(bucket['unknown'] - len(unknown_days))]
+        dates.extend(unknown_days)
+    return dates
+
+
+def _solve_average(total, known_values, count, bounds, name):
+    """A value for each of count unknown features so that all values add up to total"""
+    if not count:
+        return []
+    value = (total - sum(known_values)) / count
+    low, high = bounds
+    if not low <= value <= high:
+        raise ValueError(f"{name} cannot be reproduced")
+    return [value] * count
+
+
+def features_from_summary(summary, now=None, name='oracle'):
+    """STAC features whose summary, computed as of now, is the given summary.
+
+    The features of every listed location come first, so their order and
+    sample images match; the rest are single-image locations with made-up
+    footprints, and their dates, constellations, sensor types, resolutions
+    and cloud cover are chosen so that every aggregate adds up. now defaults
+    to the UTC midnight after the latest date. Returns (features, now).
+    """
+    if now is None:
+        latest = datetime.fromisoformat(summary['date_range']['latest'].replace('Z', '+00:00'))
+        now = datetime.combine(latest.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    total = summary['total_features']
+    listed = [location for location in summary['multi_image_locations'] if location['image_count'] > 1]
+    if len(summary['multi_image_locations']) == summary['unique_locations']:
+        listed = summary['multi_image_locations']
+
+    # Known features: the sample images of the listed locations
+    known = [sample for location in listed for sample in location['sample_images']]
+    placeholders = sum(location['image_count'] - len(location['sample_images']) for location in listed)
+    singles = total - len(known) - placeholders
+    if singles != summary['unique_locations'] - len(listed):
+        raise ValueError("Unlisted locations must have a single image each")
+    unknown_count = placeholders + singles
+
+    known_dates = [datetime.fromisoformat(sample['date'].replace('Z', '+00:00')).date() for sample in known if sample['date']]
+    dated = sum(count for months in summary['features_per_year'].values() for count in months.values())
+    dates = [stac_datetime(day) for day in _assign_dates(summary, known_dates, now)] if dated else []
+    dates += [None] * (unknown_count - len(dates))
+
+    def remaining(coverage, used):
+        values = []
+        for label, count in sorted(coverage.items()):
+            left = count - used.get(label, 0)
+            if left < 0:
+                raise ValueError(f"More sample images of {label} than its coverage")
+            values += [label] * left
+        return values
+
+    constellations = remaining(summary['constellation_coverage'], Counter(sample['constellation'] for sample in known))
+    sensor_types = remaining(summary['sensor_coverage'], Counter(sample['sensor_type'] for sample in known))
+    if len(constellations) != unknown_count or len(sensor_types) != unknown_count:
+        raise ValueError("Coverage counts do not add up to total_features")
+
+    # Resolutions: very high (<= 1 m), high (1-5 m) and the rest left out
+    known_resolutions = [sample['resolution'] for sample in known]
+    very_high = summary['very_high_resolution'] - sum(1 for value in known_resolutions if 0 < value <= 1)
+    high = summary['high_resolution'] - sum(1 for value in known_resolutions if 1 < value <= 5)
+    resolution_total = summary['average_resolution'] * total - sum(known_resolutions)
+    high_value = 3.0 if high else 0
+    very_high_values = _solve_average(resolution_total - high * high_value, [], very_high, (1e-6, 1), 'average_resolution')
+    resolutions = very_high_values + [high_value] * high + [math.nan] * (unknown_count - very_high - high)
+    cloud_covers = _solve_average(
+        summary['average_cloud_cover'] * total, [sample['cloud_cover'] for sample in known],
+        unknown_count, (0, 100), 'average_cloud_cover'
+    )
+
+    def unknown_properties(position):
+        return properties_for(
+            constellations[position], dates[position], cloud_covers[position],
+            resolutions[position], sensor_types[position]
+        )
+
+    rng = random.Random(0)
+    features = []
+    position = 0
+
+    def single(polygon=None):
+        nonlocal position
+        if polygon is None:
+            x, y = rng.uniform(30, 36), rng.uniform(66, 70)
+            polygon = footprint(x, y, rng.uniform(0.05, 0.4), rng.uniform(0.05, 0.15))
+        features.append(feature(name, f'{name}_{len(features):05d}', polygon, unknown_properties(position)))
+        position += 1
+
+    # The first feature sets first_image_coordinates
+    if summary['first_image_coordinates'] and singles:
+        single(summary['first_image_coordinates'])
+        singles -= 1
+    for number, location in enumerate(listed):
+        polygon = location.get('polygon_coordinates') or footprint(20 + number * 0.5, 60, 0.3, 0.1)
+        for sample in location['sample_images']:
+            resolution = sample['resolution'] or math.nan
+            properties = properties_for(sample['constellation'], sample['date'], sample['cloud_cover'],
+                                        resolution, sample['sensor_type'])
+            features.append(feature(name, sample['id'], polygon, properties))
+        for _ in range(location['image_count'] - len(location['sample_images'])):
+            features.append(feature(name, f'{name}_{len(features):05d}', polygon, unknown_properties(position)))
+            position += 1
+    for _ in range(singles):
+        single()
+    return features, now
+
+
+def _close(expected, actual):
+    if isinstance(expected, float) or isinstance(actual, float):
+        return math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-12)
+    return expected == actual
+
+
+def compare_summaries(expected, actual, path=''):
+    """Paths at which a summary differs from an expected one.
+
+    Label lists are compared as sets, floats approximately, and only the
+    fields present in the expected summary are checked; multi-image
+    locations are matched in order against the locations of the actual
+    summary that have more than one image.
+    """
+    expected = json.loads(json.dumps(expected))
+    actual = json.loads(json.dumps(actual))
+    if path == '' and 'multi_image_locations' in expected:
+        listed = expected['multi_image_locations']
+        if len(listed) != expected.get('unique_locations'):
+            actual['multi_image_locations'] = [location for location in actual['multi_image_locations'] if location['image_count'] > 1]
+    return _differences(expected, actual, path)
+
+
+def _differences(expected, actual, path):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key, value in expected.items():
+            if key == 'location_id':
+                continue
+            if key not in actual:
+                differences.append(f'{path}/{key}: missing')
+            elif key in ('constellations', 'sensor_types') and isinstance(value, list):
+                if set(value) != set(actual[key]):
+                    differences.append(f'{path}/{key}: {sorted(actual[key])} != {sorted(value)}')
+            else:
+                differences.extend(_differences(value, actual[key], f'{path}/{key}'))
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f'{path}: {len(actual)} items != {len(expected)}']
+        differences = []
+        for index, (item, other) in enumerate(zip(expected, actual)):
+            differences.extend(_differences(item, other, f'{path}/{index}'))
+        return differences
+    if not _close(expected, actual):
+        return [f'{path}: {actual!r} != {expected!r}']
+    return []
@@ -0,0 +1,322 @@
+"""Benchmark summarize_collection and the REST endpoints on synthetic STAC data.
+
+Three phases, all reported in one JSON document:
+
+  oracles    collections rebuilt from the summary_test.json and
+             demo_olenja_summary.json fixtures must summarize back to the
+             fixtures; a mismatch fails the run before anything is timed
+  summarize  helpers.summarize_collection time and peak memory for
+             every --counts x --duplicates x --mixes case, on an ingested
+             CollectionStore (as the app calls it) and on a list of raw
+             features (which includes the columnar ingest)
+  endpoints  Flask test-client requests against app_production with
+             synthetic collections installed, cold (caches cleared before
+             every request) and warm
+
+Each synthetic summary is also checked against what the generator
+produced. Results can be compared with an earlier run with --baseline.
+
+Usage (from backend/):
+  python benchmarks/summary_benchmark.py [--counts 1000 10000 100000] [--output results.json]
+  python benchmarks/summary_benchmark.py --counts 1000000 --inputs store --skip-endpoints
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# As in the apps, eventlet patches the standard library before anything else is imported
+import concurrency  # noqa: E402
+concurrency.monkey_patch()
+
+import argparse  # noqa: E402
+import ctypes  # noqa: E402
+import gc  # noqa: E402
+import json  # noqa: E402
+import math  # noqa: E402
+import platform  # noqa: E402
+import subprocess  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+import tracemalloc  # noqa: E402
+
+from feature_store import CollectionStore  # noqa: E402
+from helpers import SummaryAccumulator, summarize_collection  # noqa: E402
+from stac_synth import FIXTURES, SyntheticCollection, compare_summaries, features_from_summary, load_fixture  # noqa: E402
+
+# Larger collections are only summarized from a store, without holding
+# their features as a list
+LIST_INPUT_LIMIT = 200000
+# Largest collection whose peak memory is traced rather than read from the RSS
+TRACE_LIMIT = 20000
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def timings(call, repeat):
+    values = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        call()
+        values.append(time.perf_counter() - started)
+    values.sort()
+    return values
+
+
+def _status_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise OSError(f"No {field} in /proc/self/status")
+
+
+def rss_supported():
+    """Whether the peak RSS of this process can be reset (Linux 4.0+ with glibc)"""
+    try:
+        ctypes.CDLL(None).malloc_trim
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        _status_kib('VmHWM')
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+def memory_method(choice, count):
+    # Resident memory only grows once freed memory runs out, so small
+    # summaries are traced; tracing a large one would take minutes
+    if choice == 'auto':
+        return 'rss' if count > TRACE_LIMIT and rss_supported() else 'tracemalloc'
+    return choice
+
+
+def peak_memory(call, method):
+    """Bytes the call needed at its peak above what was in use before it.
+
+    'rss' resets the high water mark of the resident set before the call,
+    which costs nothing while it runs; 'tracemalloc' counts Python
+    allocations only and slows the call down about tenfold.
+    """
+    gc.collect()
+    if method == 'rss':
+        # Hand memory freed by earlier cases back to the system, or this
+        # call would reuse it without growing the resident set
+        ctypes.CDLL(None).malloc_trim(0)
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        before = _status_kib('VmRSS')
+        call()
+        return (_status_kib('VmHWM') - before) * 1024
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run_oracles():
+    results = []
+    for name in FIXTURES:
+        fixture = load_fixture(name)
+        features, now = features_from_summary(fixture)
+        summary = SummaryAccumulator(now).update(CollectionStore.from_features(features)).result()
+        differences = compare_summaries(fixture, summary)
+        results.append({'fixture': name, 'features': len(features), 'now': now.isoformat(),
+                        'ok': not differences, 'differences': differences[:20]})
+    return results
+
+
+def run_summarize(args):
+    results = []
+    for count in args.counts:
+        for duplicate_ratio in args.duplicates:
+            for mix in args.mixes:
+                collection = SyntheticCollection(count, duplicate_ratio, mix, seed=args.seed)
+                started = time.perf_counter()
+                store = CollectionStore.from_features(collection, 'synthetic')
+                ingest_s = time.perf_counter() - started
+                summary = summarize_collection(store)
+                problems = collection.check_summary(summary)
+                case = {
+                    'count': count, 'duplicate_ratio': duplicate_ratio, 'mix': mix,
+                    'unique_locations': summary['unique_locations'], 'ingest_ms': ingest_s * 1000,
+                    'problems': problems,
+                }
+                inputs = {'store': store}
+                if 'features' in args.inputs and count <= LIST_INPUT_LIMIT:
+                    inputs['features'] = list(collection)
+                for name in args.inputs:
+                    if name not in inputs:
+                        continue
+                    data = inputs[name]
+                    method = memory_method(args.memory, count)
+                    values = timings(lambda: summarize_collection(data), args.repeat)
+                    case[name] = {
+                        'median_ms': values[len(values) // 2] * 1000,
+                        'min_ms': values[0] * 1000,
+                        'features_per_s': count / values[len(values) // 2],
+                        'peak_mib': peak_memory(lambda: summarize_collection(data), method) / 2 ** 20,
+                        'memory': method,
+                    }
+                inputs.clear()
+                results.append(case)
+                print(f"summarize {count} features, {duplicate_ratio:.0%} duplicates, {mix} mix: "
+                      f"{case.get('store', {}).get('median_ms', 0):.1f} ms", file=sys.stderr)
+    return results
+
+
+def endpoint_cases(store, name):
+    """(label, path) of the requests timed against one collection"""
+    from vector_tiles import MAX_TILE_ZOOM
+
+    min_lng, min_lat, max_lng, max_lat = store.bbox(0)
+    lng, lat = (min_lng + max_lng) / 2, (min_lat + max_lat) / 2
+    zoom = min(8, MAX_TILE_ZOOM)
+    tile_x = int((lng + 180) / 360 * 2 ** zoom)
+    tile_y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * 2 ** zoom)
+    return [
+        ('fetch_demo_data', '/fetch_demo_data'),
+        ('fetch_demo_data_page', f'/fetch_demo_data?collections={name}&fields=id,geometry,properties.datetime&limit=500'),
+        ('summary', f'/summary/{name}'),
+        ('summary_simplified', f'/summary/{name}?zoom=6'),
+        ('summary_batch', '/summary'),
+        ('collection', f'/collection/{name}'),
+        ('locations', f'/locations/{name}'),
+        ('locations_clustered', f'/locations/{name}?zoom=5'),
+        ('features_bbox', f'/features/{name}?bbox={lng - 1},{lat - 0.5},{lng + 1},{lat + 0.5}'),
+        ('tile', f'/tiles/{name}/{zoom}/{tile_x}/{tile_y}.mvt'),
+        ('coverage', f'/coverage?lat={lat}&lng={lng}'),
+    ]
+
+
+def run_endpoints(args):
+    os.environ.setdefault('DEMO_SNAPSHOT_PATH', os.path.join(tempfile.mkdtemp(), 'benchmark.snapshot'))
+    import app_production as app_module
+
+    def clear_caches():
+        app_module.summary_cache.clear()
+        app_module.response_cache.clear()
+        app_module.tile_cache.clear()
+        app_module.cluster_indexes.clear()
+
+    stores = {
+        name: CollectionStore.from_features(
+            SyntheticCollection(args.endpoint_count, args.endpoint_duplicates, mix, seed=args.seed + number, name=name), name
+        )
+        for number, (name, mix) in enumerate((('synthetic_demo', 'demo'), ('synthetic_uniform', 'uniform')))
+    }
+    app_module.set_cached_demo_data(stores)
+    client = app_module.app.test_client()
+    headers = {'Accept-Encoding': 'gzip'}
+
+    def request(path):
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        return response.status_code, len(body)
+
+    results = []
+    for label, path in endpoint_cases(stores['synthetic_demo'], 'synthetic_demo'):
+        status, size = request(path)
+        result = {'endpoint': label, 'path': path, 'status': status, 'bytes': size}
+        if status == 200:
+            cold = timings(lambda: (clear_caches(), request(path)), args.repeat)
+            warm = timings(lambda: request(path), args.repeat)
+            result.update({
+                'cold_median_ms': cold[len(cold) // 2] * 1000, 'cold_min_ms': cold[0] * 1000,
+                'warm_median_ms': warm[len(warm) // 2] * 1000, 'warm_min_ms': warm[0] * 1000,
+            })
+        results.append(result)
+        print(f"{label}: {result.get('cold_median_ms', 0):.1f} ms cold, {result.get('warm_median_ms', 0):.1f} ms warm",
+              file=sys.stderr)
+    clear_caches()
+    return results
+
+
+def compare_with_baseline(report, baseline, threshold):
+    """Add the ratio to the baseline median to every timing; returns the regressions"""
+    regressions = []
+
+    def compare(section, key, current, previous):
+        for field in ('median_ms', 'cold_median_ms', 'warm_median_ms'):
+            if field in current and field in previous and previous[field] > 0:
+                ratio = current[field] / previous[field]
+                current[field.replace('median_ms', 'baseline_ratio')] = ratio
+                if ratio > threshold:
+                    regressions.append({'section': section, 'case': key, 'timing': field, 'ratio': ratio})
+
+    previous_cases = {
+        (case['count'], case['duplicate_ratio'], case['mix']): case for case in baseline.get('summarize', [])
+    }
+    for case in report['summarize']:
+        previous = previous_cases.get((case['count'], case['duplicate_ratio'], case['mix']))
+        for name in ('store', 'features'):
+            if previous and name in case and name in previous:
+                compare('summarize', f"{case['count']}/{case['duplicate_ratio']}/{case['mix']}/{name}",
+                        case[name], previous[name])
+    previous_endpoints = {result['endpoint']: result for result in baseline.get('endpoints', [])}
+    for result in report['endpoints']:
+        if result['endpoint'] in previous_endpoints:
+            compare('endpoints', result['endpoint'], result, previous_endpoints[result['endpoint']])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--duplicates', type=float, nargs='+', default=[0.0, 0.5],
+                        help="share of features repeating an earlier footprint")
+    parser.add_argument('--mixes', nargs='+', default=['demo', 'uniform'],
+                        help="constellation mixes: demo, uniform, optical, sar or name=weight,...")
+    parser.add_argument('--inputs', nargs='+', choices=['store', 'features'], default=['store', 'features'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory', choices=['auto', 'rss', 'tracemalloc'], default='auto',
+                        help="how peak memory is measured; auto traces up to 20,000 features")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--endpoint-count', type=int, default=20000, help="features per collection for the endpoints")
+    parser.add_argument('--endpoint-duplicates', type=float, default=0.1)
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--baseline', help="results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25, help="baseline ratio reported as a regression")
+    parser.add_argument('--output', help="write the results here instead of stdout")
+    args = parser.parse_args()
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'async_mode': concurrency.ASYNC_MODE,
+        'repeat': args.repeat,
+        'oracles': run_oracles(),
+    }
+    failed = not all(oracle['ok'] for oracle in report['oracles'])
+    if not failed:
+        report['summarize'] = run_summarize(args)
+        report['endpoints'] = [] if args.skip_endpoints else run_endpoints(args)
+        failed = any(case['problems'] for case in report['summarize']) or \
+            any(result['status'] != 200 for result in report['endpoints'])
+        if args.baseline:
+            with open(args.baseline) as f:
+                report['regressions'] = compare_with_baseline(report, json.load(f), args.threshold)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if failed:
+        print("Correctness checks failed, see 'oracles', 'problems' and 'status' in the results", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
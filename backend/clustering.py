@@ -0,0 +1,158 @@
+import math
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Cluster radius in pixels of a tile EXTENT pixels wide, as in supercluster
+CLUSTER_RADIUS = float(os.getenv('CLUSTER_RADIUS', 60))
+EXTENT = 512
+MAX_ZOOM = 20
+
+
+def lng_x(lng):
+    """Longitude to Web Mercator x in [0, 1]"""
+    return lng / 360 + 0.5
+
+
+def lat_y(lat):
+    """Latitude to Web Mercator y in [0, 1], 0 at the top"""
+    sin = math.sin(lat * math.pi / 180)
+    if sin >= 1:
+        return 0.0
+    if sin <= -1:
+        return 1.0
+    y = 0.5 - 0.25 * math.log((1 + sin) / (1 - sin)) / math.pi
+    return min(1.0, max(0.0, y))
+
+
+def x_lng(x):
+    return (x - 0.5) * 360
+
+
+def y_lat(y):
+    return 360 * math.atan(math.exp((180 - y * 360) * math.pi / 180)) / math.pi - 90
+
+
+class ClusterLevel:
+    """Points or clusters of one zoom level, as parallel arrays sorted by x"""
+
+    def __init__(self, entries):
+        entries.sort()
+        self.xs = array('d', (entry[0] for entry in entries))
+        self.ys = array('d', (entry[1] for entry in entries))
+        self.counts = array('I', (entry[2] for entry in entries))
+        self.weights = array('d', (entry[3] for entry in entries))
+        self.ids = array('I', (entry[4] for entry in entries))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(self, minx, miny, maxx, maxy):
+        """Positions of the entries inside the projected box"""
+        start = bisect_left(self.xs, minx)
+        stop = bisect_right(self.xs, maxx)
+        ys = self.ys
+        return [i for i in range(start, stop) if miny <= ys[i] <= maxy]
+
+
+class ClusterIndex:
+    """Hierarchical greedy point clustering for zoom levels min_zoom..max_zoom.
+
+    Works like supercluster: starting from the raw points (level max_zoom + 1),
+    each zoom level merges every point with its unvisited neighbours within
+    radius pixels into a cluster at their weighted centre. Ids below
+    len(points) are point indexes, larger ids are clusters. Levels in which
+    nothing merges share the arrays of the level above.
+    """
+
+    def __init__(self, points, weights=None, radius=CLUSTER_RADIUS, extent=EXTENT, min_zoom=0, max_zoom=MAX_ZOOM):
+        self.radius = radius
+        self.extent = extent
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.point_count = len(points)
+        # Zoom level each cluster was formed at, indexed by id - point_count
+        self.cluster_zooms = array('b')
+
+        entries = [
+            (lng_x(point[0]), lat_y(point[1]), 1, 1.0 if weights is None else weights[index], index)
+            for index, point in enumerate(points) if point is not None
+        ]
+        level = ClusterLevel(entries)
+        self.levels = {max_zoom + 1: level}
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            level = self._cluster(level, zoom)
+            self.levels[zoom] = level
+
+    def _cluster(self, level, zoom):
+        r = self.radius / (self.extent * 2 ** zoom)
+        r2 = r * r
+        # Plain lists index faster than arrays in the hot loop
+        xs, ys, counts, weights, ids = (level.xs.tolist(), level.ys.tolist(), level.counts.tolist(),
+                                        level.weights.tolist(), level.ids.tolist())
+
+        cells = [(int(x / r), int(y / r)) for x, y in zip(xs, ys)]
+        grid = {}
+        for i, cell in enumerate(cells):
+            grid.setdefault(cell, []).append(i)
+
+        visited = bytearray(len(xs))
+        entries = []
+        merged = False
+        for i, (cell_x, cell_y) in enumerate(cells):
+            if visited[i]:
+                continue
+            visited[i] = 1
+            x, y = xs[i], ys[i]
+            neighbours = []
+            for grid_x in (cell_x - 1, cell_x, cell_x + 1):
+                for grid_y in (cell_y - 1, cell_y, cell_y + 1):
+                    bucket = grid.get((grid_x, grid_y))
+                    if bucket:
+                        for j in bucket:
+                            if not visited[j]:
+                                dx = xs[j] - x
+                                dy = ys[j] - y
+                                if dx * dx + dy * dy <= r2:
+                                    neighbours.append(j)
+            if not neighbours:
+                entries.append((x, y, counts[i], weights[i], ids[i]))
+                continue
+
+            merged = True
+            count = counts[i]
+            weight = weights[i]
+            wx, wy = x * count, y * count
+            for j in neighbours:
+                visited[j] = 1
+                count += counts[j]
+                weight += weights[j]
+                wx += xs[j] * counts[j]
+                wy += ys[j] * counts[j]
+            entries.append((wx / count, wy / count, count, weight, self.point_count + len(self.cluster_zooms)))
+            self.cluster_zooms.append(zoom)
+
+        return ClusterLevel(entries) if merged else level
+
+    def is_cluster(self, id):
+        return id >= self.point_count
+
+    def expansion_zoom(self, cluster_id):
+        """First zoom level at which the cluster breaks apart"""
+        return min(self.cluster_zooms[cluster_id - self.point_count] + 1, self.max_zoom + 1)
+
+    def get_clusters(self, min_lng, min_lat, max_lng, max_lat, zoom):
+        """(lng, lat, point_count, weight, id) of everything visible in the bbox at zoom.
+
+        A bbox with min_lng > max_lng crosses the antimeridian.
+        """
+        level = self.levels[max(self.min_zoom, min(int(zoom), self.max_zoom + 1))]
+        miny, maxy = lat_y(max_lat), lat_y(min_lat)
+        if min_lng > max_lng:
+            positions = level.query(lng_x(min_lng), miny, 1.0, maxy) + level.query(0.0, miny, lng_x(max_lng), maxy)
+        else:
+            positions = level.query(lng_x(min_lng), miny, lng_x(max_lng), maxy)
+        return [
+            (x_lng(level.xs[i]), y_lat(level.ys[i]), level.counts[i], level.weights[i], level.ids[i])
+            for i in positions
+        ]
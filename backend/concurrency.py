@@ -0,0 +1,84 @@
+import os
+import weakref
+
+import greenlet
+
+# Server concurrency model. 'eventlet' serves every request and Socket.IO
+# event on a green thread, with blocking socket I/O (requests, the Copernicus
+# API, STAC ingest) made cooperative; 'threading' uses one OS thread each.
+ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'eventlet')
+# Most connections the eventlet server handles at once
+SERVER_MAX_CONCURRENCY = int(os.getenv('SERVER_MAX_CONCURRENCY', 1000))
+# Most Copernicus searches paginating upstream at once; later ones queue
+SEARCH_CONCURRENCY = int(os.getenv('SEARCH_CONCURRENCY', 16))
+
+
+def monkey_patch():
+    """Make the standard library cooperative under eventlet.
+
+    Must run before anything else imports socket, ssl or threading, so the
+    apps call it first thing.
+    """
+    if ASYNC_MODE == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+
+
+def is_green():
+    """True when threads are eventlet green threads sharing one OS thread"""
+    if ASYNC_MODE != 'eventlet':
+        return False
+    from eventlet import patcher
+    return patcher.is_monkey_patched('thread')
+
+
+def native_threading():
+    """The threading module as it was before monkey patching"""
+    if is_green():
+        from eventlet import patcher
+        return patcher.original('threading')
+    import threading
+    return threading
+
+
+# Work running in other threads on behalf of each thread (green or native),
+# as (greenlet, native thread id) pairs, so the sampling profiler can follow
+# a request into thread pools
+delegated = weakref.WeakKeyDictionary()
+
+
+def _run_on_behalf(workers, function, args, kwargs):
+    worker = (greenlet.getcurrent(), native_threading().get_ident())
+    workers.append(worker)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        workers.remove(worker)
+
+
+def on_behalf(function):
+    """Wrap function for another thread to run as work of the calling thread"""
+    workers = delegated.setdefault(greenlet.getcurrent(), [])
+
+    def call(*args, **kwargs):
+        return _run_on_behalf(workers, function, args, kwargs)
+    return call
+
+
+def run_blocking(function, *args):
+    """Call a CPU-bound function without stalling the other green threads.
+
+    Under eventlet the call runs in eventlet's native thread pool while the
+    hub keeps serving other clients; otherwise it is called directly.
+    """
+    if is_green():
+        from eventlet import tpool
+        return tpool.execute(on_behalf(function), *args)
+    return function(*args)
+
+
+def server_options():
+    """Extra keyword arguments for socketio.run"""
+    if ASYNC_MODE == 'eventlet':
+        return {'max_size': SERVER_MAX_CONCURRENCY}
+    return {}
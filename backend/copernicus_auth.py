@@ -0,0 +1,130 @@
+import logging
+import os
+import threading
+import time
+
+import requests
+
+import http_client
+from upstreams import COPERNICUS_AUTH_URL
+
+logger = logging.getLogger(__name__)
+
+
+class CopernicusTokenManager:
+    """Process-wide cache for the CDSE access token.
+
+    The token is reused until refresh_margin seconds before it expires, then
+    renewed with the refresh_token grant while that is still valid, falling
+    back to a password grant. Concurrent callers that find the token stale
+    wait on a single refresh instead of each authenticating.
+    """
+
+    def __init__(self, auth_url=COPERNICUS_AUTH_URL, client_id="cdse-public", refresh_margin=60, timeout=30, session=None):
+        self.auth_url = auth_url
+        self.client_id = client_id
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self.session = session or http_client
+        self._refresh_lock = threading.Lock()
+
+        self._access_token = None
+        self._access_expires_at = 0
+        self._refresh_token = None
+        self._refresh_expires_at = 0
+        self._issued_at = None
+
+        self.password_grants = 0
+        self.refresh_grants = 0
+        self.failures = 0
+        self.cache_hits = 0
+
+    def get_token(self):
+        """Return a valid access token, authenticating only when needed"""
+        token = self._cached_token()
+        if token:
+            self.cache_hits += 1
+            return token
+
+        with self._refresh_lock:
+            # Whoever held the lock before us may already have refreshed
+            token = self._cached_token()
+            if token:
+                self.cache_hits += 1
+                return token
+            return self._renew()
+
+    def invalidate(self):
+        """Forget the access token, e.g. after upstream rejected it with 401"""
+        with self._refresh_lock:
+            self._access_token = None
+            self._access_expires_at = 0
+
+    def _cached_token(self):
+        if self._access_token and time.time() < self._access_expires_at - self.refresh_margin:
+            return self._access_token
+        return None
+
+    def _renew(self):
+        if self._refresh_token and time.time() < self._refresh_expires_at - self.refresh_margin:
+            token = self._grant({
+                "grant_type": "refresh_token",
+                "refresh_token": self._refresh_token,
+                "client_id": self.client_id
+            })
+            if token:
+                self.refresh_grants += 1
+                return token
+            logger.info("Copernicus refresh_token grant failed, falling back to password grant")
+
+        username = os.getenv("COPERNICUS_USERNAME")
+        password = os.getenv("COPERNICUS_PASSWORD")
+        if not username or not password:
+            logger.error("Copernicus credentials not found in environment variables")
+            self.failures += 1
+            return None
+
+        token = self._grant({
+            "username": username,
+            "password": password,
+            "grant_type": "password",
+            "client_id": self.client_id
+        })
+        if token:
+            self.password_grants += 1
+        return token
+
+    def _grant(self, auth_data):
+        try:
+            response = self.session.post(self.auth_url, data=auth_data, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error during authentication: {e}")
+            self.failures += 1
+            return None
+
+        logger.debug(f"Copernicus auth response status ({auth_data['grant_type']}): {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"Authentication failed: {response.status_code} - {response.text}")
+            self.failures += 1
+            return None
+
+        token_data = response.json()
+        now = time.time()
+        self._access_token = token_data["access_token"]
+        self._access_expires_at = now + token_data.get("expires_in", 0)
+        self._refresh_token = token_data.get("refresh_token")
+        self._refresh_expires_at = now + token_data.get("refresh_expires_in", 0)
+        self._issued_at = now
+        return self._access_token
+
+    def metrics(self):
+        now = time.time()
+        return {
+            "has_token": self._cached_token() is not None,
+            "token_age_seconds": now - self._issued_at if self._issued_at else None,
+            "expires_in_seconds": max(0, self._access_expires_at - now) if self._access_token else None,
+            "cache_hits": self.cache_hits,
+            "password_grants": self.password_grants,
+            "refresh_grants": self.refresh_grants,
+            "failures": self.failures,
+        }
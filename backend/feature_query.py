@@ -0,0 +1,172 @@
+import base64
+import json
+
+from response_cache import encode_json
+from simplify import reduction_from_args, simplify_feature
+
+MAX_PAGE_LIMIT = 10000
+# Always kept by an include list so every result is still a GeoJSON feature
+ALWAYS_INCLUDED = ('type', 'id')
+
+
+class CursorError(ValueError):
+    """Raised for a malformed cursor or one that no longer matches the cached data"""
+
+
+def encode_cursor(collection, offset, fingerprint):
+    state = json.dumps([collection, offset, fingerprint[:16]], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(state).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        collection, offset, fingerprint = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise CursorError("Invalid cursor")
+    if not isinstance(collection, str) or not isinstance(fingerprint, str) or not isinstance(offset, int) or offset < 0:
+        raise CursorError("Invalid cursor")
+    return collection, offset, fingerprint
+
+
+def parse_fields(value):
+    """STAC fields-extension style 'a,+b.c,-d' into (includes, excludes) tuples of dotted paths"""
+    includes, excludes = [], []
+    for field in (value or '').split(','):
+        # A literal '+' arrives as a space when it was not URL-encoded
+        field = field.strip()
+        if field.startswith('-'):
+            excludes.append(field[1:])
+        elif field:
+            includes.append(field.lstrip('+'))
+    return tuple(includes), tuple(excludes)
+
+
+def _copy_path(source, target, path):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        source = source.get(key)
+        if not isinstance(source, dict):
+            return
+        target = target.setdefault(key, {})
+    if keys[-1] in source:
+        target[keys[-1]] = source[keys[-1]]
+
+
+def _delete_path(target, path):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        target = target.get(key)
+        if not isinstance(target, dict):
+            return
+    target.pop(keys[-1], None)
+
+
+def project_feature(feature, includes=(), excludes=()):
+    """Apply include/exclude paths to a (freshly decoded) feature"""
+    if includes:
+        projected = {}
+        for path in ALWAYS_INCLUDED + includes:
+            _copy_path(feature, projected, path)
+        feature = projected
+    for path in excludes:
+        _delete_path(feature, path)
+    return feature
+
+
+class FeatureQuery:
+    """Collection selection, field projection, simplification and paging for /fetch_demo_data"""
+
+    def __init__(self, collections=None, includes=(), excludes=(), limit=None, cursor=None, reduction=None):
+        self.collections = collections
+        self.includes = includes
+        self.excludes = excludes
+        self.limit = limit
+        self.cursor = cursor
+        self.reduction = reduction
+
+    @classmethod
+    def from_args(cls, args):
+        """Parse the query string; raises ValueError for invalid parameters"""
+        collections = None
+        if args.get('collections') not in (None, '', '*'):
+            collections = tuple(sorted({name.strip() for name in args['collections'].split(',') if name.strip()}))
+
+        limit = None
+        if args.get('limit') is not None:
+            limit = int(args['limit'])
+            if not 1 <= limit <= MAX_PAGE_LIMIT:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+
+        cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+        includes, excludes = parse_fields(args.get('fields'))
+        return cls(collections, includes, excludes, limit, cursor, reduction_from_args(args))
+
+    @property
+    def paginated(self):
+        return self.limit is not None or self.cursor is not None
+
+    def is_default(self):
+        return (self.collections is None and not self.includes and not self.excludes
+                and not self.paginated and self.reduction is None)
+
+    def cache_key(self):
+        return (self.collections, self.includes, self.excludes, self.limit, self.cursor, self.reduction)
+
+    def collection_names(self, stores):
+        names = sorted(stores, key=str)
+        if self.collections is None:
+            return names
+        return [name for name in names if str(name) in self.collections]
+
+    def page_slices(self, stores):
+        """[(collection, start, stop)] of this page and the cursor of the next one, or None"""
+        names = self.collection_names(stores)
+        start_offset = 0
+        if self.cursor is not None:
+            collection, start_offset, fingerprint = self.cursor
+            position = next((i for i, name in enumerate(names) if str(name) == collection), None)
+            if position is None or stores[names[position]].fingerprint[:16] != fingerprint:
+                raise CursorError("Cursor has expired, the data was reloaded")
+            names = names[position:]
+
+        remaining = self.limit or MAX_PAGE_LIMIT
+        slices = []
+        for position, name in enumerate(names):
+            store = stores[name]
+            start = start_offset if position == 0 else 0
+            if remaining == 0:
+                return slices, encode_cursor(str(name), start, store.fingerprint)
+            stop = min(len(store), start + remaining)
+            slices.append((name, start, stop))
+            remaining -= stop - start
+            if stop < len(store):
+                return slices, encode_cursor(str(name), stop, store.fingerprint)
+        return slices, None
+
+    def _features_json(self, store, start, stop):
+        if not self.includes and not self.excludes and self.reduction is None:
+            # Untouched features are sliced straight out of the stored encoding
+            return store.raw_json_array(start, stop)
+        features = []
+        for index in range(start, stop):
+            feature = store.feature(index)
+            if self.reduction is not None:
+                feature = simplify_feature(feature, *self.reduction)
+            features.append(project_feature(feature, self.includes, self.excludes))
+        return encode_json(features)
+
+    def _collections_json(self, stores, slices):
+        parts = []
+        for name, start, stop in slices:
+            key = name if isinstance(name, str) else json.dumps(name)
+            parts.append(json.dumps(key).encode() + b':' + self._features_json(stores[name], start, stop))
+        return b'{' + b','.join(parts) + b'}'
+
+    def payload(self, stores):
+        """Encoded response body; paginated queries are wrapped with their next_cursor"""
+        if not self.paginated:
+            names = self.collection_names(stores)
+            return self._collections_json(stores, [(name, 0, len(stores[name])) for name in names])
+        slices, next_cursor = self.page_slices(stores)
+        return (b'{"collections":' + self._collections_json(stores, slices) +
+                b',"next_cursor":' + json.dumps(next_cursor).encode() + b'}')
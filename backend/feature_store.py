@@ -0,0 +1,380 @@
+import hashlib
+import json
+import logging
+import os
+from array import array
+from datetime import datetime, timezone
+
+from spatial_index import FootprintIndex
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+NO_MONTH = -1
+RAW_SEPARATOR = b','
+
+# Typed array columns of a CollectionStore, in the order they are persisted
+ARRAY_COLUMNS = (
+    'epochs', 'months', 'cloud_cover', 'resolution', 'constellation_codes', 'sensor_type_codes',
+    'coords', 'ring_offsets', 'geometry_offsets', 'geometry_keys', 'raw_offsets',
+)
+
+# String columns, persisted with pack_strings
+STRING_COLUMNS = ('ids', 'datetimes')
+STRING_NONE, STRING_TEXT, STRING_JSON = 0, 1, 2
+
+# Footprints whose vertices agree after snapping to this grid (in degrees)
+# share a geometry key; None keeps exact coordinate identity
+DEFAULT_SNAP_TOLERANCE = float(os.getenv('GEOMETRY_SNAP_TOLERANCE', 0)) or None
+
+
+def _number(value, default):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return default
+
+
+def geometry_key(coords, ring_sizes, snap_tolerance=None):
+    """64-bit identity of a footprint from its flat xy coordinates and ring sizes"""
+    digest = hashlib.blake2b(array('I', ring_sizes).tobytes(), digest_size=8)
+    if snap_tolerance:
+        digest.update(array('q', (round(value / snap_tolerance) for value in coords)).tobytes())
+    else:
+        digest.update(array('d', coords).tobytes())
+    return int.from_bytes(digest.digest(), 'little', signed=True)
+
+
+def _parse_datetime(datetime_str):
+    feature_date = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
+    if feature_date.tzinfo is None:
+        feature_date = feature_date.replace(tzinfo=timezone.utc)
+    return feature_date
+
+
+class Categories:
+    """Maps categorical labels to small integer codes in first-seen order"""
+
+    def __init__(self, labels=None):
+        self.labels = list(labels or [])
+        self._codes = {label: code for code, label in enumerate(self.labels)}
+
+    def code(self, label):
+        code = self._codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self._codes[label] = code
+            self.labels.append(label)
+        return code
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class StringColumn:
+    """Read-only sequence of optional strings packed by pack_strings, decoded on access.
+
+    Lets stores attached to a memory-mapped snapshot share their ids and
+    datetimes between processes instead of each holding a list of str.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _item(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        tag = self.data[start]
+        if tag == STRING_NONE:
+            return None
+        value = bytes(self.data[start + 1:end])
+        return value.decode() if tag == STRING_TEXT else json.loads(value)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("StringColumn index out of range")
+        return self._item(index)
+
+    def __iter__(self):
+        return (self._item(index) for index in range(len(self)))
+
+
+def pack_strings(values):
+    """(data, offsets) of a list of optional strings: a tag byte then the UTF-8 text of each.
+
+    Values that are neither str nor None (a numeric id, say) are kept as JSON.
+    """
+    data = bytearray()
+    offsets = array('Q', [0])
+    for value in values:
+        if value is None:
+            data.append(STRING_NONE)
+        elif isinstance(value, str):
+            data.append(STRING_TEXT)
+            data += value.encode()
+        else:
+            data.append(STRING_JSON)
+            data += json.dumps(value).encode()
+        offsets.append(len(data))
+    return data, offsets
+
+
+def _copy_column(column, start, stop):
+    # Attached snapshots hold memoryviews; slices must be real arrays so
+    # that they can be pickled to the summary process pool
+    part = column[start:stop]
+    return part if isinstance(part, array) else array(part.format, part.tobytes())
+
+
+class CollectionStore:
+    """Column-oriented copy of one STAC collection.
+
+    The properties used by the summaries live in typed arrays, polygon
+    footprints are flattened into one coordinate buffer with ring offsets,
+    and the original feature is only kept as compact JSON so it can be
+    decoded (or streamed as-is) when a client asks for the raw feature.
+    """
+
+    def __init__(self, name, keep_raw=True, snap_tolerance=DEFAULT_SNAP_TOLERANCE):
+        self.name = name
+        self.keep_raw = keep_raw
+        self.snap_tolerance = snap_tolerance
+
+        self.ids = []
+        self.datetimes = []                  # original ISO strings, None when missing
+        self.epochs = array('d')             # seconds since the epoch, NaN when missing
+        self.months = array('i')             # year * 12 + month - 1, NO_MONTH when missing
+        self.cloud_cover = array('d')        # 0 when missing, as in summarize_collection
+        self.resolution = array('d')         # NaN when missing
+        self.constellations = Categories()
+        self.constellation_codes = array('H')
+        self.sensor_types = Categories()
+        self.sensor_type_codes = array('H')
+
+        # Footprints: feature i owns rings geometry_offsets[i]:geometry_offsets[i + 1],
+        # ring r owns points ring_offsets[r]:ring_offsets[r + 1] of the xy buffer.
+        self.coords = array('d')
+        self.ring_offsets = array('I', [0])
+        self.geometry_offsets = array('I', [0])
+        # Footprint identity computed once at ingest, for grouping by location
+        self.geometry_keys = array('q')
+
+        # Raw features, each followed by RAW_SEPARATOR so that any contiguous
+        # slice of the buffer is the body of a JSON array.
+        self.raw = bytearray()
+        self.raw_offsets = array('Q', [0])
+        self._digest = hashlib.blake2b(digest_size=16)
+
+        # Footprint index, built once the store is complete (see build_index)
+        self.index = None
+
+    @classmethod
+    def from_features(cls, features, name=None, keep_raw=True, snap_tolerance=DEFAULT_SNAP_TOLERANCE):
+        store = cls(name, keep_raw=keep_raw, snap_tolerance=snap_tolerance)
+        store.extend(features)
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, features):
+        """Ingest a list of STAC features"""
+        for feature in features:
+            self.append(feature)
+
+    def append(self, feature):
+        index = len(self.ids)
+        properties = feature.get('properties', {})
+
+        self.ids.append(feature.get('id', f'Image_{index}'))
+
+        datetime_str = properties.get('datetime')
+        self.datetimes.append(datetime_str)
+        if datetime_str:
+            feature_date = _parse_datetime(datetime_str)
+            self.epochs.append(feature_date.timestamp())
+            self.months.append(feature_date.year * 12 + feature_date.month - 1)
+        else:
+            self.epochs.append(NAN)
+            self.months.append(NO_MONTH)
+
+        self.cloud_cover.append(_number(properties.get('cloud_cover', 0), 0.0))
+        self.resolution.append(_number(properties.get('resolution'), NAN))
+        self.constellation_codes.append(self.constellations.code(properties.get('constellation', 'unknown')))
+        self.sensor_type_codes.append(self.sensor_types.code(properties.get('sensor_type', 'unknown')))
+
+        geometry = feature.get('geometry') or {}
+        coords = []
+        ring_sizes = []
+        if geometry.get('type', 'Polygon') == 'Polygon':
+            for ring in geometry.get('coordinates') or []:
+                for point in ring:
+                    coords.append(point[0])
+                    coords.append(point[1])
+                ring_sizes.append(len(ring))
+        self.coords.extend(coords)
+        for ring_size in ring_sizes:
+            self.ring_offsets.append(self.ring_offsets[-1] + ring_size)
+        self.geometry_offsets.append(len(self.ring_offsets) - 1)
+        self.geometry_keys.append(geometry_key(coords, ring_sizes, self.snap_tolerance) if ring_sizes else 0)
+
+        if self.keep_raw:
+            encoded = json.dumps(feature, separators=(',', ':')).encode()
+            self._digest.update(encoded)
+            self.raw += encoded
+            self.raw += RAW_SEPARATOR
+            self.raw_offsets.append(len(self.raw))
+
+    @property
+    def fingerprint(self):
+        if self._digest is None:
+            return self._fingerprint
+        return self._digest.hexdigest()
+
+    def __getstate__(self):
+        # Hash objects cannot be pickled and the index is cheap to rebuild
+        state = self.__dict__.copy()
+        state['_fingerprint'] = self.fingerprint
+        state['_digest'] = None
+        state['index'] = None
+        return state
+
+    def slice(self, start, stop):
+        """Columns of features [start, stop) as a new store, without the raw features"""
+        stop = min(stop, len(self))
+        part = CollectionStore(self.name, keep_raw=False, snap_tolerance=self.snap_tolerance)
+        part.ids = self.ids[start:stop]
+        part.datetimes = self.datetimes[start:stop]
+        part.epochs = _copy_column(self.epochs, start, stop)
+        part.months = _copy_column(self.months, start, stop)
+        part.cloud_cover = _copy_column(self.cloud_cover, start, stop)
+        part.resolution = _copy_column(self.resolution, start, stop)
+        part.constellations = self.constellations
+        part.constellation_codes = _copy_column(self.constellation_codes, start, stop)
+        part.sensor_types = self.sensor_types
+        part.sensor_type_codes = _copy_column(self.sensor_type_codes, start, stop)
+
+        first_ring, end_ring = self.geometry_offsets[start], self.geometry_offsets[stop]
+        first_point, end_point = self.ring_offsets[first_ring], self.ring_offsets[end_ring]
+        part.coords = _copy_column(self.coords, 2 * first_point, 2 * end_point)
+        part.ring_offsets = array('I', (offset - first_point for offset in self.ring_offsets[first_ring:end_ring + 1]))
+        part.geometry_offsets = array('I', (offset - first_ring for offset in self.geometry_offsets[start:stop + 1]))
+        part.geometry_keys = _copy_column(self.geometry_keys, start, stop)
+        return part
+
+    def feature(self, index):
+        """Materialize the original feature dict"""
+        if not self.keep_raw:
+            raise ValueError(f"Raw features were not kept for collection {self.name}")
+        return json.loads(bytes(self.raw[self.raw_offsets[index]:self.raw_offsets[index + 1] - 1]))
+
+    def features(self):
+        return [self.feature(index) for index in range(len(self))]
+
+    def raw_json_array(self, start=0, stop=None):
+        """Encoded JSON array of the raw features in [start, stop)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return b'[]'
+        return b'[' + bytes(self.raw[self.raw_offsets[start]:self.raw_offsets[stop] - 1]) + b']'
+
+    def raw_json_items(self, indexes):
+        """Encoded JSON array of the raw features at the given indexes"""
+        offsets = self.raw_offsets
+        return b'[' + b','.join(bytes(self.raw[offsets[index]:offsets[index + 1] - 1]) for index in indexes) + b']'
+
+    def build_index(self):
+        """Build the spatial index over all footprints currently in the store"""
+        self.index = FootprintIndex(self)
+        return self.index
+
+    def ring_points(self, ring):
+        start, end = self.ring_offsets[ring], self.ring_offsets[ring + 1]
+        return self.coords[2 * start:2 * end:2], self.coords[2 * start + 1:2 * end:2]
+
+    def has_polygon(self, index):
+        return self.geometry_offsets[index + 1] > self.geometry_offsets[index]
+
+    def polygon(self, index):
+        """Polygon coordinates of a feature as nested lists, or None"""
+        first_ring, end_ring = self.geometry_offsets[index], self.geometry_offsets[index + 1]
+        if first_ring == end_ring:
+            return None
+        rings = []
+        for ring in range(first_ring, end_ring):
+            lngs, lats = self.ring_points(ring)
+            rings.append([[lng, lat] for lng, lat in zip(lngs, lats)])
+        return rings
+
+    def bbox(self, index):
+        """[min_lng, min_lat, max_lng, max_lat] of the outer ring, or None"""
+        if not self.has_polygon(index):
+            return None
+        lngs, lats = self.ring_points(self.geometry_offsets[index])
+        if not lngs:
+            return None
+        return [min(lngs), min(lats), max(lngs), max(lats)]
+
+    def centroid(self, index):
+        """Vertex average of the outer ring, or None"""
+        if not self.has_polygon(index):
+            return None
+        lngs, lats = self.ring_points(self.geometry_offsets[index])
+        if not lngs:
+            return None
+        return [sum(lngs) / len(lngs), sum(lats) / len(lats)]
+
+    def nbytes(self):
+        columns = [getattr(self, column) for column in ARRAY_COLUMNS]
+        return len(self.raw) + sum(column.itemsize * len(column) for column in columns)
+
+
+def ingest_features(stores, features):
+    """Append features to the store of the collection each one belongs to"""
+    for feature in features:
+        collection = feature.get('collection')
+        store = stores.get(collection)
+        if store is None:
+            store = stores[collection] = CollectionStore(collection)
+        store.append(feature)
+    return stores
+
+
+def build_stores(grouped_data):
+    """Convert {collection: [features]} into {collection: CollectionStore}"""
+    return {name: CollectionStore.from_features(features, name) for name, features in grouped_data.items()}
+
+
+def stores_json_chunks(stores):
+    """stores_json as a list of chunks, with the features as views into the raw buffers"""
+    chunks = []
+    for name in sorted(stores, key=str):
+        key = name if isinstance(name, str) else json.dumps(name)
+        store = stores[name]
+        chunks.append((b',' if chunks else b'{') + json.dumps(key).encode() + b':[')
+        if len(store):
+            chunks.append(memoryview(store.raw)[:store.raw_offsets[len(store)] - 1])
+        chunks.append(b']')
+    chunks.append(b'}' if chunks else b'{}')
+    return chunks
+
+
+def stores_json(stores):
+    """Encode {collection: [raw features]} without decoding the stored features"""
+    parts = []
+    for name in sorted(stores, key=str):
+        key = name if isinstance(name, str) else json.dumps(name)
+        parts.append(json.dumps(key).encode() + b':' + stores[name].raw_json_array())
+    return b'{' + b','.join(parts) + b'}'
+
+
+
+def stores_fingerprint(stores):
+    """Fingerprints of the stores in name order, to key data derived from all of them"""
+    return tuple(stores[name].fingerprint for name in sorted(stores, key=str))
@@ -1,14 +1,30 @@
+import atexit
 import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
+from collections import Counter, defaultdict
+
+from concurrency import is_green, run_blocking
+from feature_store import NO_MONTH, CollectionStore
+from simplify import simplify_polygon
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
-def summarize_collection(features):
-    summary = {
-        "total_features": len(features),
+# Collections smaller than this are summarized in-process even when a
+# parallel summary is requested
+PARALLEL_SHARD_SIZE = int(os.getenv('SUMMARY_SHARD_SIZE', 50000))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def _empty_summary(total_features=0):
+    return {
+        "total_features": total_features,
         "average_cloud_cover": 0,
         "average_resolution": 0,
         "constellations": set(),
@@ -28,139 +44,302 @@ def summarize_collection(features):
         "sensor_coverage": {}
     }
 
-    if not features:
-        return summary
+class SummaryAccumulator:
+    """Partial collection summary that can be updated shard by shard and merged.
+
+    Accumulators must be updated (or merged) in feature order; the result is
+    then the same as summarizing all features at once, except that the
+    averages may differ in the last bits when sums from several shards are
+    added together.
+    """
+
+    def __init__(self, now=None):
+        now = now or datetime.now(timezone.utc)
+        self.thirty_days_ago = (now - timedelta(days=30)).timestamp()
+
+        self.total_features = 0
+        self.total_cloud_cover = 0
+        self.total_resolution = 0
+        self.features_last_30_days = 0
+        self.high_resolution = 0
+        self.very_high_resolution = 0
+        self.first_image_coordinates = None
+        self.constellation_counts = {}
+        self.sensor_counts = {}
+        self.month_counts = {}           # (year, month) -> count, in first-seen order
+        self.dates = set()
+        # geometry key -> [centroid, polygon, image_count, earliest, latest,
+        #                  constellations, sensor_types, sample_images]
+        self.locations = {}
+
+    def update(self, features):
+        """Fold a list of STAC features or a CollectionStore into the summary"""
+        store = features if isinstance(features, CollectionStore) else CollectionStore.from_features(features, keep_raw=False)
+        if not len(store):
+            return self
+
+        if not self.total_features:
+            # Get coordinates of the first image
+            self.first_image_coordinates = store.polygon(0)
+        self.total_features += len(store)
 
-    total_cloud_cover = 0
-    total_resolution = 0
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    
-    # Track coordinates for spatial analysis
-    coordinate_groups = defaultdict(list)
-    dates = []
-    constellation_counts = defaultdict(int)
-    sensor_counts = defaultdict(int)
-
-    for index, feature in enumerate(features):
-        properties = feature.get('properties', {})
-        datetime_str = properties.get('datetime')
-        feature_date = datetime.fromisoformat(datetime_str.replace('Z', '+00:00')) if datetime_str else None
-
-        # Update cloud cover and resolution
-        total_cloud_cover += properties.get('cloud_cover', 0)
-        total_resolution += properties.get('resolution', 0)
-
-        # Update constellations and sensor types
-        constellation = properties.get('constellation', 'unknown')
-        sensor_type = properties.get('sensor_type', 'unknown')
-        summary["constellations"].add(constellation)
-        summary["sensor_types"].add(sensor_type)
-        
-        # Count constellations and sensors
-        constellation_counts[constellation] += 1
-        sensor_counts[sensor_type] += 1
-
-        # Track dates for temporal analysis
-        if datetime_str:
-            dates.append(datetime_str)
+        constellation_labels = store.constellations.labels
+        sensor_labels = store.sensor_types.labels
+
+        # Constellations and sensor types, counted on their category codes
+        for code, count in Counter(store.constellation_codes).items():
+            label = constellation_labels[code]
+            self.constellation_counts[label] = self.constellation_counts.get(label, 0) + count
+        for code, count in Counter(store.sensor_type_codes).items():
+            label = sensor_labels[code]
+            self.sensor_counts[label] = self.sensor_counts.get(label, 0) + count
 
         # Count features per year and per month
-        if feature_date:
-            year = feature_date.year
-            month = feature_date.month
-
-            # Initialize the year in features_per_year if not present
-            if year not in summary["features_per_year"]:
-                summary["features_per_year"][year] = {}
-
-            # Count features per month within the year
-            summary["features_per_year"][year][month] = summary["features_per_year"][year].get(month, 0) + 1
-
-            # Count features in the last 30 days
-            if feature_date >= thirty_days_ago:
-                summary["features_last_30_days"] += 1
-
-        # Categorize by resolution
-        resolution = properties.get('resolution', float('inf'))
-        if resolution <= 1:
-            summary["very_high_resolution"] += 1
-        elif resolution <= 5:
-            summary["high_resolution"] += 1
-
-        # Get coordinates of the first image
-        if index == 0:
-            geometry = feature.get('geometry', {})
-            summary["first_image_coordinates"] = geometry.get('coordinates')
-        
-        # Group by coordinates for spatial analysis
-        geometry = feature.get('geometry', {})
-        if geometry and 'coordinates' in geometry:
-            coords = geometry['coordinates']
-            if coords:
-                # Convert to string for grouping
-                import json
-                coord_str = json.dumps(coords, sort_keys=True)
-                coordinate_groups[coord_str].append({
-                    'id': feature.get('id', f'Image_{index}'),
-                    'date': datetime_str,
-                    'constellation': constellation,
-                    'sensor_type': sensor_type,
-                    'cloud_cover': properties.get('cloud_cover', 0),
-                    'resolution': properties.get('resolution', 0)
-                })
-
-    # Calculate spatial analysis
-    summary["unique_locations"] = len(coordinate_groups)
-    summary["locations_with_multiple_images"] = sum(1 for group in coordinate_groups.values() if len(group) > 1)
-    
-    # Find ALL locations (including single-image locations)
-    for coord_str, images in coordinate_groups.items():
-        # Parse the coordinates back to get the actual coordinates
-        import json
-        coords = json.loads(coord_str)
-        
-        # Calculate centroid of the polygon for the point location
-        if coords and len(coords) > 0 and len(coords[0]) > 0:
-            # Calculate centroid of the first ring of the polygon
-            lngs = [point[0] for point in coords[0]]
-            lats = [point[1] for point in coords[0]]
-            centroid_lng = sum(lngs) / len(lngs)
-            centroid_lat = sum(lats) / len(lats)
-            
+        for month_index, count in Counter(store.months).items():
+            if month_index == NO_MONTH:
+                continue
+            year, month = divmod(month_index, 12)
+            self.month_counts[(year, month + 1)] = self.month_counts.get((year, month + 1), 0) + count
+
+        # Count features in the last 30 days (missing dates are NaN and never match)
+        thirty_days_ago = self.thirty_days_ago
+        self.features_last_30_days += sum(1 for epoch in store.epochs if epoch >= thirty_days_ago)
+
+        # Categorize by resolution (missing resolutions are NaN and never match)
+        self.very_high_resolution += sum(1 for resolution in store.resolution if resolution <= 1)
+        self.high_resolution += sum(1 for resolution in store.resolution if 1 < resolution <= 5)
+
+        # Missing resolutions count as 0 towards the average
+        for cloud_cover in store.cloud_cover:
+            self.total_cloud_cover += cloud_cover
+        for resolution in store.resolution:
+            if resolution == resolution:
+                self.total_resolution += resolution
+
+        self.dates.update(datetime_str for datetime_str in store.datetimes if datetime_str)
+
+        # Group by footprint for spatial analysis, using the geometry keys
+        # computed at ingest
+        coordinate_groups = defaultdict(list)
+        geometry_keys = store.geometry_keys
+        geometry_offsets = store.geometry_offsets
+        for index in range(len(store)):
+            if geometry_offsets[index + 1] > geometry_offsets[index]:
+                coordinate_groups[geometry_keys[index]].append(index)
+
+        for key, indexes in coordinate_groups.items():
+            dates = [store.datetimes[index] for index in indexes if store.datetimes[index]]
+            location = self.locations.get(key)
+            if location is None:
+                first = indexes[0]
+                location = self.locations[key] = [
+                    store.centroid(first), store.polygon(first), 0, None, None, set(), set(), []
+                ]
+            self._merge_location(location, [
+                None, None, len(indexes),
+                min(dates) if dates else None,
+                max(dates) if dates else None,
+                {constellation_labels[store.constellation_codes[index]] for index in indexes},
+                {sensor_labels[store.sensor_type_codes[index]] for index in indexes},
+                [_sample_image(store, index) for index in indexes[:3]]
+            ])
+        return self
+
+    def merge(self, other):
+        """Fold in the accumulator of the features that follow this one's"""
+        if not other.total_features:
+            return self
+        if not self.total_features:
+            self.first_image_coordinates = other.first_image_coordinates
+        self.total_features += other.total_features
+        self.total_cloud_cover += other.total_cloud_cover
+        self.total_resolution += other.total_resolution
+        self.features_last_30_days += other.features_last_30_days
+        self.high_resolution += other.high_resolution
+        self.very_high_resolution += other.very_high_resolution
+        for label, count in other.constellation_counts.items():
+            self.constellation_counts[label] = self.constellation_counts.get(label, 0) + count
+        for label, count in other.sensor_counts.items():
+            self.sensor_counts[label] = self.sensor_counts.get(label, 0) + count
+        for year_month, count in other.month_counts.items():
+            self.month_counts[year_month] = self.month_counts.get(year_month, 0) + count
+        self.dates |= other.dates
+        for key, other_location in other.locations.items():
+            location = self.locations.get(key)
+            if location is None:
+                self.locations[key] = [*other_location[:5], set(other_location[5]), set(other_location[6]), list(other_location[7])]
+            else:
+                self._merge_location(location, other_location)
+        return self
+
+    @staticmethod
+    def _merge_location(location, other):
+        location[2] += other[2]
+        if other[3] is not None:
+            location[3] = other[3] if location[3] is None else min(location[3], other[3])
+            location[4] = other[4] if location[4] is None else max(location[4], other[4])
+        location[5] |= other[5]
+        location[6] |= other[6]
+        location[7].extend(other[7][:3 - len(location[7])])
+
+    def result(self):
+        summary = _empty_summary(self.total_features)
+        if not self.total_features:
+            return summary
+
+        # Sorted, so identical data encodes (and gets an ETag) the same in
+        # every process whatever its hash seed
+        summary["constellations"] = _sorted_labels(self.constellation_counts)
+        summary["sensor_types"] = _sorted_labels(self.sensor_counts)
+        for (year, month), count in self.month_counts.items():
+            summary["features_per_year"].setdefault(year, {})[month] = count
+        summary["features_last_30_days"] = self.features_last_30_days
+        summary["high_resolution"] = self.high_resolution
+        summary["very_high_resolution"] = self.very_high_resolution
+        summary["first_image_coordinates"] = self.first_image_coordinates
+
+        # Spatial analysis
+        summary["unique_locations"] = len(self.locations)
+        summary["locations_with_multiple_images"] = sum(1 for location in self.locations.values() if location[2] > 1)
+
+        # Find ALL locations (including single-image locations)
+        for centroid, polygon, image_count, earliest, latest, constellations, sensor_types, sample_images in self.locations.values():
+            if centroid is None:
+                continue
             summary["multi_image_locations"].append({
                 'location_id': f"Location_{len(summary['multi_image_locations']) + 1}",
-                'coordinates': [centroid_lng, centroid_lat],  # Centroid coordinates
-                'polygon_coordinates': coords,  # Full polygon coordinates
-                'image_count': len(images),
+                'coordinates': centroid,  # Centroid coordinates
+                'polygon_coordinates': polygon,  # Full polygon coordinates
+                'image_count': image_count,
                 'date_range': {
-                    'earliest': min(img['date'] for img in images if img['date']),
-                    'latest': max(img['date'] for img in images if img['date'])
-                } if len(images) > 0 and any(img['date'] for img in images) else None,
-                'constellations': list(set(img['constellation'] for img in images)),
-                'sensor_types': list(set(img['sensor_type'] for img in images)),
-                'sample_images': images[:3]  # Show first 3 images
+                    'earliest': earliest,
+                    'latest': latest
+                } if earliest is not None else None,
+                'constellations': _sorted_labels(constellations),
+                'sensor_types': _sorted_labels(sensor_types),
+                'sample_images': sample_images  # Show first 3 images
             })
 
-    # Temporal analysis
-    if dates:
-        summary["date_range"] = {
-            'earliest': min(dates),
-            'latest': max(dates),
-            'total_days': len(set(dates)),
-            'date_span_days': (datetime.fromisoformat(max(dates).replace('Z', '+00:00')) - 
-                              datetime.fromisoformat(min(dates).replace('Z', '+00:00'))).days
-        }
+        # Temporal analysis
+        if self.dates:
+            earliest, latest = min(self.dates), max(self.dates)
+            summary["date_range"] = {
+                'earliest': earliest,
+                'latest': latest,
+                'total_days': len(self.dates),
+                'date_span_days': (datetime.fromisoformat(latest.replace('Z', '+00:00')) - 
+                                  datetime.fromisoformat(earliest.replace('Z', '+00:00'))).days
+            }
+
+        # Constellation and sensor coverage
+        summary["constellation_coverage"] = dict(self.constellation_counts)
+        summary["sensor_coverage"] = dict(self.sensor_counts)
+
+        summary["average_cloud_cover"] = self.total_cloud_cover / self.total_features
+        summary["average_resolution"] = self.total_resolution / self.total_features
+        return summary
+
+def _sorted_labels(labels):
+    # Labels come straight from feature properties and need not all be strings
+    return sorted(labels, key=lambda label: (type(label).__name__, str(label)))
+
+def summarize_collection(features):
+    # Accept either raw STAC features or an already ingested CollectionStore
+    return SummaryAccumulator().update(features).result()
+
+def simplify_summary_geometry(summary, tolerance, method='douglas_peucker'):
+    """Copy of a summary with its footprint polygons simplified and quantized"""
+    simplified = dict(summary)
+    if summary.get("first_image_coordinates"):
+        simplified["first_image_coordinates"] = simplify_polygon(summary["first_image_coordinates"], tolerance, method)
+    simplified["multi_image_locations"] = [
+        {**location, 'polygon_coordinates': simplify_polygon(location['polygon_coordinates'], tolerance, method)}
+        for location in summary.get("multi_image_locations", [])
+    ]
+    return simplified
+
+def _summarize_shard(shard, now):
+    return SummaryAccumulator(now).update(shard)
+
+def _get_process_pool(max_workers=None):
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                if is_green():
+                    # The pool's threads and pipes are green too, so the request
+                    # threads drive it directly. Its workers are spawned, a forked
+                    # one would inherit the hub and every green thread on it.
+                    # Green threads skip the pool's own exit hook, without which
+                    # the interpreter waits for the workers forever
+                    _process_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+                    atexit.register(_process_pool.shutdown)
+                else:
+                    _process_pool = ProcessPoolExecutor(max_workers=max_workers)
+    return _process_pool
 
-    # Constellation and sensor coverage
-    summary["constellation_coverage"] = dict(constellation_counts)
-    summary["sensor_coverage"] = dict(sensor_counts)
+def summarize_parallel(features, shard_size=PARALLEL_SHARD_SIZE, max_workers=None):
+    """summarize_collection fanned out over a process pool, one shard per task"""
+    store = features if isinstance(features, CollectionStore) else CollectionStore.from_features(features, keep_raw=False)
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers < 2 or len(store) < 2 * shard_size:
+        return run_blocking(summarize_collection, store)
 
-    summary["average_cloud_cover"] = total_cloud_cover / summary["total_features"]
-    summary["average_resolution"] = total_resolution / summary["total_features"]
-    summary["constellations"] = list(summary["constellations"])
-    summary["sensor_types"] = list(summary["sensor_types"])
+    # Every shard uses the same "now" so the 30 day window lines up
+    now = datetime.now(timezone.utc)
+    shards = [store.slice(start, start + shard_size) for start in range(0, len(store), shard_size)]
+    accumulator = SummaryAccumulator(now)
+    for partial in _get_process_pool(max_workers).map(_summarize_shard, shards, [now] * len(shards)):
+        accumulator.merge(partial)
+    return accumulator.result()
 
-    return summary
+def summarize_offloaded(features):
+    """Like summarize_parallel, but small collections also leave the request
+    thread so several of them can be summarized at the same time"""
+    store = features if isinstance(features, CollectionStore) else CollectionStore.from_features(features, keep_raw=False)
+    max_workers = os.cpu_count() or 1
+    if max_workers < 2 or len(store) >= 2 * PARALLEL_SHARD_SIZE:
+        return summarize_parallel(store, max_workers=max_workers)
+    # Only the summary columns are shipped to the worker, not the raw features
+    return _get_process_pool(max_workers).submit(summarize_collection, store.slice(0, len(store))).result()
+
+def rollup_summaries(summaries):
+    """Totals across several collection summaries"""
+    constellation_coverage = Counter()
+    sensor_coverage = Counter()
+    earliest = latest = None
+    for summary in summaries:
+        constellation_coverage.update(summary.get("constellation_coverage", {}))
+        sensor_coverage.update(summary.get("sensor_coverage", {}))
+        date_range = summary.get("date_range") or {}
+        if date_range.get('earliest') and (earliest is None or date_range['earliest'] < earliest):
+            earliest = date_range['earliest']
+        if date_range.get('latest') and (latest is None or date_range['latest'] > latest):
+            latest = date_range['latest']
+
+    return {
+        "total_collections": len(summaries),
+        "total_features": sum(summary.get("total_features", 0) for summary in summaries),
+        "constellation_coverage": dict(constellation_coverage),
+        "sensor_coverage": dict(sensor_coverage),
+        "date_range": {
+            'earliest': earliest,
+            'latest': latest,
+            'date_span_days': (datetime.fromisoformat(latest.replace('Z', '+00:00')) -
+                               datetime.fromisoformat(earliest.replace('Z', '+00:00'))).days
+        } if earliest is not None else {}
+    }
+
+def _sample_image(store, index):
+    resolution = store.resolution[index]
+    return {
+        'id': store.ids[index],
+        'date': store.datetimes[index],
+        'constellation': store.constellations.labels[store.constellation_codes[index]],
+        'sensor_type': store.sensor_types.labels[store.sensor_type_codes[index]],
+        'cloud_cover': store.cloud_cover[index],
+        'resolution': resolution if resolution == resolution else 0
+    }
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import observe_upstream
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 10
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 8))   # distinct hosts kept pooled
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 16))          # keep-alive connections per host
+MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', 0.2))
+BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', 2.0))
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when a request budget runs out before the next attempt"""
+
+
+class Deadline:
+    """Total time budget shared by a sequence of upstream requests"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def timeout(self, per_request=None):
+        """Timeout for the next request: what is left of the budget, capped at per_request"""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request budget of {self.seconds}s exhausted")
+        return remaining if per_request is None else min(per_request, remaining)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide session so connections (and TLS sessions) are reused per host"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _backoff(attempt):
+    # Full jitter: sleep a random amount up to the exponential step
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def request(method, url, timeout=DEFAULT_TIMEOUT, deadline=None, retries=None, **kwargs):
+    """Send a request through the shared session.
+
+    Idempotent methods are retried on connection errors, timeouts and
+    429/5xx responses with jittered exponential backoff. When a Deadline is
+    given every attempt, and every backoff sleep, is drawn from its budget.
+    """
+    method = method.upper()
+    retries = MAX_RETRIES if retries is None else retries
+    if method not in IDEMPOTENT_METHODS:
+        retries = 0
+
+    attempt = 0
+    while True:
+        attempt_timeout = deadline.timeout(timeout) if deadline else timeout
+        started = time.perf_counter()
+        try:
+            response = get_session().request(method, url, timeout=attempt_timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            observe_upstream(url, started)
+            if attempt >= retries or not isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+                raise
+            logger.warning(f"{method} {url} failed ({e}), retrying")
+        else:
+            observe_upstream(url, started, response.status_code)
+            if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                return response
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+
+        delay = _backoff(attempt)
+        if deadline:
+            delay = min(delay, max(0, deadline.remaining()))
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
@@ -0,0 +1,263 @@
+import functools
+import math
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlsplit
+
+import upstreams
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(4 ** exponent for exponent in range(5, 14))   # 1 KiB .. 64 MiB
+
+# Upstream label of each configured base URL the backend calls, and of
+# the default hosts for links (e.g. search 'next' pages) outside of them
+UPSTREAM_PREFIXES = (
+    (upstreams.COPERNICUS_AUTH_URL, 'cdse_auth'),
+    (upstreams.COPERNICUS_STAC_SEARCH_URL, 'cdse_search'),
+    (upstreams.GOOGLE_NEWS_RSS_URL, 'google_news'),
+)
+UPSTREAM_HOSTS = {
+    'identity.dataspace.copernicus.eu': 'cdse_auth',
+    'catalogue.dataspace.copernicus.eu': 'cdse_search',
+    'news.google.com': 'google_news',
+}
+
+
+def upstream_name(url):
+    """Low-cardinality label for an upstream request URL"""
+    parts = urlsplit(url)
+    if url.startswith(upstreams.TERRAMONITOR_STAC_URL + '/') or parts.hostname == 'maps.terramonitor.com':
+        return 'terramonitor_items' if parts.path.endswith('/items') else 'terramonitor_collections'
+    for prefix, name in UPSTREAM_PREFIXES:
+        if url.startswith(prefix):
+            return name
+    host = parts.hostname or ''
+    return UPSTREAM_HOSTS.get(host, host)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """A metric family with one child per combination of label values.
+
+    Updates are plain increments without a lock. Green threads only switch
+    on I/O, so they cannot interleave with an update. OS threads
+    (SOCKETIO_ASYNC_MODE=threading) can, at worst, lose one increment to a
+    race, which is an acceptable trade for a lock-free hot path. Only
+    creating a child for new label values takes the lock.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        (REGISTRY if registry is None else registry).register(self)
+
+    def _child(self, labels):
+        child = self._children.get(labels)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(labels, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, child in sorted(self._children.items()):
+            lines.extend(self._render_child(labels, child))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return [0.0]
+
+    def inc(self, *labels, amount=1):
+        self._child(labels)[0] += amount
+
+    def value(self, *labels):
+        child = self._children.get(labels)
+        return child[0] if child else 0.0
+
+    def _render_child(self, labels, child):
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(child[0])}']
+
+
+class _HistogramChild:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(len(self.buckets))
+
+    def observe(self, value, *labels):
+        child = self._child(labels)
+        # Buckets hold plain counts; they are made cumulative when rendered
+        child.counts[bisect_left(self.buckets, value)] += 1
+        child.sum += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def _render_child(self, labels, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, child.counts):
+            cumulative += count
+            bucket_labels = _labels(self.labelnames, labels, f'le="{_number(bound)}"')
+            lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+        lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(child.sum)}')
+        lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class GaugeCollector:
+    """Gauges read at scrape time; collect() returns [(name, documentation, [(labels dict, value)])]"""
+
+    def __init__(self, collect, registry=None):
+        self.collect = collect
+        (REGISTRY if registry is None else registry).register(self)
+
+    def render(self):
+        lines = []
+        for name, documentation, samples in self.collect():
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} gauge')
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests by route, method and status', ('route', 'method', 'status'))
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'HTTP request latency by route', ('route',))
+HTTP_RESPONSE_SIZE = Histogram('http_response_size_bytes', 'HTTP response body size by route', ('route',), SIZE_BUCKETS)
+SOCKETIO_DURATION = Histogram('socketio_event_duration_seconds', 'Socket.IO handler latency by event', ('event',))
+SOCKETIO_ERRORS = Counter('socketio_event_errors_total', 'Socket.IO handlers that raised or emitted an error, by event', ('event',))
+UPSTREAM_DURATION = Histogram('upstream_request_duration_seconds', 'Upstream request latency (per attempt)', ('upstream',))
+UPSTREAM_REQUESTS = Counter('upstream_requests_total', 'Upstream requests by outcome: status class or error', ('upstream', 'outcome'))
+SUMMARY_DURATION = Histogram('summary_compute_seconds', 'Time to compute one collection summary')
+
+
+def observe_upstream(url, started, status=None):
+    """Record one upstream attempt; status None means it raised"""
+    upstream = upstream_name(url)
+    UPSTREAM_DURATION.observe(time.perf_counter() - started, upstream)
+    UPSTREAM_REQUESTS.inc(upstream, 'error' if status is None else f'{status // 100}xx')
+
+
+def instrument_app(app):
+    """Count and time every Flask request, labelled by its route pattern"""
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            HTTP_DURATION.observe(time.perf_counter() - started, route)
+            HTTP_REQUESTS.inc(route, request.method, str(response.status_code))
+            if response.content_length is not None:
+                HTTP_RESPONSE_SIZE.observe(response.content_length, route)
+        return response
+
+
+def instrument_event(event):
+    """Decorator timing a Socket.IO event handler"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                SOCKETIO_ERRORS.inc(event)
+                raise
+            finally:
+                SOCKETIO_DURATION.observe(time.perf_counter() - started, event)
+        return wrapper
+    return decorator
+
+
+def cache_gauges(caches):
+    """Gauges from the stats() of each cache in {name: cache}, read at scrape time"""
+    def collect():
+        stats = {name: cache.stats() for name, cache in caches.items()}
+        families = []
+        for key, name, documentation in (
+            ('hit_ratio', 'cache_hit_ratio', 'Share of lookups answered from the cache'),
+            ('entries', 'cache_entries', 'Entries held by the cache'),
+            ('bytes', 'cache_bytes', 'Bytes held by the cache'),
+        ):
+            samples = [({'cache': cache}, values[key]) for cache, values in stats.items() if key in values]
+            if samples:
+                families.append((name, documentation, samples))
+        return families
+    return GaugeCollector(collect)
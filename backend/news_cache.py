@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One upstream fetch that any number of callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class NewsCache:
+    """TTL cache for upstream news queries.
+
+    Entries are fresh for ttl seconds and may then be served stale for up to
+    stale_ttl more seconds while a single background fetch refreshes them.
+    Concurrent misses for the same key share one upstream fetch; if it
+    fails, every waiting caller gets the error.
+    """
+
+    def __init__(self, ttl=300, max_entries=128, stale_ttl=3600):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()   # key -> (stored_at, value)
+        self._inflight = {}             # key -> _Flight
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_fetches = 0
+        self.upstream_errors = 0
+        self.upstream_seconds_total = 0.0
+        self.upstream_seconds_max = 0.0
+        self.upstream_seconds_last = None
+
+    def get(self, key, fetch):
+        """Cached value for key, calling fetch() upstream when it is missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            flight = self._inflight.get(key)
+            if entry is not None:
+                age = now - entry[0]
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    if flight is None:
+                        flight = self._inflight[key] = _Flight()
+                        threading.Thread(target=self._fetch, args=(key, fetch, flight), daemon=True).start()
+                    return entry[1]
+
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if leader:
+            self._fetch(key, fetch, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _fetch(self, key, fetch, flight):
+        started = time.monotonic()
+        try:
+            flight.value = fetch()
+        except Exception as e:
+            flight.error = e
+            logger.warning(f"News fetch for {key!r} failed: {e}")
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self.upstream_fetches += 1
+            self.upstream_seconds_total += elapsed
+            self.upstream_seconds_max = max(self.upstream_seconds_max, elapsed)
+            self.upstream_seconds_last = elapsed
+            if flight.error is None:
+                self._entries[key] = (time.monotonic(), flight.value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self.upstream_errors += 1
+            del self._inflight[key]
+        flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            'upstream_fetches': self.upstream_fetches,
+            'upstream_errors': self.upstream_errors,
+            'upstream_latency_seconds': {
+                'last': self.upstream_seconds_last,
+                'avg': self.upstream_seconds_total / self.upstream_fetches if self.upstream_fetches else None,
+                'max': self.upstream_seconds_max,
+            },
+        }
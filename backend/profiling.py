@@ -0,0 +1,276 @@
+import functools
+import hmac
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+import greenlet
+
+import concurrency
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile-Token'
+PROFILE_HEADER = 'X-Profile'
+FOLDED_SUFFIX = '.folded'
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def _stack(frame, stop=None):
+    """Frame labels from the root down to frame, cut above the stop function"""
+    labels = []
+    while frame is not None:
+        if stop is not None and frame.f_code is stop:
+            break
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class _Target:
+    __slots__ = ('name', 'started', 'sample_after', 'greenlet', 'thread_id', 'stacks', 'samples')
+
+    def __init__(self, name, started, sample_after):
+        self.name = name
+        self.started = started
+        self.sample_after = sample_after
+        self.greenlet = greenlet.getcurrent()
+        self.thread_id = concurrency.native_threading().get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class Profile:
+    """Wall-clock samples of one request in folded-stack format"""
+
+    def __init__(self, name, elapsed, stacks, samples):
+        self.name = name
+        self.elapsed = elapsed
+        self.stacks = stacks
+        self.samples = samples
+
+    def folded(self):
+        """One 'root;...;leaf count' line per stack, as read by flamegraph.pl and speedscope"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Sampling profiler for individual requests.
+
+    A native sampler thread records the stack of each profiled request every
+    interval seconds, including time spent waiting on upstream sockets and
+    work handed to the thread pool by run_blocking. On-demand profiles are
+    sampled from the start; with slow_seconds set every request is a
+    candidate, sampled only once it has been running that long, and written
+    to a ring of at most ring_size files in directory when it ends.
+
+    Nothing is installed unless a token or slow_seconds is configured, and
+    the sampler thread only wakes while a request is due for sampling.
+    """
+
+    def __init__(self, token=None, slow_seconds=0, interval=0.005, directory=None, ring_size=50):
+        self.token = token or None
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.directory = directory
+        self.ring_size = ring_size
+        self._targets = {}
+        self._thread = None
+        self._wakeup = None
+        self._lock = None
+        self.captured = 0
+
+    @property
+    def enabled(self):
+        return self.token is not None or self.slow_seconds > 0
+
+    def authorized(self, token):
+        return self.token is not None and token is not None and hmac.compare_digest(token, self.token)
+
+    def _start_sampler(self):
+        threading = concurrency.native_threading()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def begin(self, name, on_demand=False):
+        """Start profiling the calling request; returns a handle for end()"""
+        if self._thread is None:
+            self._start_sampler()
+        started = time.perf_counter()
+        target = _Target(name, started, started if on_demand else started + self.slow_seconds)
+        self._targets[id(target)] = target
+        self._wakeup.set()
+        return target
+
+    def end(self, target):
+        """Stop profiling; returns the Profile, and captures it if the request was slow"""
+        with self._lock:
+            self._targets.pop(id(target), None)
+        elapsed = time.perf_counter() - target.started
+        profile = Profile(target.name, elapsed, target.stacks, target.samples)
+        if self.slow_seconds > 0 and elapsed >= self.slow_seconds and profile.samples:
+            self._capture(profile)
+        return profile
+
+    def _run(self):
+        while True:
+            targets = list(self._targets.values())
+            now = time.perf_counter()
+            due = [target for target in targets if target.sample_after <= now]
+            if due:
+                self._sample(due)
+                # time.sleep is green under eventlet; this is a native thread
+                self._wakeup.clear()
+                self._wakeup.wait(self.interval)
+                continue
+            self._wakeup.clear()
+            # Sleep until the next request crosses the slow threshold, or
+            # until begin() registers a new one
+            upcoming = [target.sample_after - now for target in targets]
+            self._wakeup.wait(min(upcoming) if upcoming else None)
+
+    def _sample(self, targets):
+        frames = sys._current_frames()
+        with self._lock:
+            for target in targets:
+                if id(target) not in self._targets:
+                    continue
+                for stack in self._stacks(target.greenlet, target.thread_id, frames):
+                    target.stacks[';'.join(stack)] += 1
+                target.samples += 1
+
+    def _stacks(self, thread, thread_id, frames, prefix=(), stop=None):
+        """Stacks of a thread, each extended by the work it delegated"""
+        # A suspended green thread keeps its own frame; the one running
+        # (or a plain OS thread) is the current frame of its thread
+        frame = thread.gr_frame
+        if frame is None:
+            frame = frames.get(thread_id)
+        stack = list(prefix) + _stack(frame, stop)
+        stacks = []
+        for worker, worker_id in list(concurrency.delegated.get(thread, ())):
+            stacks.extend(self._stacks(worker, worker_id, frames, stack, concurrency._run_on_behalf.__code__))
+        return stacks or [stack]
+
+    def _capture(self, profile):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', profile.name).strip('_')[:60]
+        filename = f'{int(time.time() * 1000)}-{os.getpid()}-{slug}-{int(profile.elapsed * 1000)}ms{FOLDED_SUFFIX}'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, filename), 'w') as f:
+                f.write(profile.folded())
+            self.captured += 1
+            self._trim()
+        except OSError as e:
+            logger.warning(f"Could not write slow request profile: {e}")
+            return
+        logger.info(f"Captured profile of slow request {profile.name} ({profile.elapsed:.2f}s): {filename}")
+
+    def _trim(self):
+        # Every worker writes to the same directory, so the oldest may
+        # already be gone
+        for filename in self.list_captured()[self.ring_size:]:
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+    def list_captured(self):
+        """Captured profile filenames, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except (OSError, TypeError):
+            return []
+        return sorted((name for name in names if name.endswith(FOLDED_SUFFIX)), reverse=True)
+
+    def stats(self):
+        return {
+            'on_demand': self.token is not None,
+            'slow_seconds': self.slow_seconds,
+            'interval': self.interval,
+            'in_flight': len(self._targets),
+            'captured': self.captured,
+        }
+
+
+def instrument_app(app, profiler):
+    """Profile Flask requests on demand (?profile=1 or X-Profile: 1) and when slow.
+
+    An on-demand request must carry the profiler token in X-Profile-Token;
+    its response is replaced by the folded stacks as text/plain. The view's
+    work, including JSON encoding, is covered; a streamed body is not.
+    """
+    if not profiler.enabled:
+        return
+    from flask import Response, g, jsonify, request
+
+    @app.before_request
+    def start_profile():
+        on_demand = request.args.get('profile') == '1' or request.headers.get(PROFILE_HEADER) == '1'
+        if on_demand:
+            if not profiler.authorized(request.headers.get(TOKEN_HEADER)):
+                return jsonify({"error": "Profiling requires a valid X-Profile-Token"}), 403
+        elif profiler.slow_seconds <= 0:
+            return None
+        g.profile = profiler.begin(f'{request.method} {request.path}', on_demand)
+        g.profile_on_demand = on_demand
+
+    @app.after_request
+    def finish_profile(response):
+        target = g.pop('profile', None)
+        if target is None:
+            return response
+        profile = profiler.end(target)
+        if not g.pop('profile_on_demand', False):
+            return response
+        profiled = Response(profile.folded(), content_type='text/plain; charset=utf-8')
+        profiled.headers['X-Profile-Status'] = str(response.status_code)
+        profiled.headers['X-Profile-Elapsed-Ms'] = str(int(profile.elapsed * 1000))
+        profiled.headers['X-Profile-Samples'] = str(profile.samples)
+        return profiled
+
+
+def profile_event(event, profiler):
+    """Decorator profiling a Socket.IO event handler.
+
+    A client asks for a profile by adding "profile": true and the token as
+    "profile_token" to the event data; the folded stacks are emitted back as
+    a 'profile' event once the handler returns. Returns the handler itself
+    when profiling is disabled.
+    """
+    def decorator(handler):
+        if not profiler.enabled:
+            return handler
+
+        @functools.wraps(handler)
+        def wrapper(data, *args, **kwargs):
+            on_demand = isinstance(data, dict) and bool(data.get('profile'))
+            if on_demand and not profiler.authorized(data.get('profile_token')):
+                on_demand = False
+            if not on_demand and profiler.slow_seconds <= 0:
+                return handler(data, *args, **kwargs)
+            target = profiler.begin(f'event {event}', on_demand)
+            try:
+                return handler(data, *args, **kwargs)
+            finally:
+                profile = profiler.end(target)
+                if on_demand:
+                    from flask_socketio import emit
+                    emit('profile', {
+                        'event': event,
+                        'elapsed_ms': int(profile.elapsed * 1000),
+                        'samples': profile.samples,
+                        'folded': profile.folded(),
+                    })
+        return wrapper
+    return decorator
@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+
+def encode_json(payload):
+    """Serialize a payload to compact JSON bytes with sorted keys, like jsonify"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+
+
+class EncodedPayload:
+    """A response body encoded once, with a strong ETag and pre-compressed variants"""
+
+    def __init__(self, body, mimetype='application/json'):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.variants = {'identity': body}
+        if len(body) >= MIN_COMPRESS_SIZE:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=6)
+            if brotli is not None:
+                self.variants['br'] = brotli.compress(body, quality=5)
+
+    def nbytes(self):
+        return sum(len(variant) for variant in self.variants.values())
+
+    def response(self, status=200):
+        """Response for the current request: 304 on a matching ETag, else the best encoding"""
+        headers = {
+            'ETag': f'"{self.etag}"',
+            'Vary': 'Accept-Encoding',
+            # Let browsers keep the body but revalidate it on every use
+            'Cache-Control': 'no-cache',
+        }
+        if request.if_none_match.contains(self.etag):
+            return Response(status=304, headers=headers)
+
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and request.accept_encodings[encoding] > 0:
+                headers['Content-Encoding'] = encoding
+                return self._body_response(self.variants[encoding], status, headers)
+        return self._body_response(self.variants['identity'], status, headers)
+
+    def _body_response(self, body, status, headers):
+        return Response(body, status=status, headers=headers, mimetype=self.mimetype)
+
+
+class MappedPayload(EncodedPayload):
+    """An encoded payload whose variants are lists of chunks in shared memory.
+
+    Workers serve the default demo data payload straight out of the mapped
+    snapshot this way, instead of each encoding and caching a copy.
+    """
+
+    def __init__(self, variants, etag, mimetype='application/json'):
+        self.variants = variants
+        self.etag = etag
+        self.mimetype = mimetype
+
+    def nbytes(self):
+        return 0
+
+    def _body_response(self, chunks, status, headers):
+        headers['Content-Length'] = str(sum(len(chunk) for chunk in chunks))
+        return Response(chunks, status=status, headers=headers, mimetype=self.mimetype)
+
+
+class ResponseCache:
+    """Bounded LRU of encoded responses, cleared whenever the underlying data changes.
+
+    Keys include the fingerprints of the stores a response is built from: a
+    build that overlaps a data refresh finishes after the cache was cleared,
+    and its stale payload must not be found by requests for the new data.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build):
+        """Encoded payload for key; build() returns the payload (or its JSON bytes) on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        payload = build()
+        entry = EncodedPayload(payload if isinstance(payload, bytes) else encode_json(payload))
+
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def respond(self, key, build):
+        return self.get(key, build).response()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            stored_bytes = sum(entry.nbytes() for entry in self._entries.values())
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'bytes': stored_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'encoder': 'orjson' if orjson is not None else 'json',
+            'brotli': brotli is not None,
+        }
@@ -0,0 +1,58 @@
+import html
+import re
+import xml.etree.ElementTree as ET
+from itertools import islice
+
+# Compiled once; Google News summaries are small HTML fragments
+HTML_TAG = re.compile(r'<[^>]+>')
+CHUNK_SIZE = 16 * 1024
+
+
+def clean_summary(summary):
+    """Plain text of an HTML summary: tags removed, entities decoded, whitespace collapsed"""
+    return ' '.join(html.unescape(HTML_TAG.sub('', summary)).split())
+
+
+def _chunks(source, chunk_size=CHUNK_SIZE):
+    if isinstance(source, (bytes, bytearray, str)):
+        for offset in range(0, len(source), chunk_size):
+            yield source[offset:offset + chunk_size]
+    else:
+        yield from source
+
+
+def iter_items(source):
+    """Yield each RSS <item> as a dict as soon as it has been parsed.
+
+    source is the document (bytes or str) or an iterable of chunks, e.g.
+    response.iter_content(). Parsing stops as soon as the caller stops
+    iterating, and finished items are dropped from the tree so memory
+    stays flat however long the feed is.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    channel = None
+    for chunk in _chunks(source):
+        parser.feed(chunk)
+        for event, element in parser.read_events():
+            if event == 'start':
+                if element.tag == 'channel':
+                    channel = element
+                continue
+            if element.tag != 'item':
+                continue
+            source_element = element.find('source')
+            yield {
+                'title': element.findtext('title', ''),
+                'link': element.findtext('link', ''),
+                'published': element.findtext('pubDate', ''),
+                'summary': element.findtext('description', ''),
+                'source': (source_element.text or '') if source_element is not None else '',
+            }
+            if channel is not None:
+                channel.remove(element)
+    parser.close()
+
+
+def parse_items(source, limit=None):
+    """The first limit items of an RSS document (all of them when limit is None)"""
+    return list(islice(iter_items(source), limit))
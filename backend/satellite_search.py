@@ -0,0 +1,95 @@
+import logging
+from datetime import date
+
+import http_client
+import upstreams
+from stac_ingest import next_link
+
+logger = logging.getLogger(__name__)
+
+COPERNICUS_STAC_SEARCH_URL = upstreams.COPERNICUS_STAC_SEARCH_URL
+MAX_SEARCH_RESULTS = 30
+
+
+class InvalidSearch(ValueError):
+    """Raised for a search_satellite request that cannot be turned into a STAC search"""
+
+
+def build_search_params(data):
+    """STAC search body for a search_satellite request from the map.
+
+    Raises InvalidSearch when the dates, coordinates or cloud cover are
+    missing or malformed, before anything (the search cache included) has
+    to parse them.
+    """
+    try:
+        start_date = date.fromisoformat(data['startDate'])
+        end_date = date.fromisoformat(data['endDate'])
+        lat, lng = float(data['lat']), float(data['lng'])
+        cloud_cover = data.get('cloudCover', 20)
+        float(cloud_cover)
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidSearch("lat and lng must be numbers, startDate and endDate YYYY-MM-DD dates "
+                            "and cloudCover a number") from e
+    return {
+        "collections": ["SENTINEL-2"],
+        "datetime": f"{start_date.isoformat()}T00:00:00Z/{end_date.isoformat()}T23:59:59Z",
+        "bbox": [lng-0.1, lat-0.1, lng+0.1, lat+0.1],
+        "filter": {
+            "op": "<=",
+            "args": [
+                {"property": "cloudCover"},
+                cloud_cover
+            ]
+        }
+    }
+
+
+def iter_search_pages(token, search_params, deadline=None, max_results=MAX_SEARCH_RESULTS, select=None,
+                      should_continue=None, on_unauthorized=None, on_finished=None):
+    """Yield the features of each Copernicus STAC search page as it arrives.
+
+    Pagination follows the 'next' links until max_results features have been
+    yielded, a page request fails, or should_continue() returns False (for
+    example because the requesting client went away). With select, only the
+    features select(page_features) keeps count towards max_results, so a
+    broader search can be paginated until a narrower one has its results;
+    the last page is then cut just after the last feature still needed. When every page was
+    read, or max_results was reached, on_finished(complete) is called;
+    complete is True only if every upstream feature was yielded, i.e. the
+    last page had no 'next' link and nothing was cut from it.
+    """
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+
+    next_url = COPERNICUS_STAC_SEARCH_URL
+    remaining = max_results
+    truncated = False
+    while next_url and remaining > 0:
+        if should_continue is not None and not should_continue():
+            logger.debug("Stopping search pagination, client is gone")
+            return
+
+        response = http_client.post(next_url, json=search_params, headers=headers, deadline=deadline)
+        if response.status_code != 200:
+            logger.error(f"Search request failed: {response.status_code}")
+            if response.status_code == 401 and on_unauthorized is not None:
+                on_unauthorized()
+            return
+
+        result = response.json()
+        page_features = result.get('features', [])
+        selected = page_features if select is None else select(page_features)
+        features = page_features
+        if len(selected) > remaining:
+            last = selected[remaining - 1]
+            features = page_features[:next(i for i, feature in enumerate(page_features) if feature is last) + 1]
+        truncated = len(features) < len(page_features)
+        remaining -= min(len(selected), remaining)
+        next_url = next_link(result)
+        yield features
+
+    if on_finished is not None:
+        on_finished(next_url is None and not truncated)
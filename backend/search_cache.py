@@ -0,0 +1,188 @@
+import json
+import math
+import os
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from lru_cache import ByteLRUCache
+
+# Search boxes are widened to this grid (in degrees) and cloud thresholds
+# rounded up to this bucket, so nearby clicks share one upstream search
+SEARCH_BBOX_GRID = float(os.getenv('SEARCH_BBOX_GRID', 0.05))
+CLOUD_COVER_BUCKET = 10
+
+
+def _parse_time(value):
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def _feature_bbox(feature):
+    if feature.get('bbox') and len(feature['bbox']) >= 4:
+        bbox = feature['bbox']
+        return (bbox[0], bbox[1], bbox[-2], bbox[-1]) if len(bbox) == 4 else (bbox[0], bbox[1], bbox[3], bbox[4])
+    geometry = feature.get('geometry') or {}
+    coordinates = geometry.get('coordinates') or []
+    if geometry.get('type') == 'Polygon':
+        points = [point for ring in coordinates for point in ring]
+    elif geometry.get('type') == 'MultiPolygon':
+        points = [point for polygon in coordinates for ring in polygon for point in ring]
+    else:
+        return None
+    if not points:
+        return None
+    return (min(p[0] for p in points), min(p[1] for p in points), max(p[0] for p in points), max(p[1] for p in points))
+
+
+def _cloud_cover(properties):
+    for key in ('cloudCover', 'eo:cloud_cover'):
+        if isinstance(properties.get(key), (int, float)):
+            return properties[key]
+    return None
+
+
+class SearchQuery(namedtuple('SearchQuery', 'collection bbox start end max_cloud')):
+    """The parts of a STAC search body that select features"""
+
+    @classmethod
+    def from_params(cls, params):
+        start, end = params['datetime'].split('/')
+        return cls(
+            tuple(params['collections']),
+            tuple(float(value) for value in params['bbox']),
+            start,
+            end,
+            float(params['filter']['args'][1]),
+        )
+
+    def to_params(self):
+        return {
+            "collections": list(self.collection),
+            "datetime": f"{self.start}/{self.end}",
+            "bbox": list(self.bbox),
+            "filter": {"op": "<=", "args": [{"property": "cloudCover"}, self.max_cloud]},
+        }
+
+    def normalized(self, grid=SEARCH_BBOX_GRID, bucket=CLOUD_COVER_BUCKET):
+        """The broader query actually sent upstream and used as the cache key"""
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        bbox = (
+            round(math.floor(min_lng / grid) * grid, 6),
+            round(math.floor(min_lat / grid) * grid, 6),
+            round(math.ceil(max_lng / grid) * grid, 6),
+            round(math.ceil(max_lat / grid) * grid, 6),
+        )
+        max_cloud = min(100.0, math.ceil(self.max_cloud / bucket) * bucket)
+        return self._replace(bbox=bbox, max_cloud=max(max_cloud, self.max_cloud))
+
+    def contains(self, other):
+        """Whether every feature matching other also matches this query"""
+        return (
+            self.collection == other.collection
+            and self.bbox[0] <= other.bbox[0] and self.bbox[1] <= other.bbox[1]
+            and self.bbox[2] >= other.bbox[2] and self.bbox[3] >= other.bbox[3]
+            and _parse_time(self.start) <= _parse_time(other.start)
+            and _parse_time(self.end) >= _parse_time(other.end)
+            and self.max_cloud >= other.max_cloud
+        )
+
+    def filter(self, features):
+        """The features of a broader result that this query selects"""
+        start, end = _parse_time(self.start), _parse_time(self.end)
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        selected = []
+        for feature in features:
+            properties = feature.get('properties') or {}
+            if properties.get('datetime') and not start <= _parse_time(properties['datetime']) <= end:
+                continue
+            cloud_cover = _cloud_cover(properties)
+            if cloud_cover is not None and cloud_cover > self.max_cloud:
+                continue
+            bbox = _feature_bbox(feature)
+            if bbox and (bbox[0] > max_lng or bbox[2] < min_lng or bbox[1] > max_lat or bbox[3] < min_lat):
+                continue
+            selected.append(feature)
+        return selected
+
+
+class SearchResult:
+    def __init__(self, query, features, complete, origin=None):
+        self.query = query
+        self.features = features
+        # False when upstream had more results than were fetched, so the
+        # result can only answer origin, the search that fetched it
+        self.complete = complete
+        self.origin = origin
+        self.stored_at = time.monotonic()
+        self.nbytes = len(json.dumps(features, separators=(',', ':')))
+
+
+class SearchCache:
+    """Byte-bounded LRU of STAC search results keyed by normalized query.
+
+    A query is answered from the entry of its normalized query, or from any
+    complete entry of a broader query, filtered down to what was asked for.
+    An incomplete entry only answers the exact search that fetched it: other
+    queries with the same normalized form may need features it never read.
+    """
+
+    def __init__(self, ttl=600, max_bytes=32 * 1024 * 1024, grid=SEARCH_BBOX_GRID, bucket=CLOUD_COVER_BUCKET):
+        self.ttl = ttl
+        self.grid = grid
+        self.bucket = bucket
+        self._results = ByteLRUCache(max_bytes, sizeof=lambda result: result.nbytes)
+        self.exact_hits = 0
+        self.broader_hits = 0
+        self.misses = 0
+
+    def normalize(self, search_params):
+        return SearchQuery.from_params(search_params).normalized(self.grid, self.bucket)
+
+    def _fresh(self, result):
+        return time.monotonic() - result.stored_at < self.ttl
+
+    def lookup(self, search_params):
+        """Features for a search from cache, or None when upstream has to be asked"""
+        query = SearchQuery.from_params(search_params)
+        key = query.normalized(self.grid, self.bucket)
+        result = self._results.get(key)
+        if result is not None:
+            if not self._fresh(result):
+                self._results.discard(key)
+            elif result.complete or result.origin == query:
+                self.exact_hits += 1
+                return query.filter(result.features)
+
+        for cached_key, result in self._results.items():
+            if result.complete and self._fresh(result) and cached_key.contains(key):
+                self.broader_hits += 1
+                return query.filter(result.features)
+
+        self.misses += 1
+        return None
+
+    def store(self, search_params, features, complete):
+        """Remember the upstream features of the normalized form of a search"""
+        origin = SearchQuery.from_params(search_params)
+        key = origin.normalized(self.grid, self.bucket)
+        self._results.put(key, SearchResult(key, features, complete, origin))
+
+    def clear(self):
+        self._results.clear()
+
+    def stats(self):
+        lookups = self.exact_hits + self.broader_hits + self.misses
+        stats = self._results.stats()
+        return {
+            'entries': stats['entries'],
+            'bytes': stats['bytes'],
+            'max_bytes': stats['max_bytes'],
+            'evictions': stats['evictions'],
+            'exact_hits': self.exact_hits,
+            'broader_hits': self.broader_hits,
+            'misses': self.misses,
+            'hit_ratio': (self.exact_hits + self.broader_hits) / lookups if lookups else 0.0,
+        }
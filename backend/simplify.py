@@ -0,0 +1,167 @@
+import heapq
+import math
+
+# Map tiles are this many pixels wide; ?zoom= simplifies to about one pixel
+TILE_SIZE = 256
+MAX_ZOOM = 24
+METHODS = ('douglas_peucker', 'visvalingam')
+
+
+def _segment_distance2(px, py, ax, ay, bx, by):
+    """Squared distance from point p to the segment ab"""
+    dx, dy = bx - ax, by - ay
+    if dx or dy:
+        t = ((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy)
+        if t > 1:
+            ax, ay = bx, by
+        elif t > 0:
+            ax += dx * t
+            ay += dy * t
+    dx, dy = px - ax, py - ay
+    return dx * dx + dy * dy
+
+
+def douglas_peucker(points, tolerance):
+    """Douglas-Peucker simplification of a list of (x, y) points; the end points are always kept"""
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+    tolerance2 = tolerance * tolerance
+    keep = bytearray(len(points))
+    keep[0] = keep[-1] = 1
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first]
+        bx, by = points[last]
+        max_distance = tolerance2
+        index = None
+        for i in range(first + 1, last):
+            distance = _segment_distance2(points[i][0], points[i][1], ax, ay, bx, by)
+            if distance > max_distance:
+                index, max_distance = i, distance
+        if index is not None:
+            keep[index] = 1
+            stack.append((first, index))
+            stack.append((index, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def _triangle_area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2
+
+
+def visvalingam(points, tolerance):
+    """Visvalingam-Whyatt simplification: drop the vertices whose triangle is
+    smaller than tolerance squared, smallest first; the end points are always kept"""
+    if tolerance <= 0 or len(points) < 3:
+        return list(points)
+    min_area = tolerance * tolerance
+    previous = list(range(-1, len(points) - 1))
+    following = list(range(1, len(points) + 1))
+    areas = [math.inf] * len(points)
+    heap = []
+    for i in range(1, len(points) - 1):
+        areas[i] = _triangle_area(points[i - 1], points[i], points[i + 1])
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+
+    removed = bytearray(len(points))
+    while heap:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            continue  # stale entry
+        if area >= min_area:
+            break
+        removed[i] = 1
+        before, after = previous[i], following[i]
+        following[before] = after
+        previous[after] = before
+        # The neighbours' triangles change; never let them drop below the removed one
+        for j in (before, after):
+            if 0 < j < len(points) - 1:
+                areas[j] = max(area, _triangle_area(points[previous[j]], points[j], points[following[j]]))
+                heapq.heappush(heap, (areas[j], j))
+    return [point for point, dropped in zip(points, removed) if not dropped]
+
+
+def tolerance_for_zoom(zoom):
+    """Degrees covered by one pixel at the equator at a map zoom level"""
+    return 360 / (TILE_SIZE * 2 ** zoom)
+
+
+def snap_tolerance(tolerance):
+    """Round a tolerance to a power of two so nearby requests share a cached variant"""
+    return 2.0 ** round(math.log2(tolerance))
+
+
+def precision_for_tolerance(tolerance):
+    """Decimal places that keep the rounding error well below the tolerance"""
+    return min(15, max(0, math.ceil(-math.log10(tolerance)) + 1))
+
+
+def reduction_from_args(args):
+    """(tolerance, method) requested through ?zoom= or ?tolerance= and ?simplify=, or None.
+
+    Raises ValueError for invalid parameters.
+    """
+    method = args.get('simplify', 'douglas_peucker')
+    if method not in METHODS:
+        raise ValueError(f"simplify must be one of {', '.join(METHODS)}")
+    if args.get('tolerance') is not None:
+        tolerance = float(args['tolerance'])
+        if not tolerance > 0 or math.isinf(tolerance):
+            raise ValueError("tolerance must be a positive number of degrees")
+    elif args.get('zoom') is not None:
+        zoom = int(args['zoom'])
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+        tolerance = tolerance_for_zoom(zoom)
+    else:
+        return None
+    return snap_tolerance(tolerance), method
+
+
+def simplify_ring(ring, tolerance, method='douglas_peucker'):
+    """Simplified and quantized copy of a closed [[lng, lat], ...] ring, or None if it collapses"""
+    simplify = visvalingam if method == 'visvalingam' else douglas_peucker
+    decimals = precision_for_tolerance(tolerance)
+    points = []
+    for lng, lat in simplify([(point[0], point[1]) for point in ring], tolerance):
+        point = [round(lng, decimals), round(lat, decimals)]
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) < 4:
+        return None
+    return points
+
+
+def simplify_polygon(rings, tolerance, method='douglas_peucker'):
+    """Simplified polygon rings; holes that collapse are dropped, the outer ring is only quantized"""
+    if not rings:
+        return rings
+    simplified = []
+    for position, ring in enumerate(rings):
+        reduced = simplify_ring(ring, tolerance, method)
+        if reduced is None and position == 0:
+            decimals = precision_for_tolerance(tolerance)
+            reduced = [[round(point[0], decimals), round(point[1], decimals)] for point in ring]
+        if reduced is not None:
+            simplified.append(reduced)
+    return simplified
+
+
+def simplify_geometry(geometry, tolerance, method='douglas_peucker'):
+    """Copy of a GeoJSON Polygon or MultiPolygon with simplified rings; other geometries are returned as-is"""
+    if not geometry:
+        return geometry
+    if geometry.get('type') == 'Polygon':
+        return {**geometry, 'coordinates': simplify_polygon(geometry.get('coordinates') or [], tolerance, method)}
+    if geometry.get('type') == 'MultiPolygon':
+        return {**geometry, 'coordinates': [
+            simplify_polygon(polygon, tolerance, method) for polygon in geometry.get('coordinates') or []
+        ]}
+    return geometry
+
+
+def simplify_feature(feature, tolerance, method='douglas_peucker'):
+    return {**feature, 'geometry': simplify_geometry(feature.get('geometry'), tolerance, method)}
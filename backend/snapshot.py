@@ -0,0 +1,353 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from array import array
+from collections import namedtuple
+
+from feature_store import (ARRAY_COLUMNS, STRING_COLUMNS, Categories, CollectionStore, StringColumn, pack_strings,
+                           stores_json_chunks)
+from response_cache import MappedPayload
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GLOBESNAP2\n'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 8
+
+# A snapshot mapped into memory: its stores and the default /fetch_demo_data payload
+AttachedSnapshot = namedtuple('AttachedSnapshot', 'stores created_at payload')
+
+
+def save_snapshot(stores, path):
+    """Write {collection: CollectionStore} to path, atomically replacing any previous snapshot.
+
+    Layout: magic, header length, JSON header (category labels and the
+    offset of every column), then the column bytes, each 8-byte aligned so
+    they can be read back or mapped in place. Ids and datetimes are packed
+    with pack_strings so that they can be mapped too. The gzipped
+    stores_json payload follows the columns.
+    """
+    blobs = []
+    position = 0
+    collections = []
+    for name, store in stores.items():
+        parts = [(column, _typecode(getattr(store, column)), getattr(store, column).tobytes()) for column in ARRAY_COLUMNS]
+        parts.append(('raw', 'B', bytes(store.raw)))
+        for column in STRING_COLUMNS:
+            data, offsets = pack_strings(getattr(store, column))
+            parts.append((column, 'B', bytes(data)))
+            parts.append((column + '_offsets', offsets.typecode, offsets.tobytes()))
+
+        columns = {}
+        for column, typecode, blob in parts:
+            padding = -position % ALIGNMENT
+            position += padding
+            blobs.append(b'\0' * padding)
+            columns[column] = {'typecode': typecode, 'offset': position, 'length': len(blob)}
+            blobs.append(blob)
+            position += len(blob)
+        collections.append({
+            'name': name,
+            'keep_raw': store.keep_raw,
+            'snap_tolerance': store.snap_tolerance,
+            'fingerprint': store.fingerprint,
+            'constellations': store.constellations.labels,
+            'sensor_types': store.sensor_types.labels,
+            'columns': columns,
+        })
+
+    # Computed chunk by chunk; the ETag matches EncodedPayload's for the same body
+    digest = hashlib.blake2b(digest_size=16)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    compressed = []
+    for chunk in stores_json_chunks(stores):
+        digest.update(chunk)
+        compressed.append(compressor.compress(chunk))
+    compressed.append(compressor.flush())
+    payload = b''.join(compressed)
+    padding = -position % ALIGNMENT
+    position += padding
+    blobs.append(b'\0' * padding)
+    payload_spec = {'offset': position, 'length': len(payload), 'etag': digest.hexdigest(), 'encoding': 'gzip'}
+    blobs.append(payload)
+    position += len(payload)
+
+    header = json.dumps({
+        'created_at': time.time(),
+        'byteorder': sys.byteorder,
+        'collections': collections,
+        'payload': payload_spec,
+    }).encode()
+    prefix = MAGIC + HEADER_LENGTH.pack(len(header)) + header
+    prefix += b'\0' * (-len(prefix) % ALIGNMENT)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.snapshot-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(prefix)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.info(f"Saved demo data snapshot to {path} ({len(prefix) + position} bytes)")
+
+
+def _typecode(column):
+    # Columns of an attached snapshot are memoryviews rather than arrays
+    return column.typecode if isinstance(column, array) else column.format
+
+
+def read_header(buffer):
+    """Parse the header of a snapshot held in buffer; returns (header, data_start)"""
+    if bytes(buffer[:len(MAGIC)]) != MAGIC:
+        raise ValueError("Not a demo data snapshot")
+    (header_length,) = HEADER_LENGTH.unpack_from(buffer, len(MAGIC))
+    header_start = len(MAGIC) + HEADER_LENGTH.size
+    header = json.loads(bytes(buffer[header_start:header_start + header_length]))
+    if header['byteorder'] != sys.byteorder:
+        raise ValueError(f"Snapshot was written on a {header['byteorder']}-endian host")
+    data_start = header_start + header_length
+    return header, data_start + (-data_start % ALIGNMENT)
+
+
+def stores_from_buffer(header, data_start, buffer, copy=True):
+    """Rebuild read-only CollectionStores from a snapshot buffer.
+
+    With copy=False the columns are memoryviews into buffer instead of
+    arrays, and ids and datetimes are decoded on access.
+    """
+    stores = {}
+    for meta in header['collections']:
+        store = CollectionStore(meta['name'], keep_raw=meta['keep_raw'], snap_tolerance=meta['snap_tolerance'])
+        store.constellations = Categories(meta['constellations'])
+        store.sensor_types = Categories(meta['sensor_types'])
+        columns = {}
+        for column, spec in meta['columns'].items():
+            start = data_start + spec['offset']
+            data = buffer[start:start + spec['length']]
+            if not copy:
+                columns[column] = data.cast(spec['typecode'])
+            elif spec['typecode'] == 'B':
+                columns[column] = bytearray(data)
+            else:
+                columns[column] = array(spec['typecode'])
+                columns[column].frombytes(data)
+        for column in ARRAY_COLUMNS + ('raw',):
+            setattr(store, column, columns[column])
+        for column in STRING_COLUMNS:
+            strings = StringColumn(columns[column], columns[column + '_offsets'])
+            setattr(store, column, strings if not copy else list(strings))
+        # Loaded stores are complete; keep the fingerprint they were saved with
+        store._digest = None
+        store._fingerprint = meta['fingerprint']
+        stores[meta['name']] = store
+    return stores
+
+
+def load_snapshot(path):
+    """Load a snapshot written by save_snapshot; returns (stores, created_at) or (None, None)"""
+    try:
+        with open(path, 'rb') as f:
+            buffer = f.read()
+        header, data_start = read_header(buffer)
+        stores = stores_from_buffer(header, data_start, buffer)
+    except FileNotFoundError:
+        return None, None
+    except (ValueError, KeyError, struct.error) as e:
+        logger.error(f"Ignoring unreadable snapshot {path}: {e}")
+        return None, None
+    logger.info(f"Loaded demo data snapshot from {path} ({sum(len(store) for store in stores.values())} features)")
+    return stores, header['created_at']
+
+
+def attach_snapshot(path):
+    """Map a snapshot read-only; returns an AttachedSnapshot, or None.
+
+    The stores are views into the mapping rather than copies. Every process
+    attached to the same file shares its pages through the page cache, so
+    the data is held in memory once however many workers serve it.
+    """
+    try:
+        with open(path, 'rb') as f:
+            buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        header, data_start = read_header(buffer)
+        stores = stores_from_buffer(header, data_start, buffer, copy=False)
+        spec = header['payload']
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError, struct.error) as e:
+        logger.error(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+    start = data_start + spec['offset']
+    payload = MappedPayload({
+        'identity': stores_json_chunks(stores),
+        spec['encoding']: [buffer[start:start + spec['length']]],
+    }, spec['etag'])
+    logger.info(f"Attached demo data snapshot {path} ({sum(len(store) for store in stores.values())} features)")
+    return AttachedSnapshot(stores, header['created_at'], payload)
+
+
+def _file_identity(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class SnapshotFollower:
+    """Attaches the snapshot and re-attaches it whenever it is replaced.
+
+    Used by the workers of a multi-process deployment in place of a
+    DemoDataRefresher: a single supervisor refreshes the data and rewrites
+    the snapshot, and each worker maps the new file and passes its stores
+    to install().
+    """
+
+    def __init__(self, path, install, interval=5):
+        self.path = path
+        self.install = install
+        self.interval = interval
+        self.current = None
+        self.attaches = 0
+        self._identity = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def attach(self):
+        """Attach and install the current snapshot; returns the AttachedSnapshot, or None if there is none"""
+        with self._lock:
+            identity = _file_identity(self.path)
+            snapshot = attach_snapshot(self.path)
+            if snapshot is None:
+                return None
+            self.current = snapshot
+            self.install(snapshot.stores)
+            self._identity = identity
+            self.attaches += 1
+            return snapshot
+
+    def payload_for(self, stores):
+        """The mapped default payload, if stores are the ones currently attached"""
+        snapshot = self.current
+        if snapshot is not None and snapshot.stores is stores:
+            return snapshot.payload
+        return None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='snapshot-follower', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            identity = _file_identity(self.path)
+            if identity is not None and identity != self._identity:
+                self.attach()
+
+    def stats(self):
+        created_at = self.current.created_at if self.current else None
+        return {
+            'path': self.path,
+            'attaches': self.attaches,
+            'created_at': created_at,
+            'age_seconds': time.time() - created_at if created_at else None,
+        }
+
+
+class DemoDataRefresher:
+    """Background thread that re-fetches the demo data on a TTL.
+
+    reload() must fetch the collections and install them in one step,
+    returning the new stores; until it does the previous data keeps being
+    served. Every successful reload is also written to the snapshot file.
+    """
+
+    def __init__(self, reload, snapshot_path=None, ttl=3600, retry_interval=60):
+        self.reload = reload
+        self.snapshot_path = snapshot_path
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.last_refresh = None
+        self.last_error = None
+        self.refreshes = 0
+        self.failures = 0
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self, data_age=None, retry=False):
+        """Start refreshing; data_age is how old the currently installed data is, if there is any.
+
+        With retry=True the installed data is partial (or a fallback) and
+        the first refresh comes after retry_interval instead of the TTL.
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            if retry:
+                first_delay = self.retry_interval
+            else:
+                first_delay = 0 if data_age is None else max(0, self.ttl - data_age)
+            if data_age is not None and self.last_refresh is None:
+                self.last_refresh = time.time() - data_age
+            self._thread = threading.Thread(target=self._run, args=(first_delay,), name='demo-data-refresher', daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """Refresh now instead of waiting for the TTL"""
+        self._wakeup.set()
+
+    def _run(self, delay):
+        while True:
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            delay = self.ttl if self.refresh() else self.retry_interval
+
+    def refresh(self):
+        try:
+            stores = self.reload()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Demo data refresh failed, keeping the current data: {e}")
+            return False
+        self.saved(stores)
+        return True
+
+    def saved(self, stores):
+        """Record freshly installed stores and persist them for the next start"""
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        self.last_error = None
+        if self.snapshot_path:
+            try:
+                save_snapshot(stores, self.snapshot_path)
+            except OSError as e:
+                logger.error(f"Could not write demo data snapshot: {e}")
+
+    def stats(self):
+        return {
+            'running': self._thread is not None,
+            'ttl_seconds': self.ttl,
+            'last_refresh': self.last_refresh,
+            'age_seconds': time.time() - self.last_refresh if self.last_refresh else None,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,109 @@
+import math
+from array import array
+
+NODE_CAPACITY = 16
+
+
+def _intersects(minx, miny, maxx, maxy, qminx, qminy, qmaxx, qmaxy):
+    return minx <= qmaxx and maxx >= qminx and miny <= qmaxy and maxy >= qminy
+
+
+class STRTree:
+    """Static R-tree over bounding boxes, bulk loaded with Sort-Tile-Recursive.
+
+    Leaves are the items in STR order; each node of the next level up covers
+    NODE_CAPACITY consecutive entries of the level below, so the tree is just
+    one set of bbox arrays per level plus the item order.
+    """
+
+    def __init__(self, bboxes, node_capacity=NODE_CAPACITY):
+        self.node_capacity = node_capacity
+        entries = [(index, bbox) for index, bbox in enumerate(bboxes) if bbox is not None]
+        self.size = len(entries)
+
+        # Sort-Tile-Recursive: vertical slices by x centre, each sorted by y centre
+        entries.sort(key=lambda entry: entry[1][0] + entry[1][2])
+        leaf_count = math.ceil(len(entries) / node_capacity) if entries else 0
+        slice_count = max(1, math.ceil(math.sqrt(leaf_count)))
+        slice_size = slice_count * node_capacity
+        ordered = []
+        for start in range(0, len(entries), slice_size):
+            ordered.extend(sorted(entries[start:start + slice_size], key=lambda entry: entry[1][1] + entry[1][3]))
+
+        self.items = array('I', (index for index, _ in ordered))
+        level = tuple(array('d', (bbox[axis] for _, bbox in ordered)) for axis in range(4))
+        self.levels = [level]
+        while len(level[0]) > node_capacity:
+            level = self._pack(level)
+            self.levels.append(level)
+
+    def _pack(self, level):
+        minxs, minys, maxxs, maxys = level
+        packed = tuple(array('d') for _ in range(4))
+        for start in range(0, len(minxs), self.node_capacity):
+            end = start + self.node_capacity
+            packed[0].append(min(minxs[start:end]))
+            packed[1].append(min(minys[start:end]))
+            packed[2].append(max(maxxs[start:end]))
+            packed[3].append(max(maxys[start:end]))
+        return packed
+
+    def query(self, minx, miny, maxx, maxy):
+        """Indexes of all items whose bbox intersects the query box, in index order"""
+        if not self.size:
+            return []
+        capacity = self.node_capacity
+        top = len(self.levels) - 1
+        stack = [(top, position) for position in range(len(self.levels[top][0]))]
+        matches = []
+        while stack:
+            depth, position = stack.pop()
+            minxs, minys, maxxs, maxys = self.levels[depth]
+            if not _intersects(minxs[position], minys[position], maxxs[position], maxys[position], minx, miny, maxx, maxy):
+                continue
+            if depth == 0:
+                matches.append(self.items[position])
+            else:
+                child_count = len(self.levels[depth - 1][0])
+                start = position * capacity
+                stack.extend((depth - 1, child) for child in range(start, min(start + capacity, child_count)))
+        matches.sort()
+        return matches
+
+
+def _point_in_ring(lng, lat, lngs, lats):
+    inside = False
+    j = len(lngs) - 1
+    for i in range(len(lngs)):
+        if (lats[i] > lat) != (lats[j] > lat):
+            crossing = lngs[i] + (lat - lats[i]) * (lngs[j] - lngs[i]) / (lats[j] - lats[i])
+            if lng < crossing:
+                inside = not inside
+        j = i
+    return inside
+
+
+class FootprintIndex:
+    """Bounding-box and point lookups over the footprints of a CollectionStore"""
+
+    def __init__(self, store, node_capacity=NODE_CAPACITY):
+        self.store = store
+        self.tree = STRTree([store.bbox(index) for index in range(len(store))], node_capacity)
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """Features whose footprint bbox intersects the given box"""
+        return self.tree.query(minx, miny, maxx, maxy)
+
+    def query_point(self, lng, lat):
+        """Features whose footprint polygon contains the point"""
+        store = self.store
+        matches = []
+        for index in self.tree.query(lng, lat, lng, lat):
+            first_ring, end_ring = store.geometry_offsets[index], store.geometry_offsets[index + 1]
+            # Inside the outer ring and outside every hole
+            if not _point_in_ring(lng, lat, *store.ring_points(first_ring)):
+                continue
+            if any(_point_in_ring(lng, lat, *store.ring_points(ring)) for ring in range(first_ring + 1, end_ring)):
+                continue
+            matches.append(index)
+        return matches
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import upstreams
+from feature_store import ingest_features
+from http_client import Deadline
+
+logger = logging.getLogger(__name__)
+
+DEMO_ITEM_URLS = [upstreams.items_url(collection) for collection in upstreams.DEMO_COLLECTIONS]
+
+
+class IngestError(Exception):
+    """Raised by a strict ingest run when some URLs could not be fetched"""
+
+
+def next_link(page):
+    """href of the STAC 'next' link of a page, if any"""
+    for link in page.get('links', []):
+        if link.get('rel') == 'next':
+            return link.get('href')
+    return None
+
+
+class IngestProgress:
+    """Per-URL progress and timing of one ingest run"""
+
+    def __init__(self, urls):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.finished_at = None
+        self.urls = {
+            url: {
+                'status': 'pending',
+                'pages': 0,
+                'features': 0,
+                'bytes': 0,
+                'elapsed_seconds': 0.0,
+                'error': None,
+            }
+            for url in urls
+        }
+
+    def update(self, url, **values):
+        with self._lock:
+            self.urls[url].update(values)
+
+    def add_page(self, url, features, size, elapsed):
+        with self._lock:
+            entry = self.urls[url]
+            entry['pages'] += 1
+            entry['features'] += features
+            entry['bytes'] += size
+            entry['elapsed_seconds'] = elapsed
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    def snapshot(self):
+        with self._lock:
+            urls = {url: dict(entry) for url, entry in self.urls.items()}
+        end = self.finished_at or time.time()
+        return {
+            'running': self.finished_at is None,
+            'elapsed_seconds': end - self.started_at,
+            'pages': sum(entry['pages'] for entry in urls.values()),
+            'features': sum(entry['features'] for entry in urls.values()),
+            'bytes': sum(entry['bytes'] for entry in urls.values()),
+            'failed_urls': sum(1 for entry in urls.values() if entry['status'] == 'failed'),
+            'urls': urls,
+        }
+
+
+class StacIngestPipeline:
+    """Fetches STAC item collections concurrently and streams their pages into CollectionStores.
+
+    Each URL is walked along its 'next' links on its own worker; a shared
+    semaphore bounds how many page requests are in flight across all URLs.
+    """
+
+    def __init__(self, urls, max_in_flight=4, page_timeout=10, url_timeout=60, max_pages=1000, session=None):
+        self.urls = list(urls)
+        self.max_in_flight = max_in_flight
+        self.page_timeout = page_timeout
+        self.url_timeout = url_timeout
+        self.max_pages = max_pages
+        self.session = session or http_client
+        self.progress = IngestProgress(self.urls)
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._stores_lock = threading.Lock()
+
+    def run(self, stores=None, strict=False):
+        """Ingest every URL into stores ({collection: CollectionStore}) and return it.
+
+        With strict=True an IngestError is raised if any URL failed, so
+        callers can keep serving their previous data instead of a partial set.
+        """
+        stores = {} if stores is None else stores
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(self.urls)), thread_name_prefix='stac-ingest') as executor:
+                for url in self.urls:
+                    executor.submit(self._fetch_url, url, stores)
+        finally:
+            self.progress.finish()
+        snapshot = self.progress.snapshot()
+        logger.info(f"Ingested {snapshot['features']} features from {snapshot['pages']} pages "
+                    f"in {snapshot['elapsed_seconds']:.2f}s ({snapshot['failed_urls']} failed URLs)")
+        if strict and snapshot['failed_urls']:
+            raise IngestError(f"{snapshot['failed_urls']} of {len(self.urls)} URLs failed to ingest")
+        return stores
+
+    def _fetch_url(self, url, stores):
+        started = time.monotonic()
+        deadline = Deadline(self.url_timeout)
+        self.progress.update(url, status='running')
+        next_url = url
+        pages = 0
+        try:
+            while next_url and pages < self.max_pages:
+                with self._in_flight:
+                    response = self.session.get(next_url, timeout=self.page_timeout, deadline=deadline)
+                response.raise_for_status()
+                page = response.json()
+                features = page.get('features', [])
+                # Pages are folded into the stores as soon as they arrive so
+                # the raw page dicts can be released straight away
+                with self._stores_lock:
+                    ingest_features(stores, features)
+                pages += 1
+                self.progress.add_page(url, len(features), len(response.content), time.monotonic() - started)
+                next_url = next_link(page)
+            self.progress.update(url, status='done', elapsed_seconds=time.monotonic() - started)
+        except Exception as e:
+            logger.error(f"Failed to fetch data from {url}: {e}")
+            self.progress.update(url, status='failed', error=str(e), elapsed_seconds=time.monotonic() - started)
@@ -0,0 +1,110 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from concurrency import on_behalf
+from feature_store import CollectionStore
+from metrics import SUMMARY_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Properties that feed into summarize_collection; anything else can change
+# without affecting the summary.
+SUMMARY_PROPERTIES = ('datetime', 'cloud_cover', 'resolution', 'constellation', 'sensor_type')
+
+
+def fingerprint_features(features):
+    """Hash the parts of a feature list that summarize_collection reads"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(len(features)).encode())
+    for feature in features:
+        properties = feature.get('properties', {})
+        geometry = feature.get('geometry') or {}
+        digest.update(repr((
+            feature.get('id'),
+            tuple(properties.get(key) for key in SUMMARY_PROPERTIES),
+            geometry.get('coordinates'),
+        )).encode())
+    return digest.hexdigest()
+
+
+def summary_day():
+    """UTC day a summary computed now belongs to"""
+    # "features_last_30_days" depends on the current date, so summaries
+    # are only reused within the same UTC day
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class SummaryCache:
+    """Bounded LRU cache of collection summaries keyed by name and feature fingerprint"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._fingerprints = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def fingerprint(self, collection_name, features):
+        # Ingested stores hash their raw features as they are appended
+        if isinstance(features, CollectionStore):
+            return features.fingerprint
+        # Remember the fingerprint for the exact list object we were handed so
+        # repeat requests against the same cached data skip the hashing pass.
+        known = self._fingerprints.get(collection_name)
+        if known and known[0] is features and known[1] == len(features):
+            return known[2]
+        value = fingerprint_features(features)
+        self._fingerprints[collection_name] = (features, len(features), value)
+        return value
+
+    def get_or_compute(self, collection_name, features, compute):
+        key = (collection_name, self.fingerprint(collection_name, features), summary_day())
+        with self._lock:
+            summary = self._entries.get(key)
+            if summary is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return summary
+            self.misses += 1
+
+        with SUMMARY_DURATION.time():
+            summary = compute(features)
+
+        with self._lock:
+            self._entries[key] = summary
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return summary
+
+    def get_or_compute_many(self, collections, compute, executor):
+        """{name: summary} for {name: features}; missing summaries are computed concurrently on executor"""
+        futures = {
+            name: executor.submit(on_behalf(self.get_or_compute), name, features, compute)
+            for name, features in collections.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+    def clear(self):
+        """Drop all summaries, e.g. after the demo data has been reloaded"""
+        with self._lock:
+            self._entries.clear()
+            self._fingerprints.clear()
+        logger.debug("Summary cache cleared")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
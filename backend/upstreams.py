@@ -0,0 +1,21 @@
+"""Base URLs of the services the backend calls.
+
+Each one can be overridden from the environment, for example to point the
+backend at benchmarks/mock_upstream.py and load-test it without a network.
+"""
+import os
+
+TERRAMONITOR_STAC_URL = os.getenv('TERRAMONITOR_STAC_URL', 'https://maps.terramonitor.com/demouser/stac').rstrip('/')
+COPERNICUS_AUTH_URL = os.getenv(
+    'COPERNICUS_AUTH_URL',
+    'https://identity.dataspace.copernicus.eu/auth/realms/CDSE/protocol/openid-connect/token')
+COPERNICUS_STAC_SEARCH_URL = os.getenv('COPERNICUS_STAC_SEARCH_URL', 'https://catalogue.dataspace.copernicus.eu/stac/search')
+GOOGLE_NEWS_RSS_URL = os.getenv('GOOGLE_NEWS_RSS_URL', 'https://news.google.com/rss/search')
+
+COLLECTIONS_URL = TERRAMONITOR_STAC_URL + '/collections'
+DEMO_COLLECTIONS = ('demo_olenja', 'demo_belaya', 'demo_dyagilevo', 'demo_ivanovo')
+
+
+def items_url(collection):
+    """STAC items endpoint of a Terramonitor collection"""
+    return f'{COLLECTIONS_URL}/{collection}/items'
@@ -0,0 +1,214 @@
+import math
+import struct
+
+from clustering import lat_y, lng_x, x_lng, y_lat
+from simplify import douglas_peucker
+
+# Tile coordinate space, and how far (in tile units) geometry is kept past
+# the tile edge so that strokes do not show seams between neighbours
+EXTENT = 4096
+BUFFER = 64
+# Simplification tolerance in tile units, so detail follows the zoom level
+SIMPLIFY_TOLERANCE = 3
+MAX_TILE_ZOOM = 24
+
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+FEATURE_PROPERTIES = ('id', 'datetime', 'constellation', 'cloud_cover', 'resolution')
+
+
+# Protocol buffer encoding, just enough for the vector tile schema
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(value) for value in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _encode_value(value):
+    if isinstance(value, str):
+        return _bytes_field(1, value.encode())
+    return _key(3, 1) + struct.pack('<d', value)
+
+
+# Geometry
+
+def tile_bounds(z, x, y):
+    """[min_lng, min_lat, max_lng, max_lat] of a tile"""
+    n = 2 ** z
+    return [x_lng(x / n), y_lat((y + 1) / n), x_lng((x + 1) / n), y_lat(y / n)]
+
+
+def _clip_edge(points, inside, intersect):
+    clipped = []
+    for i, current in enumerate(points):
+        previous = points[i - 1]
+        if inside(current):
+            if not inside(previous):
+                clipped.append(intersect(previous, current))
+            clipped.append(current)
+        elif inside(previous):
+            clipped.append(intersect(previous, current))
+    return clipped
+
+
+def clip_ring(points, low, high):
+    """Sutherland-Hodgman clip of an open ring to the square [low, high]"""
+    def at_x(a, b, x):
+        return (x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0]))
+
+    def at_y(a, b, y):
+        return (a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y)
+
+    for inside, intersect in (
+        (lambda p: p[0] >= low, lambda a, b: at_x(a, b, low)),
+        (lambda p: p[0] <= high, lambda a, b: at_x(a, b, high)),
+        (lambda p: p[1] >= low, lambda a, b: at_y(a, b, low)),
+        (lambda p: p[1] <= high, lambda a, b: at_y(a, b, high)),
+    ):
+        if not points:
+            break
+        points = _clip_edge(points, inside, intersect)
+    return points
+
+
+def ring_area(points):
+    """Signed area by the surveyor's formula; positive is clockwise with y pointing down"""
+    area = 0
+    for i, (x1, y1) in enumerate(points):
+        x0, y0 = points[i - 1]
+        area += x0 * y1 - x1 * y0
+    return area / 2
+
+
+def _tile_ring(lngs, lats, scale, left, top, tolerance):
+    points = [(lng_x(lng) * scale - left, lat_y(lat) * scale - top) for lng, lat in zip(lngs, lats)]
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    points = clip_ring(points, -BUFFER, EXTENT + BUFFER)
+    if len(points) < 3:
+        return None
+    points = douglas_peucker(points + [points[0]], tolerance)[:-1]
+
+    ring = []
+    for px, py in points:
+        point = (int(round(px)), int(round(py)))
+        if not ring or ring[-1] != point:
+            ring.append(point)
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring.pop()
+    if len(ring) < 3 or not ring_area(ring):
+        return None
+    return ring
+
+
+def footprint_rings(store, index, z, x, y, tolerance=SIMPLIFY_TOLERANCE):
+    """Outer ring and holes of a footprint in tile coordinates, clipped and simplified"""
+    scale = EXTENT * 2 ** z
+    left, top = x * EXTENT, y * EXTENT
+    first_ring, end_ring = store.geometry_offsets[index], store.geometry_offsets[index + 1]
+    rings = []
+    for ring_number in range(first_ring, end_ring):
+        ring = _tile_ring(*store.ring_points(ring_number), scale, left, top, tolerance)
+        if ring is None:
+            if ring_number == first_ring:
+                return []
+            continue
+        # Exterior rings wind clockwise, holes counter-clockwise
+        clockwise = ring_area(ring) > 0
+        if clockwise != (ring_number == first_ring):
+            ring.reverse()
+        rings.append(ring)
+    return rings
+
+
+def encode_geometry(rings):
+    commands = []
+    cursor_x = cursor_y = 0
+    for ring in rings:
+        for position, (px, py) in enumerate(ring):
+            if position == 0:
+                commands.append(MOVE_TO | (1 << 3))
+            elif position == 1:
+                commands.append(LINE_TO | ((len(ring) - 1) << 3))
+            commands.append(_zigzag(px - cursor_x))
+            commands.append(_zigzag(py - cursor_y))
+            cursor_x, cursor_y = px, py
+        commands.append(CLOSE_PATH | (1 << 3))
+    return commands
+
+
+# Tiles
+
+def feature_properties(store, index):
+    properties = {
+        'id': store.ids[index],
+        'datetime': store.datetimes[index],
+        'constellation': store.constellations.labels[store.constellation_codes[index]],
+        'cloud_cover': store.cloud_cover[index],
+        'resolution': store.resolution[index],
+    }
+    return {key: value for key, value in properties.items()
+            if value is not None and not (isinstance(value, float) and math.isnan(value))}
+
+
+def encode_tile(store, z, x, y, layer_name=None, tolerance=SIMPLIFY_TOLERANCE):
+    """Mapbox Vector Tile (spec v2) with one polygon layer of the footprints in tile z/x/y"""
+    min_lng, min_lat, max_lng, max_lat = tile_bounds(z, x, y)
+    # Widen the lookup by the buffer so clipped edges still get their features
+    pad_lng = (max_lng - min_lng) * BUFFER / EXTENT
+    pad_lat = (max_lat - min_lat) * BUFFER / EXTENT
+    candidates = store.index.query_bbox(min_lng - pad_lng, min_lat - pad_lat, max_lng + pad_lng, max_lat + pad_lat)
+
+    values = {}
+    features = []
+    for index in candidates:
+        rings = footprint_rings(store, index, z, x, y, tolerance)
+        if not rings:
+            continue
+        tags = []
+        for key, value in feature_properties(store, index).items():
+            tags.append(FEATURE_PROPERTIES.index(key))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        features.append(
+            _varint_field(1, index + 1) +
+            _packed_field(2, tags) +
+            _varint_field(3, POLYGON) +
+            _packed_field(4, encode_geometry(rings))
+        )
+
+    if not features:
+        return b''
+    layer = (
+        _varint_field(15, 2) +
+        _bytes_field(1, (layer_name or store.name).encode()) +
+        b''.join(_bytes_field(2, feature) for feature in features) +
+        b''.join(_bytes_field(3, key.encode()) for key in FEATURE_PROPERTIES) +
+        b''.join(_bytes_field(4, _encode_value(value)) for _, value in values) +
+        _varint_field(5, EXTENT)
+    )
+    return _bytes_field(3, layer)
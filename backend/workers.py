@@ -0,0 +1,103 @@
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# Worker processes serving the app; 1 keeps the single-process server
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))
+# Set by the supervisor in the environment of every worker it starts
+LISTEN_FD_ENV = 'GLOBE_LISTEN_FD'
+WORKER_ID_ENV = 'GLOBE_WORKER_ID'
+# Seconds between checks for exited workers, which also throttles restarts
+RESTART_DELAY = 1
+STOP_TIMEOUT = 10
+
+
+def worker_id():
+    """Number of this worker process, or None outside a multi-process deployment"""
+    value = os.getenv(WORKER_ID_ENV)
+    return int(value) if value is not None else None
+
+
+def is_worker():
+    return worker_id() is not None
+
+
+def inherited_socket():
+    """The listening socket the supervisor passed down to this worker"""
+    return socket.socket(fileno=int(os.environ[LISTEN_FD_ENV]))
+
+
+class Supervisor:
+    """Runs count copies of this program on one shared listening socket.
+
+    The supervisor binds the socket and every worker accepts connections
+    from it, so the kernel spreads them over the workers. Workers are fresh
+    interpreters started with the socket inherited rather than forks, so
+    nothing the supervisor itself runs (green threads, the event hub, open
+    connections) leaks into them. Workers that exit are restarted.
+    """
+
+    def __init__(self, host, port, count, argv=None):
+        self.host = host
+        self.port = port
+        self.count = count
+        self.argv = argv or sys.argv
+        self.sock = None
+        self.processes = {}
+        self.restarts = 0
+
+    def start(self):
+        self.sock = socket.create_server((self.host, self.port), backlog=2048)
+        os.set_inheritable(self.sock.fileno(), True)
+        for number in range(self.count):
+            self._spawn(number)
+        logger.info(f"Started {self.count} workers on {self.host}:{self.port}")
+
+    def _spawn(self, number):
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(self.sock.fileno())
+        env[WORKER_ID_ENV] = str(number)
+        self.processes[number] = subprocess.Popen(
+            [sys.executable] + self.argv, env=env, pass_fds=(self.sock.fileno(),)
+        )
+
+    def check(self):
+        """Restart any worker that has exited"""
+        for number, process in list(self.processes.items()):
+            if process.poll() is not None:
+                logger.warning(f"Worker {number} (pid {process.pid}) exited with {process.returncode}, restarting")
+                self.restarts += 1
+                self._spawn(number)
+
+    def stop(self):
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process in self.processes.values():
+            try:
+                process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.sock is not None:
+            self.sock.close()
+
+    def run(self):
+        """Start the workers and keep them running until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.start()
+        try:
+            while True:
+                time.sleep(RESTART_DELAY)
+                self.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info("Stopping workers")
+            self.stop()
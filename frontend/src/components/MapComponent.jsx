@@ -512,7 +512,8 @@ const MapComponent = () => {
 
   useEffect(() => {
     // Initialize socket connection
-            const newSocket = io(SOCKET_URL);
+            // WebSocket first: a multi-worker backend does not accept long-polling
+            const newSocket = io(SOCKET_URL, { transports: ['websocket', 'polling'], tryAllTransports: true });
     
     newSocket.on('connect', () => {
       console.log('Connected to WebSocket');